@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# checkpoint.py
+"""
+Checkpoints for long optimization runs.
+
+The run state is a JSON file in the output directory:
+
+    stage         index of the resolution stage in progress
+    x, fun        best parameters so far and their error at the current
+                  stage's resolution
+    nfev          objective evaluations so far (all stages)
+    method_state  differential_evolution population and energies, or an
+                  approximate Nelder-Mead simplex (see SimplexTracker),
+                  plus iterations done in the stage
+    rng           numpy bit generator state
+
+It is rewritten every `interval` seconds, at the end of each stage and
+on interrupt.  Writes go through a temporary file and os.replace, so an
+interrupt mid-write leaves the previous checkpoint intact.  A resumed
+run skips finished stages and restarts the current one from the saved
+population, or for Nelder-Mead from a simplex of the best points seen.
+"""
+
+import json
+import os
+import time
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+CHECKPOINT_NAME = "checkpoint.json"
+
+
+def _plain(value):
+    """numpy values -> JSON-serializable Python values."""
+    if isinstance(value, dict):
+        return {key: _plain(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_plain(item) for item in value]
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+class Checkpoint:
+    """Optimizer progress, saved periodically to `path`."""
+
+    def __init__(self, path: Path, context: str, interval: float = 60.0):
+        """
+        context: hash of everything the saved state depends on (template,
+            specimen, objective, method, schedule); a checkpoint written
+            under another context is not resumed.
+        interval: minimum seconds between periodic saves.
+        """
+        self.path = path
+        self.interval = interval
+        self.state = {'context': context, 'stage': 0, 'x': None, 'fun': None,
+                      'nfev': 0, 'method_state': None, 'rng': None}
+        self.last_save = time.monotonic()
+
+    @classmethod
+    def resume(cls, path: Path, context: str, interval: float = 60.0) -> 'Checkpoint':
+        """Checkpoint continuing from `path` if it matches `context`."""
+        checkpoint = cls(path, context, interval)
+        if not path.exists():
+            print(f"No checkpoint at {path}, starting from scratch")
+            return checkpoint
+
+        try:
+            state = json.loads(path.read_text())
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Could not read checkpoint {path} ({e}), starting from scratch")
+            return checkpoint
+
+        if state.get('context') != context:
+            print(f"Checkpoint {path} is for a different template, specimen or "
+                  f"settings, starting from scratch")
+            return checkpoint
+
+        checkpoint.state.update(state)
+        print(f"Resuming from {path}: {state['stage']} stage(s) finished, "
+              f"{state['nfev']} evaluations, best error {state['fun']}")
+        return checkpoint
+
+    def __getitem__(self, key):
+        return self.state[key]
+
+    def array(self, key: str) -> Optional[np.ndarray]:
+        value = self.state.get(key)
+        return None if value is None else np.array(value, dtype=float)
+
+    def stage_state(self, key: str) -> Optional[np.ndarray]:
+        """Array saved in method_state for the current stage, if any."""
+        method_state = self.state['method_state'] or {}
+        value = method_state.get(key)
+        return None if value is None else np.array(value, dtype=float)
+
+    def iterations_done(self) -> int:
+        return (self.state['method_state'] or {}).get('nit', 0)
+
+    def update(self, **fields):
+        """Merge fields into the state; save if the interval has passed."""
+        self.state.update(fields)
+        if time.monotonic() - self.last_save >= self.interval:
+            self.save()
+
+    def improve(self, x: np.ndarray, fun: float):
+        """Record x if it beats the best so far."""
+        if self.state['fun'] is None or fun < self.state['fun']:
+            self.state['x'] = x
+            self.state['fun'] = fun
+
+    def finish_stage(self, x: np.ndarray, fun: float):
+        """Start the next stage from x."""
+        self.state.update(stage=self.state['stage'] + 1, x=x, fun=fun, method_state=None)
+        self.save()
+
+    def save(self):
+        self.path.parent.mkdir(exist_ok=True, parents=True)
+        partial = self.path.with_name(self.path.name + '.tmp')
+        partial.write_text(json.dumps(_plain(self.state)))
+        os.replace(partial, self.path)
+        self.last_save = time.monotonic()
+
+
+class SimplexTracker:
+    """
+    Best distinct points evaluated by Nelder-Mead.
+
+    scipy's callback reports only the best vertex, so the simplex saved
+    for resume is approximated by the n+1 best evaluations.  It is not
+    the simplex the run stopped at: that one keeps its worst vertex
+    after a reflection or expansion, while rejected trial points that
+    scored better rank above it here.  A resumed stage restarts from a
+    simplex around the same best point, not from the same state.
+    """
+
+    def __init__(self, dimensions: int):
+        self.size = dimensions + 1
+        self.points: List[Tuple[float, np.ndarray]] = []
+
+    def add(self, x: np.ndarray, fun: float):
+        if any(np.array_equal(x, point) for _, point in self.points):
+            return
+        self.points.append((fun, np.array(x, dtype=float)))
+        self.points.sort(key=lambda item: item[0])
+        del self.points[4 * self.size:]
+
+    def simplex(self) -> Optional[np.ndarray]:
+        """(n+1, n) vertices, or None if too few or degenerate."""
+        if len(self.points) < self.size:
+            return None
+        vertices = np.array([point for _, point in self.points[:self.size]])
+        if np.linalg.matrix_rank(vertices[1:] - vertices[0]) < self.size - 1:
+            return None
+        return vertices
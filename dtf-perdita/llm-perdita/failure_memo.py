@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# failure_memo.py
+"""
+Bookkeeping that keeps failing parameter regions cheap.
+
+FailureMemo remembers parameter vectors whose render failed or timed out
+and answers "is this candidate next to a known failure?" without running
+mpost.  AdaptiveTimeout derives the mpost time limit from how long
+successful renders actually take, instead of a fixed 5-10 s.
+"""
+
+from collections import deque
+from typing import Dict, Optional
+
+import numpy as np
+
+
+class FailureMemo:
+    """Failed/timed-out parameter vectors with a near-duplicate test."""
+
+    def __init__(self, scales: Dict[str, float], radius: float = 0.005,
+                 capacity: int = 2000):
+        """
+        scales: parameter name -> range width (e.g. max - min bound).
+            Only these parameters are compared; others are ignored.
+        radius: neighbourhood as a fraction of each range (L-infinity).
+        """
+        self.names = sorted(scales)
+        self.scale = np.array([abs(scales[name]) or 1.0 for name in self.names])
+        self.radius = radius
+        self.capacity = capacity
+
+        self.points = np.empty((0, len(self.names)))
+        self.kinds = []
+        self.hits = 0
+
+    def _vector(self, params: Dict[str, float]) -> np.ndarray:
+        return np.array([params[name] for name in self.names], dtype=float) / self.scale
+
+    def add(self, params: Dict[str, float], kind: str):
+        """Record a failure ('failed', 'timeout', ...)."""
+        if not self.names:
+            return
+        self.points = np.vstack([self.points, self._vector(params)])[-self.capacity:]
+        self.kinds = (self.kinds + [kind])[-self.capacity:]
+
+    def lookup(self, params: Dict[str, float]) -> Optional[str]:
+        """Kind of the nearest recorded failure within radius, else None."""
+        if not self.kinds:
+            return None
+
+        distance = np.max(np.abs(self.points - self._vector(params)), axis=1)
+        nearest = int(np.argmin(distance))
+        if distance[nearest] > self.radius:
+            return None
+
+        self.hits += 1
+        return self.kinds[nearest]
+
+    def report(self):
+        if self.kinds:
+            print(f"Failure memo: {len(self.kinds)} failures recorded, "
+                  f"{self.hits} renders skipped")
+
+
+class AdaptiveTimeout:
+    """mpost time limit from the distribution of successful render times."""
+
+    def __init__(self, default: float, minimum: float = 1.0, factor: float = 5.0,
+                 min_samples: int = 5, window: int = 200):
+        """
+        default: per-figure limit until min_samples renders succeeded, and
+            the ceiling afterwards.
+        The adapted limit is factor x the 95th percentile per-figure time,
+        never below `minimum` seconds.
+        """
+        self.default = default
+        self.minimum = minimum
+        self.factor = factor
+        self.min_samples = min_samples
+        self.samples = deque(maxlen=window)
+
+    def observe(self, elapsed: float, figures: int = 1):
+        """Record a successful job of `figures` figures."""
+        self.samples.append(elapsed / max(figures, 1))
+
+    def limit(self, figures: int = 1) -> float:
+        """Time limit in seconds for a job of `figures` figures."""
+        ceiling = self.default * figures
+        if len(self.samples) < self.min_samples:
+            return ceiling
+        p95 = float(np.percentile(self.samples, 95))
+        return float(np.clip(self.factor * p95 * figures, self.minimum, ceiling))
@@ -1,16 +1,31 @@
 #!/usr/bin/env python3
 # fit_metapost_parameters.py
 
+import argparse
 import cv2
 import numpy as np
 from pathlib import Path
 import subprocess
 import tempfile
+import time
 import shutil
+import hashlib
 from scipy.optimize import minimize, differential_evolution
 import xml.etree.ElementTree as ET
 from dataclasses import dataclass
-from typing import Dict, Tuple, Optional
+from typing import Dict, List, Tuple, Optional
+from metapost_render import CompiledTemplate, build_batch_source, figure_svg, run_mpost
+from render_cache import RenderCache
+from failure_memo import AdaptiveTimeout, FailureMemo
+from flight_recorder import FlightRecorder, NORMAL, VERBOSE
+from telemetry import Telemetry
+from chamfer import ChamferTarget
+from target_cache import TargetCache
+from surrogate import EvaluationHistory, history_context, surrogate_minimize
+from multires import DEFAULT_SCHEDULE, PYRAMID_SCALES, parse_schedule
+from parallel_eval import ParallelObjective, available_cores, evaluate_one
+from render_frame import FRAME_NAME, RenderFrame
+import svg_raster
 
 @dataclass
 class ParameterBounds:
@@ -27,17 +42,74 @@ class MetapostOptimizer:
                  template_path: Path,
                  base_path: Path,
                  specimen_path: Path,
-                 output_dir: Path):
+                 output_dir: Path,
+                 cache_dir: Optional[Path] = None,
+                 cache_size_mb: float = 256,
+                 flight_size: int = 32,
+                 verbosity: int = NORMAL,
+                 objective: str = 'blend',
+                 history_path: Optional[Path] = None,
+                 surrogate_batch: int = 8,
+                 telemetry_path: Optional[Path] = None,
+                 target_cache_dir: Optional[Path] = None):
         self.template_path = template_path
         self.base_path = base_path
         self.specimen_path = specimen_path
         self.output_dir = output_dir
         self.output_dir.mkdir(exist_ok=True, parents=True)
         
-        # Load and process specimen
+        # Debug artifacts and mpost scratch; pool workers get their own
+        self.debug_dir = output_dir
+        self.scratch_dir = None
+        
+        # Recent evaluations, written out only on failure or interrupt
+        self.recorder = FlightRecorder(capacity=flight_size, verbosity=verbosity)
+        
+        # Per-evaluation stage timings (JSONL), off unless a path is given
+        self.telemetry = Telemetry(telemetry_path)
+        
+        # Render cache shared by optimize, save_comparison etc.
+        # The base file is part of the key since every render inputs it.
+        base_hash = hashlib.sha256(base_path.read_bytes()).hexdigest()
+        # The render frame (see render_frame) is fixed by fit_frame from
+        # the initial guess and follows the current resolution stage.
+        self.base_frame = None
+        self.frame = None
+        self.raster_settings = {'rasterizer': 'svg_raster', 'frame': None, 'base': base_hash}
+        self.cache = RenderCache(cache_dir or output_dir / "render_cache",
+                                 max_bytes=int(cache_size_mb * 1024 * 1024))
+        
+        # Template with its parameter slots located once
+        self.template = CompiledTemplate(template_path.read_text())
+        
+        # Load and process specimen; mask, pyramid, distance maps and
+        # features are memory-mapped from the target cache after the
+        # first run against this specimen
         print(f"Loading specimen: {specimen_path}")
-        self.target_image = self.load_specimen(specimen_path)
-        self.target_features = self.extract_features(self.target_image)
+        self.targets = TargetCache(target_cache_dir or output_dir / "target_cache").bundle(
+            specimen_path, self.load_specimen)
+        self.target_image = self.targets.mask(1.0)
+        self.target_features = self.targets.features(
+            1.0, lambda: self.extract_features(self.target_image))
+        self.target_pyramid = self.targets.pyramid(PYRAMID_SCALES)
+        
+        # 'blend' (IoU + features), 'iou' or 'chamfer'; chamfer targets
+        # are built once per pyramid level
+        self.objective = objective
+        self.chamfer_targets = {}
+        if objective == 'chamfer':
+            self.chamfer_target(self.target_image)
+        
+        # Every evaluation, for warm-starting the surrogate in later runs
+        self.history = EvaluationHistory(history_path or output_dir / "evaluations.jsonl")
+        self.history_base = history_context(self.template.source, base_hash,
+                                            specimen_path.read_bytes(), objective)
+        self.surrogate_batch = surrogate_batch
+        
+        # Known-bad parameter regions (ranges are set by optimize) and
+        # mpost time limits that follow observed render times
+        self.failures = FailureMemo({})
+        self.timeout = AdaptiveTimeout(default=5.0)
         
         print(f"Target features:")
         for key, val in self.target_features.items():
@@ -120,16 +192,47 @@ class MetapostOptimizer:
             'y_max': float(y_max),
         }
     
+    def known_failure(self, parameters: Dict[str, float]) -> bool:
+        """True if parameters are next to a recorded mpost failure."""
+        kind = self.failures.lookup(parameters)
+        if kind is None:
+            return False
+        self.recorder.log(VERBOSE, f"Skipping render near earlier {kind}")
+        self.telemetry.failure('memo')
+        return True
+    
+    def remember_failure(self, parameters: Optional[Dict[str, float]], kind: str):
+        self.telemetry.failure(kind)
+        if parameters is not None:
+            self.failures.add(parameters, kind)
+    
     def render_metapost(self, parameters: Dict[str, float]) -> Optional[np.ndarray]:
-        """Render METAPOST with given parameters to binary image."""
-        with tempfile.TemporaryDirectory() as tmpdir:
-            tmpdir = Path(tmpdir)
-            
-            # Read template
-            template_content = self.template_path.read_text()
+        """Render METAPOST with given parameters to binary image (cached)."""
+        if self.known_failure(parameters):
+            return None
+        
+        # Substitute parameters
+        with self.telemetry.stage('substitute'):
+            mp_code = self.substitute_parameters(self.template.source, parameters)
             
-            # Substitute parameters
-            mp_code = self.substitute_parameters(template_content, parameters)
+            # Include base file with simple relative path
+            full_code = 'input perdita_base.mp;\n\n' + mp_code
+        
+        with self.telemetry.stage('cache'):
+            key = self.cache.key(full_code, self.raster_settings)
+            binary = self.cache.get(key)
+        if binary is not None:
+            return binary
+        
+        binary = self.run_metapost(full_code, parameters)
+        self.cache.put(key, binary)
+        return binary
+    
+    def run_metapost(self, full_code: str,
+                     parameters: Optional[Dict[str, float]] = None) -> Optional[np.ndarray]:
+        """Run mpost on a complete source and rasterize the result."""
+        with tempfile.TemporaryDirectory(dir=self.scratch_dir) as tmpdir:
+            tmpdir = Path(tmpdir)
             
             # Write complete METAPOST file
             mp_file = tmpdir / "test.mp"
@@ -138,165 +241,267 @@ class MetapostOptimizer:
             base_copy = tmpdir / "perdita_base.mp"
             shutil.copy(self.base_path, base_copy)
             
-            # Include base file with simple relative path
-            full_code = 'input perdita_base.mp;\n\n' + mp_code
             mp_file.write_text(full_code)
             
-            # DEBUG: Print generated code
-            print("\n" + "=" * 60)
-            print("GENERATED METAPOST CODE:")
-            print("=" * 60)
-            print(full_code)
-            print("=" * 60)
-            
-            # Run mpost with shorter timeout to fail fast
+            # Time limit adapts to observed render times to fail fast
+            started = time.perf_counter()
             try:
-                result = subprocess.run(
-                    ['mpost', str(mp_file)],
-                    cwd=tmpdir,
-                    capture_output=True,
-                    timeout=5  # Reduced from 10
-                )
-                
-                # DEBUG: Show output
-                if result.stdout:
-                    print("MPOST stdout:", result.stdout.decode())
-                if result.stderr:
-                    print("MPOST stderr:", result.stderr.decode())
+                with self.telemetry.stage('mpost'):
+                    result = run_mpost(['mpost', str(mp_file)], tmpdir, self.timeout.limit())
                 
                 if result.returncode != 0:
-                    print(f"METAPOST error (return code {result.returncode})")
+                    self.recorder.record(full_code, 'failed', time.perf_counter() - started,
+                                         parameters, result.stdout + result.stderr)
+                    self.remember_failure(parameters, 'failed')
+                    self.recorder.log(NORMAL, f"METAPOST error (return code {result.returncode})")
                     # Save failed code for inspection
-                    failed_file = self.output_dir / "failed_code.mp"
+                    self.debug_dir.mkdir(exist_ok=True, parents=True)
+                    failed_file = self.debug_dir / "failed_code.mp"
                     failed_file.write_text(full_code)
-                    print(f"Saved failed code to: {failed_file}")
+                    self.recorder.log(NORMAL, f"Saved failed code to: {failed_file}")
+                    self.recorder.dump(self.debug_dir, 'failed')
                     return None
                 
                 # Find generated SVG
                 svg_files = list(tmpdir.glob('*.svg'))
                 if not svg_files:
-                    print("No SVG generated")
+                    self.recorder.record(full_code, 'no_svg', time.perf_counter() - started,
+                                         parameters, result.stdout)
+                    self.remember_failure(parameters, 'no_svg')
+                    self.recorder.log(NORMAL, "No SVG generated")
                     # List all files that were created
                     all_files = list(tmpdir.glob('*'))
-                    print(f"Files in tmpdir: {[f.name for f in all_files]}")
+                    self.recorder.log(NORMAL, f"Files in tmpdir: {[f.name for f in all_files]}")
+                    self.recorder.dump(self.debug_dir, 'no_svg')
                     return None
                 
                 svg_file = svg_files[0]
                 
                 # Rasterize SVG to image
+                self.timeout.observe(time.perf_counter() - started)
                 binary = self.rasterize_svg(svg_file)
+                self.recorder.record(full_code, 'ok', time.perf_counter() - started,
+                                     parameters, result.stdout)
                 
                 return binary
                 
-            except subprocess.TimeoutExpired:
-                print("METAPOST timeout - code has infinite loop or error")
+            except subprocess.TimeoutExpired as e:
+                self.recorder.record(full_code, 'timeout', time.perf_counter() - started,
+                                     parameters, e.stdout)
+                self.remember_failure(parameters, 'timeout')
+                self.recorder.log(NORMAL, "METAPOST timeout - code has infinite loop or error")
                 # Save the code that timed out
-                timeout_file = self.output_dir / "timeout_code.mp"
+                self.debug_dir.mkdir(exist_ok=True, parents=True)
+                timeout_file = self.debug_dir / "timeout_code.mp"
                 timeout_file.write_text(full_code)
-                print(f"Saved timeout code to: {timeout_file}")
+                self.recorder.log(NORMAL, f"Saved timeout code to: {timeout_file}")
+                self.recorder.dump(self.debug_dir, 'timeout')
                 return None
             except Exception as e:
-                print(f"Rendering error: {e}")
                 import traceback
-                traceback.print_exc()
+                self.recorder.record(full_code, 'error', time.perf_counter() - started,
+                                     parameters, traceback.format_exc())
+                self.telemetry.failure('error')
+                self.recorder.log(NORMAL, f"Rendering error: {e}")
+                self.recorder.dump(self.debug_dir, 'error')
                 return None
     
+    def render_metapost_batch(self, param_list: List[Dict[str, float]]) -> List[Optional[np.ndarray]]:
+        """
+        Render several parameter sets as numbered figures of one METAPOST job.
+        Cached candidates and candidates next to a known failure are
+        skipped; falls back to one job per candidate if the batch fails.
+        """
+        with self.telemetry.stage('substitute'):
+            sources = [
+                'input perdita_base.mp;\n\n' + self.substitute_parameters(self.template.source, parameters)
+                for parameters in param_list
+            ]
+        
+        with self.telemetry.stage('cache'):
+            keys = [self.cache.key(source, self.raster_settings) for source in sources]
+            rendered = [self.cache.get(key) for key in keys]
+        missing = [i for i, r in enumerate(rendered)
+                   if r is None and not self.known_failure(param_list[i])]
+        if not missing:
+            return rendered
+        
+        with tempfile.TemporaryDirectory(dir=self.scratch_dir) as tmpdir:
+            tmpdir = Path(tmpdir)
+            
+            shutil.copy(self.base_path, tmpdir / "perdita_base.mp")
+            mp_file = tmpdir / "batch.mp"
+            batch_source = build_batch_source([sources[i] for i in missing])
+            mp_file.write_text(batch_source)
+            batch_params = [param_list[i] for i in missing]
+            
+            started = time.perf_counter()
+            try:
+                with self.telemetry.stage('mpost'):
+                    result = run_mpost(['mpost', '-interaction=nonstopmode', str(mp_file)],
+                                       tmpdir, self.timeout.limit(len(missing)))
+            except subprocess.TimeoutExpired as e:
+                self.recorder.record(batch_source, 'timeout', time.perf_counter() - started,
+                                     batch_params, e.stdout)
+                self.recorder.log(NORMAL, f"METAPOST batch timeout ({len(missing)} figures)")
+                self.telemetry.failure('batch_timeout')
+                result = None
+            except OSError as e:
+                self.recorder.record(batch_source, 'error', time.perf_counter() - started,
+                                     batch_params, str(e))
+                self.telemetry.failure('batch_error')
+                result = None
+            
+            if result is not None and result.returncode == 0:
+                self.timeout.observe(time.perf_counter() - started, len(missing))
+                for index, i in enumerate(missing, start=1):
+                    svg_file = figure_svg(tmpdir, mp_file.stem, index)
+                    rendered[i] = self.rasterize_svg(svg_file) if svg_file else None
+                    self.cache.put(keys[i], rendered[i])
+                self.recorder.record(batch_source, 'ok', time.perf_counter() - started,
+                                     batch_params, result.stdout)
+                return rendered
+            
+            if result is not None:
+                self.recorder.record(batch_source, 'failed', time.perf_counter() - started,
+                                     batch_params, result.stdout + result.stderr)
+                self.telemetry.failure('batch_failed')
+        
+        self.recorder.log(NORMAL, "METAPOST batch failed, rendering candidates individually")
+        for i in missing:
+            rendered[i] = self.run_metapost(sources[i], param_list[i])
+            self.cache.put(keys[i], rendered[i])
+        return rendered
+    
     def substitute_parameters(self, template: str, parameters: Dict[str, float]) -> str:
         """
         Substitute parameter values into template.
-        Handles both = and := assignments.
+        Handles both = and := assignments, including negative values;
+        raises ValueError for parameters the template does not assign.
         """
-        import re
-        
-        result = template
-        
-        for param_name, value in parameters.items():
-            # Pattern 1: Simple assignment with = (like x_scale = 36;)
-            pattern1 = rf'(\s*{param_name}\s*=\s*)[\d.]+(\s*;)'
-            replacement1 = rf'\g<1>{value:.6f}\g<2>'
-            result = re.sub(pattern1, replacement1, result, flags=re.MULTILINE)
-            
-            # Pattern 2: METAPOST assignment with := (like pen_start := 12;)
-            pattern2 = rf'(\s*{param_name}\s*:=\s*)[\d.]+(\s*;)'
-            replacement2 = rf'\g<1>{value:.6f}\g<2>'
-            result = re.sub(pattern2, replacement2, result, flags=re.MULTILINE)
-        
-        return result
+        compiled = self.template if template == self.template.source else CompiledTemplate(template)
+        return compiled.render(parameters)
+    
+    def set_resolution(self, scale: float):
+        """Render and compare at `scale` times full resolution."""
+        if scale not in self.target_pyramid:
+            self.target_pyramid[scale] = self.targets.mask(scale)
+        
+        # Features are in pixels, so they follow the target level
+        self.target_image = self.target_pyramid[scale]
+        self.target_features = self.targets.features(
+            scale, lambda: self.extract_features(self.target_image))
+        if self.base_frame is not None:
+            height, width = self.target_image.shape
+            self.frame = self.base_frame.scaled(width, height)
+            self.raster_settings['frame'] = self.frame.settings()
     
-    def rasterize_svg(self, svg_path: Path, size=500) -> np.ndarray:
+    def fit_frame(self, parameters: Dict[str, float]) -> bool:
         """
-        Convert SVG to binary raster image.
+        Fix the render frame from the picture at `parameters` (the
+        initial guess): its bounding box is placed over the specimen's
+        ink bounding box, keeping its aspect ratio.  Scale parameters
+        then change the size of the rendered glyph instead of being
+        stretched away.  False if the picture does not render.
         """
-        # Use ImageMagick or cairosvg for rasterization
-        # For now, simple approach with subprocess
-        
-        png_path = svg_path.with_suffix('.png')
-        
-        try:
-            # Try ImageMagick convert
-            subprocess.run([
-                'convert',
-                '-density', '300',
-                '-background', 'white',
-                '-flatten',
-                str(svg_path),
-                str(png_path)
-            ], check=True, capture_output=True)
-            
-            # Load PNG
-            img = cv2.imread(str(png_path), cv2.IMREAD_GRAYSCALE)
-            
-            # Resize to consistent size
-            img = cv2.resize(img, (size, size))
-            
-            # Threshold
-            _, binary = cv2.threshold(img, 128, 255, cv2.THRESH_BINARY_INV)
-            
-            return binary
-            
-        except (subprocess.CalledProcessError, FileNotFoundError):
-            # Fallback: try inkscape
+        full_code = 'input perdita_base.mp;\n\n' + self.substitute_parameters(self.template.source, parameters)
+        bbox = None
+        with tempfile.TemporaryDirectory(dir=self.scratch_dir) as tmpdir:
+            tmpdir = Path(tmpdir)
+            shutil.copy(self.base_path, tmpdir / "perdita_base.mp")
+            mp_file = tmpdir / "frame.mp"
+            mp_file.write_text(full_code)
             try:
-                subprocess.run([
-                    'inkscape',
-                    str(svg_path),
-                    '--export-type=png',
-                    f'--export-filename={png_path}',
-                    '--export-width=500',
-                    '--export-height=500'
-                ], check=True, capture_output=True)
-                
-                img = cv2.imread(str(png_path), cv2.IMREAD_GRAYSCALE)
-                _, binary = cv2.threshold(img, 128, 255, cv2.THRESH_BINARY_INV)
-                return binary
-                
-            except:
-                print("Could not rasterize SVG (need ImageMagick or Inkscape)")
-                return None
+                result = run_mpost(['mpost', '-interaction=nonstopmode', str(mp_file)],
+                                   tmpdir, self.timeout.default)
+                svg_files = sorted(tmpdir.glob('*.svg'))
+                if result.returncode == 0 and svg_files:
+                    bbox = svg_raster.original_bbox(svg_files[0].read_text())
+            except (subprocess.TimeoutExpired, OSError, ValueError) as e:
+                print(f"Could not render the initial parameters: {e}")
+                return False
+        
+        if bbox is None:
+            print("Could not render the initial parameters")
+            return False
+        
+        target = np.ascontiguousarray(self.targets.mask(1.0))
+        x, y, w, h = cv2.boundingRect(target)
+        height, width = target.shape
+        try:
+            self.base_frame = RenderFrame.fit(bbox, (x, y, x + w, y + h), width, height)
+        except ValueError as e:
+            print(f"Could not fix the render frame: {e}")
+            return False
+        
+        print(f"Render frame: {self.base_frame.pixels_per_unit:.4g} px/unit, "
+              f"origin at ({self.base_frame.origin_x:.1f}, {self.base_frame.origin_y:.1f}) px")
+        return True
+    
+    def rasterize_svg(self, svg_path: Path) -> np.ndarray:
+        """
+        Convert SVG to binary raster image in the current frame.
+        Rasterized in-process by svg_raster; no ImageMagick/Inkscape needed.
+        Before fit_frame, the picture is stretched over the target.
+        """
+        try:
+            with self.telemetry.stage('rasterize'):
+                if self.frame is None:
+                    height, width = self.target_image.shape
+                    return svg_raster.rasterize_svg(svg_path, width, height)
+                return svg_raster.rasterize_in_frame(svg_path, self.frame)
+        except (ET.ParseError, ValueError, KeyError) as e:
+            self.recorder.log(NORMAL, f"Could not rasterize SVG {svg_path.name}: {e}")
+            return None
+    
+    def target_label(self) -> str:
+        height, width = self.target_image.shape
+        return f"{width}x{height}"
+    
+    def history_key(self) -> str:
+        """Evaluation-history context at the current resolution."""
+        return history_context(self.history_base, self.raster_settings['frame'])
+    
+    def chamfer_target(self, target: np.ndarray) -> ChamferTarget:
+        """Distance transform of a target level, computed on first use."""
+        if target.shape not in self.chamfer_targets:
+            # Pyramid levels have their distance maps in the target cache
+            scale = next((s for s, level in self.target_pyramid.items()
+                          if level.shape == target.shape), None)
+            to_ink = self.targets.distance(scale) if scale is not None else None
+            self.chamfer_targets[target.shape] = ChamferTarget(target, to_ink)
+        return self.chamfer_targets[target.shape]
     
     def compare_images(self, rendered: np.ndarray, target: np.ndarray) -> float:
         """
         Compute similarity score between rendered and target.
         Lower is better (minimization).
-        """
-        # Resize to same dimensions
-        if rendered.shape != target.shape:
-            rendered = cv2.resize(rendered, (target.shape[1], target.shape[0]))
-        
-        # Simple pixel overlap metric
-        intersection = np.sum((rendered > 0) & (target > 0))
-        union = np.sum((rendered > 0) | (target > 0))
-        
-        if union == 0:
-            return 1.0
         
-        # IoU-based distance
-        iou = intersection / union
-        distance = 1.0 - iou
-        
-        # Also compare features
-        rendered_features = self.extract_features(rendered)
-        feature_distance = self.compare_features(rendered_features, self.target_features)
+        self.objective selects the score: 'blend' (IoU and shape
+        features, equally weighted), 'iou', or 'chamfer'.
+        """
+        # Renders are drawn at the target's shape, so no resampling
+        with self.telemetry.stage('compare'):
+            if self.objective == 'chamfer':
+                return self.chamfer_target(target).distance(rendered)
+            
+            # Simple pixel overlap metric
+            intersection = np.sum((rendered > 0) & (target > 0))
+            union = np.sum((rendered > 0) | (target > 0))
+            
+            if union == 0:
+                return 1.0
+            
+            # IoU-based distance
+            iou = intersection / union
+            distance = 1.0 - iou
+            
+            if self.objective == 'iou':
+                return distance
+            
+            # Also compare features
+            rendered_features = self.extract_features(rendered)
+            feature_distance = self.compare_features(rendered_features, self.target_features)
         
         # Weighted combination
         total_distance = 0.5 * distance + 0.5 * feature_distance
@@ -338,6 +543,8 @@ class MetapostOptimizer:
         Objective function for optimization.
         Takes parameter values array, returns error (to minimize).
         """
+        self.telemetry.begin(self.cache)
+        
         # Convert array to parameter dict
         parameters = {}
         for i, bound in enumerate(param_bounds):
@@ -347,53 +554,185 @@ class MetapostOptimizer:
         rendered = self.render_metapost(parameters)
         
         if rendered is None:
-            return 10.0  # Large penalty for rendering failure
-        
-        # Compare to target
-        error = self.compare_images(rendered, self.target_image)
+            error = 10.0  # Large penalty for rendering failure
+        else:
+            # Compare to target
+            error = self.compare_images(rendered, self.target_image)
+        with self.telemetry.stage('history'):
+            self.history.append(self.history_key(), [(parameters, error)])
+        self.telemetry.end([error], render_size=self.target_label())
         
-        print(f"  Params: {param_values} → Error: {error:.4f}")
+        self.recorder.log(VERBOSE, f"  Params: {param_values} → Error: {error:.4f}")
         
         return error
     
-    def optimize(self, param_bounds: list, method='differential_evolution') -> Dict[str, float]:
+    def objective_function_batch(self, param_matrix: np.ndarray, param_bounds: list) -> np.ndarray:
         """
-        Run optimization to find best parameters.
-        
-        Args:
-            param_bounds: List of ParameterBounds objects
-            method: 'differential_evolution' or 'nelder-mead'
+        Vectorized objective for differential_evolution(vectorized=True).
+        param_matrix has shape (n_params, S); returns S errors.
+        """
+        self.telemetry.begin(self.cache)
+        param_list = [
+            {bound.name: column[i] for i, bound in enumerate(param_bounds)}
+            for column in param_matrix.T
+        ]
+        rendered = self.render_metapost_batch(param_list)
+        
+        errors = np.array([
+            10.0 if r is None else self.compare_images(r, self.target_image)
+            for r in rendered
+        ])
+        with self.telemetry.stage('history'):
+            self.history.append(self.history_key(), list(zip(param_list, errors)))
+        self.telemetry.end(errors, render_size=self.target_label())
+        self.recorder.log(NORMAL, f"  Batch of {len(errors)} → best error: {errors.min():.4f}")
+        
+        return errors
+    
+    def run_method(self, param_bounds: list, method: str, batch: bool,
+                   workers: Optional[int], x0: np.ndarray, max_iter: int,
+                   warm_start: bool = False):
+        """
+        Dispatch to the scipy optimizer; returns its OptimizeResult.
+        With warm_start, differential_evolution seeds its population with x0.
+        For 'surrogate', max_iter counts acquisition rounds.
         """
-        print(f"\nOptimizing {len(param_bounds)} parameters...")
-        print("=" * 60)
-        
         if method == 'differential_evolution':
             # Global optimization - good for finding rough optimum
             bounds = [(b.min_val, b.max_val) for b in param_bounds]
+            seed = x0 if warm_start else None
             
-            result = differential_evolution(
-                lambda x: self.objective_function(x, param_bounds),
-                bounds,
-                maxiter=20,  # Increase for better results
-                popsize=5,
-                workers=1,  # Parallel if your system supports
-                disp=True
-            )
-            
-            best_params = result.x
+            workers = workers or available_cores()
+            if workers > 1:
+                print(f"Evaluating on {workers} worker processes")
+                with ParallelObjective(self, workers, args=(param_bounds,)) as pool:
+                    if batch:
+                        # One METAPOST job per worker per generation
+                        result = differential_evolution(
+                            pool.batch,
+                            bounds,
+                            maxiter=max_iter,
+                            popsize=5,
+                            x0=seed,
+                            vectorized=True,
+                            updating='deferred',
+                            disp=True
+                        )
+                    else:
+                        result = differential_evolution(
+                            evaluate_one,
+                            bounds,
+                            args=(param_bounds,),
+                            maxiter=max_iter,
+                            popsize=5,
+                            x0=seed,
+                            workers=pool.map,
+                            updating='deferred',
+                            disp=True
+                        )
+            elif batch:
+                result = differential_evolution(
+                    self.objective_function_batch,
+                    bounds,
+                    args=(param_bounds,),
+                    maxiter=max_iter,
+                    popsize=5,
+                    x0=seed,
+                    vectorized=True,
+                    updating='deferred',
+                    disp=True
+                )
+            else:
+                result = differential_evolution(
+                    self.objective_function,
+                    bounds,
+                    args=(param_bounds,),
+                    maxiter=max_iter,
+                    popsize=5,
+                    x0=seed,
+                    disp=True
+                )
+        elif method == 'surrogate':
+            # RBF model over all evaluations, including earlier runs
+            bounds = [(b.min_val, b.max_val) for b in param_bounds]
+            history = self.history.load(self.history_key(), [b.name for b in param_bounds])
             
+            workers = workers or available_cores()
+            batch_size = max(self.surrogate_batch, workers)
+            if workers > 1:
+                print(f"Evaluating on {workers} worker processes")
+                with ParallelObjective(self, workers, args=(param_bounds,)) as pool:
+                    result = surrogate_minimize(pool.batch, bounds, x0, max_rounds=max_iter,
+                                                batch_size=batch_size, history=history)
+            else:
+                result = surrogate_minimize(
+                    lambda X: self.objective_function_batch(X, param_bounds), bounds, x0,
+                    max_rounds=max_iter, batch_size=batch_size, history=history)
         else:  # nelder-mead
             # Local optimization - fast but needs good initial guess
-            x0 = np.array([b.initial for b in param_bounds])
-            
             result = minimize(
-                lambda x: self.objective_function(x, param_bounds),
+                self.objective_function,
                 x0,
+                args=(param_bounds,),
                 method='Nelder-Mead',
-                options={'maxiter': 50, 'disp': True}
+                options={'maxiter': max_iter, 'disp': True}
             )
+        
+        return result
+    
+    def optimize(self, param_bounds: list, method='differential_evolution',
+                 batch: bool = True, workers: Optional[int] = None,
+                 schedule: Optional[list] = None) -> Dict[str, float]:
+        """
+        Run optimization to find best parameters.
+        
+        Args:
+            param_bounds: List of ParameterBounds objects
+            method: 'differential_evolution', 'surrogate' or 'nelder-mead'
+            batch: Render each differential_evolution generation as one
+                METAPOST job (vectorized objective)
+            workers: Processes for differential_evolution and surrogate
+                evaluations (default: all available cores; 1 evaluates
+                in-process)
+            schedule: (scale, iterations) resolution stages, coarse to fine
+                (see multires); default is a single full-resolution stage.
+                Stages without an iteration count run 20 generations or
+                surrogate rounds, or 50 Nelder-Mead iterations.
+        """
+        schedule = schedule or [(1.0, None)]
+        self.template.check(b.name for b in param_bounds)
+        self.failures = FailureMemo({b.name: b.max_val - b.min_val for b in param_bounds})
+        
+        # Every candidate is drawn in the frame of the initial guess
+        if not self.fit_frame({b.name: b.initial for b in param_bounds}):
+            print("ERROR: initial parameters do not render, not optimizing")
+            return {b.name: b.initial for b in param_bounds}
+        
+        print(f"\nOptimizing {len(param_bounds)} parameters...")
+        print("=" * 60)
+        
+        x = np.array([b.initial for b in param_bounds])
+        for stage, (scale, iterations) in enumerate(schedule):
+            self.set_resolution(scale)
+            if len(schedule) > 1:
+                print(f"\nStage {stage + 1}/{len(schedule)}: "
+                      f"{self.target_label()} renders and target")
             
-            best_params = result.x
+            if iterations is None:
+                iterations = 50 if method == 'nelder-mead' else 20
+            
+            try:
+                result = self.run_method(param_bounds, method, batch, workers, x, iterations,
+                                         warm_start=stage > 0)
+            except KeyboardInterrupt:
+                self.recorder.dump(self.debug_dir, 'interrupt')
+                self.set_resolution(1.0)
+                raise
+            x = result.x
+        
+        # Comparisons after optimizing are at full resolution
+        self.set_resolution(1.0)
+        best_params = x
         
         # Convert to dict
         optimized = {}
@@ -407,13 +746,14 @@ class MetapostOptimizer:
         print("\nOptimized parameters:")
         for name, value in optimized.items():
             print(f"  {name}: {value:.4f}")
+        self.cache.report()
+        self.failures.report()
         
         return optimized
     
     def generate_final_metapost(self, optimized_params: Dict[str, float]) -> str:
         """Generate final METAPOST file with optimized parameters."""
-        template = self.template_path.read_text()
-        return self.substitute_parameters(template, optimized_params)
+        return self.substitute_parameters(self.template.source, optimized_params)
     
     def save_comparison(self, optimized_params: Dict[str, float], output_path: Path):
         """
@@ -425,10 +765,6 @@ class MetapostOptimizer:
             print("Could not render final comparison")
             return
         
-        # Resize to match
-        if rendered.shape != self.target_image.shape:
-            rendered = cv2.resize(rendered, (self.target_image.shape[1], self.target_image.shape[0]))
-        
         # Create side-by-side comparison
         comparison = np.hstack([self.target_image, rendered])
         
@@ -454,6 +790,14 @@ import re
 # Updated parameter bounds
 def main():
     """Main optimization workflow."""
+    parser = argparse.ArgumentParser(description='Fit U+10400 METAPOST parameters to the specimen')
+    parser.add_argument('--telemetry', type=Path, default=None,
+                        help='Append per-evaluation stage timings to this JSONL file '
+                             '(summarize with telemetry.py)')
+    parser.add_argument('--schedule', type=parse_schedule, default=parse_schedule(DEFAULT_SCHEDULE),
+                        help='Coarse-to-fine stages as scale[:iterations],... '
+                             f'(default: {DEFAULT_SCHEDULE}; "1" for full resolution only)')
+    args = parser.parse_args()
     
     # Paths
     base_dir = Path('.')
@@ -473,7 +817,8 @@ def main():
         template_path=template_path,
         base_path=base_path,
         specimen_path=specimen_path,
-        output_dir=output_dir
+        output_dir=output_dir,
+        telemetry_path=args.telemetry
     )
     
     # Define parameters to optimize
@@ -505,7 +850,8 @@ def main():
         print(f"  {bound.name}: [{bound.min_val}, {bound.max_val}] (initial: {bound.initial})")
     
     # Run optimization
-    optimized_params = optimizer.optimize(param_bounds, method='differential_evolution')
+    optimized_params = optimizer.optimize(param_bounds, method='differential_evolution',
+                                          schedule=args.schedule)
     
     # Generate final METAPOST
     final_mp = optimizer.generate_final_metapost(optimized_params)
@@ -514,6 +860,9 @@ def main():
     output_mp_file = output_dir / 'U10400_optimized.mp'
     output_mp_file.write_text(final_mp)
     print(f"\nSaved optimized METAPOST: {output_mp_file}")
+    if optimizer.base_frame is not None:
+        optimizer.base_frame.save(output_dir / FRAME_NAME)
+        print(f"Saved render frame: {output_dir / FRAME_NAME}")
     
     # Save comparison visualization
     comparison_path = output_dir / 'U10400_comparison.png'
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# flight_recorder.py
+"""
+In-memory record of the most recent METAPOST evaluations.
+
+Each render appends its source, parameters, timings and the tail of the
+mpost transcript to a ring buffer.  Nothing touches the disk until
+something goes wrong: on a failure, timeout or interrupt the buffer is
+dumped to flight_<reason>.json next to the failing source.
+
+Verbosity levels for `log`:
+    0  silent
+    1  failures and summaries (default)
+    2  one line per evaluation
+    3  full METAPOST source and mpost output for every render
+"""
+
+import json
+import time
+from collections import deque
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+QUIET, NORMAL, VERBOSE, DEBUG = 0, 1, 2, 3
+
+LOG_TAIL_LINES = 20
+
+
+def log_tail(output: Union[bytes, str, None], lines: int = LOG_TAIL_LINES) -> str:
+    """Last few lines of an mpost transcript."""
+    if not output:
+        return ""
+    if isinstance(output, bytes):
+        output = output.decode(errors='replace')
+    return '\n'.join(output.rstrip().splitlines()[-lines:])
+
+
+class FlightRecorder:
+    """Ring buffer of recent evaluations, dumped on failure."""
+
+    def __init__(self, capacity: int = 32, verbosity: int = NORMAL):
+        self.records = deque(maxlen=capacity)
+        self.verbosity = verbosity
+
+    def log(self, level: int, message: str):
+        """Print message if the verbosity level allows it."""
+        if self.verbosity >= level:
+            print(message)
+
+    def record(self, source: str, status: str, elapsed: float,
+               parameters: Optional[Union[Dict, List[Dict]]] = None,
+               log: Union[bytes, str, None] = None) -> Dict:
+        """Append one evaluation.  status: ok, failed, timeout, no_svg, error."""
+        entry = {
+            'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'status': status,
+            'elapsed': round(elapsed, 4),
+            'parameters': parameters,
+            'log_tail': log_tail(log),
+            'source': source,
+        }
+        self.records.append(entry)
+
+        if self.verbosity >= DEBUG:
+            print("=" * 60)
+            print(source)
+            print("=" * 60)
+            if log:
+                print(log.decode(errors='replace') if isinstance(log, bytes) else log)
+
+        return entry
+
+    def dump(self, directory: Path, reason: str) -> Optional[Path]:
+        """
+        Write the buffer to directory/flight_<reason>.json and the most
+        recent source to directory/flight_<reason>.mp.
+        """
+        if not self.records:
+            return None
+
+        directory.mkdir(exist_ok=True, parents=True)
+        dump_file = directory / f"flight_{reason}.json"
+        with open(dump_file, 'w') as f:
+            json.dump(list(self.records), f, indent=2, default=float)
+
+        (directory / f"flight_{reason}.mp").write_text(self.records[-1]['source'])
+
+        self.log(NORMAL, f"  Flight recorder: last {len(self.records)} evaluations saved to {dump_file}")
+        return dump_file
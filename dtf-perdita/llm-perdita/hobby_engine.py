@@ -0,0 +1,752 @@
+#!/usr/bin/env python3
+# hobby_engine.py
+"""
+Native evaluator for the METAPOST subset written by
+InteractivePathEditor.generate_metapost_parameterized.
+
+Supported:
+  - numeric assignments (`name := expr;`) with + - * / and length(path)
+  - paths of explicit points joined by `..` or `.. tension t ..`,
+    with optional {up}/{down}/{left}/{right}/{(dx, dy)} directions
+  - `pickup pencircle|pensquare` with scaled/rotated/xscaled/yscaled
+  - `draw path;` and `draw subpath (a, b) of path;`
+  - `for i = a upto b: ... endfor;` loops (the per-segment pen ramp)
+
+Control points are chosen with Hobby's algorithm as in mp.w, and pens are
+swept over the flattened path, so a render needs no subprocess.  Anything
+outside the subset raises UnsupportedTemplate; callers fall back to mpost.
+
+Run as a script to cross-check against real mpost output:
+
+    python hobby_engine.py generated_path_parameterized.mp
+    python hobby_engine.py generated_path_parameterized.mp --svg generated_path_parameterized-1.svg
+"""
+
+import keyword
+import math
+import re
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from svg_raster import fill_nonzero, flatten_cubic, stroke_round
+
+
+class UnsupportedTemplate(ValueError):
+    """Template uses METAPOST outside the natively supported subset."""
+
+
+DIRECTIONS = {
+    'right': 0.0,
+    'up': math.pi / 2,
+    'left': math.pi,
+    'down': -math.pi / 2,
+}
+
+EXPR_TOKEN_RE = re.compile(r'\s*(?:(\d+\.?\d*|\.\d+)|([A-Za-z_][A-Za-z_0-9]*)|([-+*/(),]))')
+
+def compile_expr(text: str):
+    """Compile a METAPOST numeric expression to a Python code object."""
+    pieces = []
+    pos = 0
+    text = text.strip()
+
+    while pos < len(text):
+        match = EXPR_TOKEN_RE.match(text, pos)
+        if match is None or match.end() == pos:
+            raise UnsupportedTemplate(f"Unsupported expression: {text!r}")
+        number, name, op = match.groups()
+
+        if name is not None:
+            if keyword.iskeyword(name) or name.startswith('__'):
+                raise UnsupportedTemplate(f"Unsupported name in expression: {name!r}")
+            if name != 'length' and text[match.end():].lstrip().startswith('('):
+                raise UnsupportedTemplate(f"Unsupported function in expression: {name!r}")
+            pieces.append(name)
+        elif number is not None:
+            pieces.append(number)
+        else:
+            pieces.append(op)
+        pos = match.end()
+
+    if not pieces:
+        raise UnsupportedTemplate("Empty expression")
+    try:
+        return compile(' '.join(pieces), '<metapost>', 'eval')
+    except SyntaxError:
+        # Implicit multiplication (72pt, 2x) and other METAPOST-only forms
+        raise UnsupportedTemplate(f"Unsupported expression: {text!r}") from None
+
+
+def evaluate(code, env: Dict) -> float:
+    return eval(code, {'__builtins__': {}, 'length': len}, env)
+
+
+def split_top_level(text: str, sep: str = ',') -> List[str]:
+    """Split on `sep` outside of parentheses."""
+    parts, depth, start = [], 0, 0
+    for i, ch in enumerate(text):
+        if ch == '(':
+            depth += 1
+        elif ch == ')':
+            depth -= 1
+        elif ch == sep and depth == 0:
+            parts.append(text[start:i])
+            start = i + 1
+    parts.append(text[start:])
+    return parts
+
+
+def strip_comments(source: str) -> str:
+    """Remove % comments, leaving % inside string literals alone."""
+    lines = []
+    for line in source.splitlines():
+        in_string = False
+        for i, ch in enumerate(line):
+            if ch == '"':
+                in_string = not in_string
+            elif ch == '%' and not in_string:
+                line = line[:i]
+                break
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+# --- Hobby's algorithm ---
+
+def _reduce_angle(a: float) -> float:
+    while a > math.pi:
+        a -= 2 * math.pi
+    while a <= -math.pi:
+        a += 2 * math.pi
+    return a
+
+
+def _velocity(st, ct, sf, cf, tension) -> float:
+    """Hobby's velocity function, as mp.w's velocity()."""
+    num = 2 + math.sqrt(2) * (st - sf / 16) * (sf - st / 16) * (ct - cf)
+    denom = 3 * (1 + 0.5 * (math.sqrt(5) - 1) * ct + 0.5 * (3 - math.sqrt(5)) * cf)
+    return min(4.0, num / (denom * tension))
+
+
+def _curl_ratio(gamma, a_tension, b_tension) -> float:
+    """mp.w curl_ratio: theta_0 / phi_1 at a curl endpoint."""
+    alpha, beta = 1 / a_tension, 1 / b_tension
+    return (((3 - alpha) * alpha * alpha * gamma + beta ** 3) /
+            (alpha ** 3 * gamma + (3 - beta) * beta * beta))
+
+
+def _solve_run(z: np.ndarray, start_dir: Optional[float], end_dir: Optional[float],
+               tensions: List[Tuple[float, float]]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Solve one run of knots z[0..n] whose only constraints are at its ends
+    (a given direction or curl 1).  Returns (theta[0..n-1], phi[1..n]).
+    """
+    n = len(z) - 1
+    chords = z[1:] - z[:-1]
+    d = np.hypot(chords[:, 0], chords[:, 1])
+    omega = np.arctan2(chords[:, 1], chords[:, 0])
+    psi = np.zeros(n + 1)
+    for k in range(1, n):
+        psi[k] = _reduce_angle(omega[k] - omega[k - 1])
+
+    alpha = [1 / t_out for t_out, _ in tensions]   # alpha[k]: leaving z_k
+    beta = [1 / t_in for _, t_in in tensions]      # beta[k]: arriving at z_{k+1}
+
+    if n == 1 and start_dir is None and end_dir is None:
+        return np.zeros(1), np.zeros(1)
+
+    # Unknowns: theta_0..theta_{n-1}, phi_n
+    size = n + 1
+    A = np.zeros((size, size))
+    rhs = np.zeros(size)
+
+    def phi_terms(k, coeff, row):
+        """Add coeff * phi_k to row (phi_k = -psi_k - theta_k for k < n)."""
+        if k == n:
+            A[row, n] += coeff
+        else:
+            A[row, k] -= coeff
+            rhs[row] += coeff * psi[k]
+
+    # Start condition
+    if start_dir is not None:
+        A[0, 0] = 1.0
+        rhs[0] = _reduce_angle(start_dir - omega[0])
+    else:
+        ratio = _curl_ratio(1.0, tensions[0][0], tensions[0][1])
+        A[0, 0] = 1.0
+        phi_terms(1, -ratio, 0)
+
+    # Mock curvature continuity at interior knots
+    for k in range(1, n):
+        a_prev, b_k = alpha[k - 1], beta[k - 1]
+        a_k, b_next = alpha[k], beta[k]
+        Ak = a_prev / (b_k * b_k * d[k - 1])
+        Bk = (3 - a_prev) / (b_k * b_k * d[k - 1])
+        Ck = (3 - b_next) / (a_k * a_k * d[k])
+        Dk = b_next / (a_k * a_k * d[k])
+        A[k, k - 1] += Ak
+        A[k, k] += Bk + Ck
+        rhs[k] -= Bk * psi[k]
+        phi_terms(k + 1, -Dk, k)
+
+    # End condition
+    if end_dir is not None:
+        A[n, n] = 1.0
+        rhs[n] = _reduce_angle(omega[n - 1] - end_dir)
+    else:
+        ratio = _curl_ratio(1.0, tensions[n - 1][1], tensions[n - 1][0])
+        A[n, n] = 1.0
+        A[n, n - 1] = -ratio
+
+    solution = np.linalg.solve(A, rhs)
+    theta = solution[:n]
+    phi = np.array([-psi[k] - theta[k] for k in range(1, n)] + [solution[n]])
+    return theta, phi
+
+
+def hobby_segments(points: np.ndarray, dirs: List[Optional[float]],
+                   tensions: List[Tuple[float, float]]) -> List[np.ndarray]:
+    """
+    Cubic segments (each a (4, 2) array) for an open path through
+    `points`, with optional direction angles per knot.
+    """
+    n = len(points) - 1
+    if n < 1:
+        return [np.array([points[0]] * 4)]
+
+    # Knots with a given direction split the path into independent runs
+    breaks = [0] + [k for k in range(1, n) if dirs[k] is not None] + [n]
+    segments = []
+
+    for i, j in zip(breaks[:-1], breaks[1:]):
+        z = points[i:j + 1]
+        chords = z[1:] - z[:-1]
+        if np.any(np.hypot(chords[:, 0], chords[:, 1]) == 0):
+            # Coincident knots: fall back to straight segments
+            for a, b in zip(z[:-1], z[1:]):
+                segments.append(np.array([a, a + (b - a) / 3, b - (b - a) / 3, b]))
+            continue
+
+        theta, phi = _solve_run(z, dirs[i], dirs[j], tensions[i:j])
+
+        for k in range(j - i):
+            a, b = z[k], z[k + 1]
+            chord = b - a
+            omega = math.atan2(chord[1], chord[0])
+            st, ct = math.sin(theta[k]), math.cos(theta[k])
+            sf, cf = math.sin(phi[k]), math.cos(phi[k])
+            t_out, t_in = tensions[i + k]
+            rr = _velocity(st, ct, sf, cf, t_out)
+            ss = _velocity(sf, cf, st, ct, t_in)
+            length = math.hypot(*chord)
+            c1 = a + rr * length * np.array([math.cos(omega + theta[k]), math.sin(omega + theta[k])])
+            c2 = b - ss * length * np.array([math.cos(omega - phi[k]), math.sin(omega - phi[k])])
+            segments.append(np.array([a, c1, c2, b]))
+
+    return segments
+
+
+def _split_cubic(seg: np.ndarray, t: float) -> Tuple[np.ndarray, np.ndarray]:
+    """de Casteljau split of one cubic at t."""
+    p0, p1, p2, p3 = seg
+    a, b, c = p0 + t * (p1 - p0), p1 + t * (p2 - p1), p2 + t * (p3 - p2)
+    ab, bc = a + t * (b - a), b + t * (c - b)
+    m = ab + t * (bc - ab)
+    return np.array([p0, a, ab, m]), np.array([m, bc, c, p3])
+
+
+def subpath(segments: List[np.ndarray], t0: float, t1: float) -> List[np.ndarray]:
+    """`subpath (t0, t1) of p` for t0 <= t1, times clamped to the path."""
+    n = len(segments)
+    t0, t1 = max(0.0, min(t0, n)), max(0.0, min(t1, n))
+    if t1 < t0:
+        raise UnsupportedTemplate("Reversed subpath is not supported")
+
+    result = []
+    k = min(int(math.floor(t0)), n - 1)
+    while k < n and k < t1:
+        lo, hi = max(t0 - k, 0.0), min(t1 - k, 1.0)
+        seg = segments[k]
+        if hi < 1.0:
+            seg, _ = _split_cubic(seg, hi)
+        if lo > 0.0:
+            _, seg = _split_cubic(seg, lo / hi)
+        if hi > lo:
+            result.append(seg)
+        k += 1
+
+    if not result:
+        # Zero-length subpath: a single point
+        k = min(int(math.floor(t0)), n - 1)
+        _, tail = _split_cubic(segments[k], t0 - k)
+        result.append(np.array([tail[0]] * 4))
+    return result
+
+
+# --- Template compilation ---
+
+@dataclass
+class Pen:
+    """A picked-up pen: 'circle' or 'square', with a 2x2 linear transform."""
+    kind: str
+    matrix: np.ndarray
+
+    def polygon(self) -> np.ndarray:
+        if self.kind == 'square':
+            unit = np.array([[-0.5, -0.5], [0.5, -0.5], [0.5, 0.5], [-0.5, 0.5]])
+        else:
+            angles = np.linspace(0, 2 * math.pi, 32, endpoint=False)
+            unit = 0.5 * np.column_stack([np.cos(angles), np.sin(angles)])
+        return unit @ self.matrix.T
+
+    def circle_diameter(self) -> Optional[float]:
+        """Diameter if this is a round (uniformly scaled) pencircle."""
+        if self.kind != 'circle':
+            return None
+        m = self.matrix
+        if abs(m[0, 0] - m[1, 1]) < 1e-9 and abs(m[0, 1] + m[1, 0]) < 1e-9:
+            return math.hypot(m[0, 0], m[1, 0])
+        return None
+
+
+def _pen_transform(op: str, value: float) -> np.ndarray:
+    if op == 'scaled':
+        return np.eye(2) * value
+    if op == 'xscaled':
+        return np.diag([value, 1.0])
+    if op == 'yscaled':
+        return np.diag([1.0, value])
+    c, s = math.cos(math.radians(value)), math.sin(math.radians(value))
+    return np.array([[c, -s], [s, c]])
+
+
+def _parse_direction(text: str) -> float:
+    text = text.strip()
+    if text in DIRECTIONS:
+        return DIRECTIONS[text]
+    match = re.match(r'^\(\s*([-\d.]+)\s*,\s*([-\d.]+)\s*\)$', text)
+    if match:
+        return math.atan2(float(match.group(2)), float(match.group(1)))
+    raise UnsupportedTemplate(f"Unsupported direction: {{{text}}}")
+
+
+def _parse_path(text: str):
+    """Parse `(x, y){dir} .. tension t .. (x, y)` into knots and joins."""
+    knots, joins = [], []
+    pos = 0
+    text = text.strip()
+
+    while True:
+        # Knot
+        if not text.startswith('(', pos):
+            raise UnsupportedTemplate(f"Unsupported path: {text!r}")
+        depth = 0
+        for end in range(pos, len(text)):
+            depth += {'(': 1, ')': -1}.get(text[end], 0)
+            if depth == 0:
+                break
+        coords = split_top_level(text[pos + 1:end])
+        if len(coords) != 2:
+            raise UnsupportedTemplate(f"Unsupported knot: {text[pos:end + 1]!r}")
+        pos = end + 1
+
+        direction = None
+        rest = text[pos:].lstrip()
+        pos = len(text) - len(rest)
+        if rest.startswith('{'):
+            close = text.index('}', pos)
+            direction = _parse_direction(text[pos + 1:close])
+            pos = close + 1
+
+        knots.append((compile_expr(coords[0]), compile_expr(coords[1]), direction))
+
+        rest = text[pos:].lstrip()
+        if not rest:
+            break
+        if not rest.startswith('..') or rest.startswith('...'):
+            raise UnsupportedTemplate(f"Unsupported path join: {rest[:20]!r}")
+        rest = rest[2:].lstrip()
+
+        if rest.startswith('tension'):
+            close = rest.index('..')
+            values = re.split(r'\band\b', rest[len('tension'):close])
+            if any(v.strip().startswith('atleast') for v in values):
+                raise UnsupportedTemplate("tension atleast is not supported")
+            t_out = compile_expr(values[0])
+            t_in = compile_expr(values[1]) if len(values) > 1 else t_out
+            rest = rest[close + 2:].lstrip()
+        else:
+            t_out = t_in = compile_expr('1')
+
+        joins.append((t_out, t_in))
+        pos = len(text) - len(rest)
+
+    return knots, joins
+
+
+FOR_RE = re.compile(r'^for\s+([A-Za-z_]\w*)\s*=\s*(.+?)\s+upto\s+(.+?):(?!=)(.*)$', re.DOTALL)
+PICKUP_RE = re.compile(r'^pickup\s+(pencircle|pensquare)\b(.*)$', re.DOTALL)
+DRAW_RE = re.compile(r'^draw\s+(?:subpath\s*\((.+)\)\s*of\s+)?([A-Za-z_]\w*)$', re.DOTALL)
+ASSIGN_RE = re.compile(r'^([A-Za-z_]\w*)\s*:?=\s*(.+)$', re.DOTALL)
+NUMBER_RE = re.compile(r'^-?(?:\d+\.?\d*|\.\d+)$')
+SKIP_RE = re.compile(r'^(?:beginfig\s*\(.*\)|endfig|end|'
+                     r'(?:numeric|path|pen|pair)\s+[\w\s,]+|'
+                     r'\w+\s*:=\s*".*")$', re.DOTALL)
+
+
+def _statements(source: str) -> List[str]:
+    """Split on ; outside string literals."""
+    parts, current, in_string = [], [], False
+    for ch in source:
+        if ch == '"':
+            in_string = not in_string
+        if ch == ';' and not in_string:
+            parts.append(''.join(current))
+            current = []
+        else:
+            current.append(ch)
+    parts.append(''.join(current))
+    return [' '.join(p.split()) for p in parts]
+
+
+def compile_program(source: str):
+    """Compile template source into a nested list of operations."""
+    program = []
+    stack = [program]
+    figures = 0
+
+    pending = _statements(strip_comments(source))
+    while pending:
+        statement = pending.pop(0)
+        if not statement:
+            continue
+
+        loop = FOR_RE.match(statement)
+        if loop:
+            body = []
+            stack[-1].append(('for', loop.group(1), compile_expr(loop.group(2)),
+                              compile_expr(loop.group(3)), body))
+            stack.append(body)
+            pending.insert(0, loop.group(4).strip())
+            continue
+
+        if statement == 'endfor':
+            if len(stack) == 1:
+                raise UnsupportedTemplate("endfor without for")
+            stack.pop()
+            continue
+
+        if statement.startswith('beginfig'):
+            figures += 1
+            if figures > 1:
+                raise UnsupportedTemplate("Only single-figure templates are supported")
+
+        if SKIP_RE.match(statement):
+            continue
+
+        pickup = PICKUP_RE.match(statement)
+        if pickup:
+            parts = re.split(r'\b(scaled|rotated|xscaled|yscaled)\b', pickup.group(2))
+            if parts[0].strip():
+                raise UnsupportedTemplate(f"Unsupported pen: {statement!r}")
+            transforms = [(parts[i], compile_expr(parts[i + 1])) for i in range(1, len(parts), 2)]
+            kind = 'circle' if pickup.group(1) == 'pencircle' else 'square'
+            stack[-1].append(('pickup', kind, transforms))
+            continue
+
+        draw = DRAW_RE.match(statement)
+        if draw:
+            times = None
+            if draw.group(1) is not None:
+                bounds = split_top_level(draw.group(1))
+                if len(bounds) != 2:
+                    raise UnsupportedTemplate(f"Unsupported subpath: {statement!r}")
+                times = (compile_expr(bounds[0]), compile_expr(bounds[1]))
+            stack[-1].append(('draw', draw.group(2), times))
+            continue
+
+        assign = ASSIGN_RE.match(statement)
+        if assign:
+            name, rhs = assign.groups()
+            if '..' in rhs:
+                knots, joins = _parse_path(rhs)
+                stack[-1].append(('path', name, knots, joins))
+            else:
+                literal = bool(NUMBER_RE.match(rhs.strip()))
+                stack[-1].append(('num', name, compile_expr(rhs), literal))
+            continue
+
+        raise UnsupportedTemplate(f"Unsupported statement: {statement[:60]!r}")
+
+    if len(stack) != 1:
+        raise UnsupportedTemplate("for without endfor")
+    return program
+
+
+class NativeRenderer:
+    """Evaluate a compiled template straight from a parameter dict."""
+
+    def __init__(self, template: str):
+        self.template = template
+        self.program = compile_program(template)
+        self.slots = set()
+        self._collect_slots(self.program)
+
+    def __getstate__(self):
+        # Code objects do not pickle; recompile in the receiving process
+        return {'template': self.template}
+
+    def __setstate__(self, state):
+        self.__init__(state['template'])
+
+    def _collect_slots(self, ops):
+        for op in ops:
+            if op[0] == 'num' and op[3]:
+                self.slots.add(op[1])
+            elif op[0] == 'for':
+                self._collect_slots(op[4])
+
+    def strokes(self, params: Dict[str, float]) -> List[Tuple[List[np.ndarray], Pen]]:
+        """Run the program; returns (cubic segments, pen) per draw."""
+        env = {}
+        state = {'pen': Pen('circle', np.eye(2)), 'strokes': []}
+        self._execute(self.program, params, env, state)
+        return state['strokes']
+
+    def _execute(self, ops, params, env, state):
+        for op in ops:
+            kind = op[0]
+
+            if kind == 'num':
+                _, name, code, literal = op
+                if literal and name in params:
+                    env[name] = float(params[name])
+                else:
+                    env[name] = evaluate(code, env)
+
+            elif kind == 'path':
+                _, name, knots, joins = op
+                points = np.array([[evaluate(x, env), evaluate(y, env)] for x, y, _ in knots])
+                dirs = [direction for _, _, direction in knots]
+                tensions = [(evaluate(t_out, env), evaluate(t_in, env)) for t_out, t_in in joins]
+                env[name] = hobby_segments(points, dirs, tensions)
+
+            elif kind == 'pickup':
+                _, pen_kind, transforms = op
+                matrix = np.eye(2)
+                for transform, code in transforms:
+                    matrix = _pen_transform(transform, evaluate(code, env)) @ matrix
+                state['pen'] = Pen(pen_kind, matrix)
+
+            elif kind == 'draw':
+                _, name, times = op
+                segments = env[name]
+                if times is not None:
+                    segments = subpath(segments, evaluate(times[0], env), evaluate(times[1], env))
+                state['strokes'].append((segments, state['pen']))
+
+            elif kind == 'for':
+                _, var, start, stop, body = op
+                value = evaluate(start, env)
+                stop = evaluate(stop, env)
+                while value <= stop + 1e-9:
+                    env[var] = value
+                    self._execute(body, params, env, state)
+                    value += 1
+
+    def render(self, params: Dict[str, float], width: int = 500, height: int = 500) -> Optional[np.ndarray]:
+        """
+        Rasterize like mpost + svg_raster.rasterize_svg: the picture's
+        bounding box is stretched over (height, width).  Returns None if
+        the parameters make the program fail (e.g. division by zero).
+        """
+        try:
+            strokes = self.strokes(params)
+        except (ZeroDivisionError, np.linalg.LinAlgError, KeyError, ValueError):
+            return None
+
+        canvas = np.zeros((height, width), dtype=np.uint8)
+        if not strokes:
+            return canvas
+
+        # Flatten at the output pixel density, as svg_raster does; the
+        # control polygons bound the picture closely enough to estimate it
+        hull = np.vstack([np.vstack(segments) for segments, _ in strokes])
+        pen_extent = max(np.abs(pen.polygon()).max() for _, pen in strokes)
+        extent = hull.max(axis=0) - hull.min(axis=0) + 2 * pen_extent
+        density = max(width / max(extent[0], 1e-9), height / max(extent[1], 1e-9))
+
+        flattened, corners = self._flatten(strokes, density)
+        llx, lly = np.min(corners, axis=0)
+        urx, ury = np.max(corners, axis=0)
+        if urx <= llx or ury <= lly:
+            return canvas
+
+        # METAPOST (x, y) -> SVG (x - llx, ury - y) -> stretched pixels
+        sx, sy = width / (urx - llx), height / (ury - lly)
+        self._paint(flattened, canvas, np.array([[sx, -sy], [-llx * sx, ury * sy]]))
+        return canvas
+
+    def render_in_frame(self, params: Dict[str, float], frame) -> Optional[np.ndarray]:
+        """
+        Rasterize like mpost + svg_raster.rasterize_in_frame: strokes at
+        their METAPOST coordinates in a render_frame.RenderFrame.
+        """
+        try:
+            strokes = self.strokes(params)
+        except (ZeroDivisionError, np.linalg.LinAlgError, KeyError, ValueError):
+            return None
+
+        canvas = np.zeros(frame.shape, dtype=np.uint8)
+        if strokes:
+            flattened, _ = self._flatten(strokes, frame.pixels_per_unit)
+            self._paint(flattened, canvas, frame.to_pixel())
+        return canvas
+
+    @staticmethod
+    def _flatten(strokes, density: float):
+        """Flattened strokes and the corners of their inked extent."""
+        flattened = []
+        corners = []
+        for segments, pen in strokes:
+            points = [segments[0][0]]
+            for seg in segments:
+                points.extend(flatten_cubic(*seg, scale=density))
+            points = np.array(points)
+
+            diameter = pen.circle_diameter()
+            if diameter is not None:
+                corners.append(points.min(axis=0) - diameter / 2)
+                corners.append(points.max(axis=0) + diameter / 2)
+            else:
+                polygon = pen.polygon()
+                corners.append(points.min(axis=0) + polygon.min(axis=0))
+                corners.append(points.max(axis=0) + polygon.max(axis=0))
+            flattened.append((points, pen, diameter))
+        return flattened, corners
+
+    def _paint(self, flattened, canvas: np.ndarray, to_pixel: np.ndarray):
+        for points, pen, diameter in flattened:
+            if diameter is not None:
+                mask = stroke_round([(points, False)], diameter, canvas.shape, to_pixel)
+            else:
+                mask = fill_nonzero(self._sweep(points, pen.polygon()), canvas.shape, to_pixel)
+            canvas[mask] = 255
+
+    @staticmethod
+    def _sweep(points: np.ndarray, polygon: np.ndarray) -> List[Tuple[np.ndarray, bool]]:
+        """Pen envelope as the union of convex hulls of consecutive pen stamps."""
+        if len(points) == 1:
+            return [(points[0] + polygon, True)]
+        hulls = []
+        for a, b in zip(points[:-1], points[1:]):
+            hulls.append((_convex_hull(np.vstack([a + polygon, b + polygon])), True))
+        return hulls
+
+
+def _convex_hull(points: np.ndarray) -> np.ndarray:
+    """Counter-clockwise convex hull (monotone chain)."""
+    pts = sorted(map(tuple, points))
+
+    def cross(o, a, b):
+        return (a[0] - o[0]) * (b[1] - o[1]) - (a[1] - o[1]) * (b[0] - o[0])
+
+    lower, upper = [], []
+    for p in pts:
+        while len(lower) >= 2 and cross(lower[-2], lower[-1], p) <= 0:
+            lower.pop()
+        lower.append(p)
+    for p in reversed(pts):
+        while len(upper) >= 2 and cross(upper[-2], upper[-1], p) <= 0:
+            upper.pop()
+        upper.append(p)
+    return np.array(lower[:-1] + upper[:-1])
+
+
+def iou(a: np.ndarray, b: np.ndarray) -> float:
+    union = np.sum((a > 0) | (b > 0))
+    return float(np.sum((a > 0) & (b > 0)) / union) if union else 1.0
+
+
+def conformance_check(template_path: Path, svg_path: Optional[Path] = None,
+                      size: int = 500) -> Optional[float]:
+    """
+    IoU between the native render of a template (at its own parameter
+    values) and the same template rendered by mpost + svg_raster, both
+    drawn in a size x size frame fitted to mpost's bounding box.  If no
+    SVG is given, mpost is run on the template in a scratch directory.
+    """
+    import subprocess
+    import tempfile
+    from render_frame import RenderFrame
+    from svg_raster import original_bbox, rasterize_in_frame
+
+    template = template_path.read_text()
+    try:
+        renderer = NativeRenderer(template)
+    except UnsupportedTemplate as e:
+        print(f"  {template_path.name}: not in native subset ({e})")
+        return None
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        tmpdir = Path(tmpdir)
+        if svg_path is None:
+            mp_file = tmpdir / template_path.name
+            mp_file.write_text(template)
+            try:
+                subprocess.run(['mpost', '-interaction=nonstopmode', mp_file.name],
+                               cwd=tmpdir, capture_output=True, timeout=30)
+            except (OSError, subprocess.TimeoutExpired) as e:
+                print(f"  {template_path.name}: could not run mpost ({e})")
+                return None
+            svg_files = sorted(tmpdir.glob('*.svg'))
+            if not svg_files:
+                print(f"  {template_path.name}: mpost produced no SVG")
+                return None
+            svg_path = svg_files[0]
+        try:
+            frame = RenderFrame.fit(original_bbox(svg_path.read_text()), (0, 0, size, size),
+                                    size, size)
+        except ValueError as e:
+            print(f"  {svg_path.name}: no usable bounding box ({e})")
+            return None
+        reference = rasterize_in_frame(svg_path, frame)
+
+    native = renderer.render_in_frame({}, frame)
+    score = iou(native, reference)
+    print(f"  {template_path.name}: IoU native vs mpost = {score:.4f}")
+    return score
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Cross-check the native Hobby engine against mpost')
+    parser.add_argument('templates', type=Path, nargs='*',
+                       default=[Path('generated_path.mp'), Path('generated_path_parameterized.mp')],
+                       help='Templates to check')
+    parser.add_argument('--svg', type=Path, default=None,
+                       help='Existing mpost SVG to compare against (single template only)')
+    parser.add_argument('--size', type=int, default=500, help='Raster size')
+    parser.add_argument('--min-iou', type=float, default=0.98, help='Pass threshold')
+
+    args = parser.parse_args()
+
+    print("Native engine conformance:")
+    failed = False
+    for template in args.templates:
+        score = conformance_check(template, args.svg, args.size)
+        if score is not None and score < args.min_iou:
+            failed = True
+
+    if failed:
+        print(f"FAILED: IoU below {args.min_iou}")
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
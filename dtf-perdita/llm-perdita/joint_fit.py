@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+# joint_fit.py
+"""
+Joint fitting of font-wide parameters across many glyphs.
+
+The global parameters of optimizer_metadata.json (pen_thick, pen_thin,
+global_tension, x_scale, y_scale, ...) describe the typeface, not one
+glyph, so they are fitted once against every specimen by
+block-coordinate descent:
+
+    shared block  the global parameters, with every glyph's points held
+                  fixed; the error is the mean over glyphs, and all
+                  glyphs of all candidates in a differential_evolution
+                  generation render as one mpost job
+    point blocks  each glyph's own coordinates, with the shared values
+                  held fixed (MetapostOptimizer.run_method)
+
+Each stage of the resolution schedule is one round of both blocks.  The
+glyphs come from a schedule_glyphs manifest; per-glyph optimizer
+settings in it are ignored here.  Output: <output>/<name>/optimized.mp
+per glyph (with its render_frame.json), shared.json with the common
+values, and results.csv.
+"""
+
+import json
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+from scipy.optimize import differential_evolution, minimize
+
+from multires import DEFAULT_SCHEDULE, parse_schedule
+from optimize_metapost import MetapostOptimizer, Parameter
+from render_frame import FRAME_NAME
+from schedule_glyphs import GlyphJob, glyph_iou, load_manifest, write_results
+
+
+class JointFit:
+    """Shared global parameters plus per-glyph points over several glyphs."""
+
+    def __init__(self, jobs: List[GlyphJob], output_dir: Path, renderer: str = 'mpost',
+                 objective: str = 'iou', cache_dir: Optional[Path] = None):
+        self.output_dir = output_dir
+        self.glyphs: Dict[str, MetapostOptimizer] = {}
+        for job in jobs:
+            print(f"\n--- {job.name} ---")
+            self.glyphs[job.name] = MetapostOptimizer(
+                metapost_template=job.template,
+                metadata_file=job.metadata,
+                specimen_path=job.specimen,
+                output_dir=output_dir / job.name,
+                cache_dir=cache_dir,
+                renderer=renderer,
+                objective=objective
+            )
+
+        # The first glyph's optimizer runs the combined mpost jobs
+        self.driver = next(iter(self.glyphs.values()))
+        self.shared = self.shared_parameters()
+        for optimizer in self.glyphs.values():
+            for param in optimizer.parameters:
+                if param.name in self.shared_names:
+                    param.optimizable = False
+        self.set_shared([p.value for p in self.shared])
+
+    @property
+    def shared_names(self) -> List[str]:
+        return [p.name for p in self.shared]
+
+    def shared_parameters(self) -> List[Parameter]:
+        """Global parameters common to all glyphs, with intersected bounds."""
+        global_names = [[g['name'] for g in optimizer.metadata['hierarchy']['global']]
+                        for optimizer in self.glyphs.values()]
+        names = [name for name in global_names[0] if all(name in glyph for glyph in global_names)]
+        by_name = [{p.name: p for p in optimizer.parameters} for optimizer in self.glyphs.values()]
+
+        shared = []
+        for name in names:
+            params = [glyph[name] for glyph in by_name]
+            low = max(p.min_val for p in params)
+            high = min(p.max_val for p in params)
+            if low > high:
+                print(f"Warning: {name} ranges do not overlap across glyphs, using their union")
+                low = min(p.min_val for p in params)
+                high = max(p.max_val for p in params)
+            value = float(np.clip(np.mean([p.value for p in params]), low, high))
+            shared.append(Parameter(name=name, value=value, min_val=low, max_val=high,
+                                    optimizable=True))
+        return shared
+
+    def set_shared(self, values):
+        for param, value in zip(self.shared, values):
+            param.value = float(value)
+        shared = {p.name: p.value for p in self.shared}
+        for optimizer in self.glyphs.values():
+            for param in optimizer.parameters:
+                if param.name in shared:
+                    param.value = shared[param.name]
+
+    def set_resolution(self, scale: float):
+        for optimizer in self.glyphs.values():
+            optimizer.set_resolution(scale)
+
+    def shared_objective_batch(self, param_matrix: np.ndarray) -> np.ndarray:
+        """
+        Mean error over glyphs for each column of shared values
+        (n_shared, S); all S x glyphs figures render as one batch.
+        """
+        optimizers = list(self.glyphs.values())
+        current = [{p.name: p.value for p in optimizer.parameters} for optimizer in optimizers]
+
+        jobs = []
+        for column in param_matrix.T:
+            shared = dict(zip(self.shared_names, column))
+            jobs.extend((optimizer, {**params, **shared})
+                        for optimizer, params in zip(optimizers, current))
+
+        rendered = self.driver.render_jobs(jobs)
+        errors = np.array([owner.compare_images(r, owner.target_image)
+                           for (owner, _), r in zip(jobs, rendered)])
+        return errors.reshape(param_matrix.shape[1], len(optimizers)).mean(axis=1)
+
+    def shared_objective(self, values: np.ndarray) -> float:
+        return float(self.shared_objective_batch(values[:, None])[0])
+
+    def fit_shared(self, max_iter: int, method: str) -> float:
+        """Optimize the shared block; returns the mean error."""
+        x0 = np.array([p.value for p in self.shared])
+        bounds = [(p.min_val, p.max_val) for p in self.shared]
+        if method == 'nelder-mead':
+            result = minimize(self.shared_objective, x0, method='Nelder-Mead',
+                              options={'maxiter': max_iter, 'disp': True})
+            x = np.clip(result.x, [b[0] for b in bounds], [b[1] for b in bounds])
+        else:
+            # One mpost job per generation covers every glyph
+            result = differential_evolution(self.shared_objective_batch, bounds,
+                                            maxiter=max_iter, popsize=5, x0=x0,
+                                            vectorized=True, updating='deferred',
+                                            disp=True)
+            x = result.x
+        self.set_shared(x)
+        return float(result.fun)
+
+    def fit_points(self, name: str, max_iter: int, method: str,
+                   workers: Optional[int]) -> float:
+        """Optimize one glyph's own parameters; returns its error."""
+        optimizer = self.glyphs[name]
+        free = [p for p in optimizer.parameters if p.optimizable]
+        if not free:
+            return float('nan')
+        x0 = np.array([p.value for p in free])
+        bounds = [(p.min_val, p.max_val) for p in free]
+        result = optimizer.run_method(method, x0, bounds, max_iter, True, workers,
+                                      warm_start=True)
+        for param, value in zip(free, result.x):
+            param.value = float(value)
+        return float(result.fun)
+
+    def fit(self, schedule: list, shared_method: str = 'differential_evolution',
+            point_method: str = 'nelder-mead', workers: Optional[int] = None):
+        """
+        One round of shared and point blocks per schedule stage.  Stages
+        without an iteration count run 10 shared generations and 50
+        Nelder-Mead (or 10 generation/round) point iterations.
+        """
+        for stage, (scale, iterations) in enumerate(schedule):
+            self.set_resolution(scale)
+            print(f"\n=== Round {stage + 1}/{len(schedule)} "
+                  f"({self.driver.frame.label} renders) ===")
+
+            shared_iter = iterations or 10
+            point_iter = iterations or (50 if point_method == 'nelder-mead' else 10)
+
+            print(f"\nShared block ({', '.join(self.shared_names)})")
+            error = self.fit_shared(shared_iter, shared_method)
+            print(f"  mean error {error:.4f}: " +
+                  ', '.join(f"{p.name}={p.value:.4g}" for p in self.shared))
+
+            for name in self.glyphs:
+                print(f"\nPoint block: {name}")
+                error = self.fit_points(name, point_iter, point_method, workers)
+                print(f"  {name} error {error:.4f}")
+
+        self.set_resolution(1.0)
+
+    def save(self) -> List[Dict]:
+        """Write optimized sources, shared.json and results.csv."""
+        self.output_dir.mkdir(exist_ok=True, parents=True)
+        shared = {p.name: p.value for p in self.shared}
+        (self.output_dir / "shared.json").write_text(json.dumps(shared, indent=2))
+
+        results = []
+        for name, optimizer in self.glyphs.items():
+            params = {p.name: p.value for p in optimizer.parameters}
+            (optimizer.output_dir / "optimized.mp").write_text(optimizer.substitute_parameters(params))
+            optimizer.base_frame.save(optimizer.output_dir / FRAME_NAME)
+            rendered = optimizer.render_metapost(params)
+            results.append({
+                'glyph': name,
+                'status': 'ok' if rendered is not None else 'does not render',
+                'iou': glyph_iou(rendered, optimizer.target_image),
+                'objective': optimizer.compare_images(rendered, optimizer.target_image),
+                'elapsed_s': None,
+                'output': str(optimizer.output_dir),
+            })
+        write_results(self.output_dir / "results.csv", results)
+
+        print("\nShared parameters:")
+        for name, value in shared.items():
+            print(f"  {name}: {value:.4f}")
+        print(f"\n{'glyph':<16}{'IoU':>8}")
+        for r in results:
+            iou = f"{r['iou']:.4f}" if r['iou'] is not None else '-'
+            print(f"{r['glyph']:<16}{iou:>8}")
+        print(f"\nResults: {self.output_dir / 'results.csv'}")
+        return results
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Fit shared parameters across glyphs')
+    parser.add_argument('manifest', type=Path, help='Glyph manifest (see schedule_glyphs.py)')
+    parser.add_argument('--output', type=Path, default=Path('optimized_output/joint'),
+                       help='Output directory; one subdirectory per glyph')
+    parser.add_argument('--schedule', type=parse_schedule, default=parse_schedule(DEFAULT_SCHEDULE),
+                       help='One descent round per stage, as scale[:iterations],... '
+                            f'(default: {DEFAULT_SCHEDULE})')
+    parser.add_argument('--shared-method', choices=['differential_evolution', 'nelder-mead'],
+                       default='differential_evolution', help='Optimizer for the shared block')
+    parser.add_argument('--point-method', choices=['nelder-mead', 'differential_evolution', 'surrogate'],
+                       default='nelder-mead', help='Optimizer for each glyph\'s points')
+    parser.add_argument('--workers', type=int, default=None,
+                       help='Worker processes for point blocks (default: all cores)')
+    parser.add_argument('--objective', choices=['iou', 'chamfer'], default='iou',
+                       help='Per-glyph error')
+    parser.add_argument('--renderer', choices=['mpost', 'native'], default='mpost',
+                       help='Render with mpost or the in-process Hobby-spline engine')
+    parser.add_argument('--cache-dir', type=Path, default=None,
+                       help='Render cache shared by all glyphs (default: one per glyph)')
+    args = parser.parse_args()
+
+    try:
+        jobs = load_manifest(args.manifest)
+    except (OSError, json.JSONDecodeError, ValueError) as e:
+        print(f"ERROR: {e}")
+        sys.exit(1)
+
+    joint = JointFit(jobs, args.output, renderer=args.renderer, objective=args.objective,
+                     cache_dir=args.cache_dir)
+    if not joint.shared:
+        print("ERROR: the glyphs have no global parameters in common")
+        sys.exit(1)
+
+    for name, optimizer in joint.glyphs.items():
+        if not optimizer.validate_template():
+            print(f"\nFix the template for {name} before optimizing!")
+            sys.exit(1)
+
+    joint.fit(args.schedule, args.shared_method, args.point_method, args.workers)
+    joint.save()
+
+
+if __name__ == '__main__':
+    main()
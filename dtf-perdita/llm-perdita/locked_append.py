@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+# locked_append.py
+"""
+Appends to log files shared by pool workers.
+
+An append-mode write is not guaranteed to land in one piece when several
+processes write at once (a buffered write can be split into several
+system calls), so lines from different workers could interleave.  Each
+append here holds an exclusive flock on the file for the whole write.
+Where fcntl is unavailable (Windows) the append is unlocked.
+"""
+
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+def append_locked(path: Path, text: str):
+    """Append `text` to `path` under an exclusive lock."""
+    path.parent.mkdir(exist_ok=True, parents=True)
+    with open(path, 'a') as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        f.write(text)
+        # Closing flushes, then releases the lock
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+# metapost_render.py
+"""
+Shared METAPOST job helpers for the optimizer scripts.
+
+Batching: every candidate is emitted as its own numbered figure in a
+single METAPOST job, so one process launch and one base-file load serve
+a whole differential_evolution generation.
+
+Templates: CompiledTemplate finds the numeric assignment slots once, so
+substituting a parameter set is a single join instead of a regex pass
+per parameter.
+
+Processes: run_mpost starts mpost in its own session and kills the whole
+process group on timeout, so runaway jobs never outlive the call.
+"""
+
+import os
+import re
+import signal
+import subprocess
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+BEGINFIG_RE = re.compile(r'^[ \t]*beginfig\(\s*-?\d+\s*\)\s*;', re.MULTILINE)
+ENDFIG_RE = re.compile(r'^[ \t]*endfig\s*;', re.MULTILINE)
+INPUT_RE = re.compile(r'^[ \t]*(input\s+[^;\s]+)\s*;[^\n]*\n?', re.MULTILINE)
+
+# Assignment or equation target at the start of a line (x_scale = 36;
+# pen_start := 12;).  Only the leading tag is captured: METAPOST treats
+# x_a_0_base as the tag x_a_ plus suffixes, and `save` works on tags.
+ASSIGN_RE = re.compile(r'^[ \t]*([A-Za-z_]+)[A-Za-z_0-9.\[\]]*\s*:?=(?!=)', re.MULTILINE)
+DECLARE_RE = re.compile(r'^[ \t]*(?:numeric|path|pair|pen|picture|string|boolean|transform)\s+([^;]+);',
+                        re.MULTILINE)
+
+# Tunable slot: `name := 12;` or `name = -0.5;`.  The name must not be the
+# tail of a longer token (x_scale vs xx_scale, or a suffix like z.x_scale).
+SLOT_RE = re.compile(r'(?<![A-Za-z0-9_.\]])([A-Za-z_][A-Za-z0-9_]*)(\s*:?=\s*)'
+                     r'(-?(?:\d+\.?\d*|\.\d+))(?=\s*;)')
+
+# Internal quantities must be changed with `interim`, never `save`d
+INTERNALS = {'outputformat', 'outputtemplate', 'warningcheck', 'prologues',
+             'ahlength', 'ahangle', 'bboxmargin', 'labeloffset', 'linecap',
+             'linejoin', 'miterlimit', 'truecorners'}
+
+
+class CompiledTemplate:
+    """
+    METAPOST source split around its numeric assignment slots.
+
+    Every occurrence of a slot is substituted; slots without a value in
+    the parameter dict keep the literal from the template.
+    """
+
+    def __init__(self, source: str):
+        self.source = source
+        self.chunks: List[str] = []
+        self.slots: List[str] = []
+        self.literals: List[str] = []
+
+        pos = 0
+        for match in SLOT_RE.finditer(source):
+            self.chunks.append(source[pos:match.start(3)])
+            self.slots.append(match.group(1))
+            self.literals.append(match.group(3))
+            pos = match.end(3)
+        self.chunks.append(source[pos:])
+
+        self.names = set(self.slots)
+
+    def check(self, names: Iterable[str]):
+        """Raise ValueError for parameters with no slot in the template."""
+        unknown = sorted(set(names) - self.names)
+        if unknown:
+            raise ValueError(f"Parameters not assigned in template: {', '.join(unknown)}")
+
+    def value(self, name: str) -> float:
+        """Literal value of the first slot for `name`."""
+        if name not in self.names:
+            raise ValueError(f"Parameter not assigned in template: {name}")
+        return float(self.literals[self.slots.index(name)])
+
+    def render(self, parameters: Dict[str, float]) -> str:
+        """Source with parameter values substituted into their slots."""
+        self.check(parameters)
+
+        parts = [self.chunks[0]]
+        for name, literal, chunk in zip(self.slots, self.literals, self.chunks[1:]):
+            value = parameters.get(name)
+            parts.append(literal if value is None else f"{value:.6f}")
+            parts.append(chunk)
+        return ''.join(parts)
+
+
+def split_figure(source: str) -> Tuple[str, str, str]:
+    """
+    Split a single-figure METAPOST source into preamble, figure body
+    and postamble (everything after endfig, usually `end;`).
+    """
+    begin = BEGINFIG_RE.search(source)
+    if begin is None:
+        raise ValueError("No beginfig(...) found in METAPOST source")
+
+    end = ENDFIG_RE.search(source, begin.end())
+    if end is None:
+        raise ValueError("No endfig found in METAPOST source")
+
+    return source[:begin.start()], source[begin.end():end.start()], source[end.end():]
+
+
+def local_names(body: str) -> List[str]:
+    """Tags assigned or declared in a figure body, in first-seen order."""
+    names = []
+
+    for match in ASSIGN_RE.finditer(body):
+        names.append(match.group(1))
+
+    for match in DECLARE_RE.finditer(body):
+        for item in match.group(1).split(','):
+            tag = re.match(r'\s*([A-Za-z_]+)', item)
+            if tag:
+                names.append(tag.group(1))
+
+    seen = set()
+    result = []
+    for name in names:
+        if name not in seen and name not in INTERNALS:
+            seen.add(name)
+            result.append(name)
+    return result
+
+
+def batch_key(source: str) -> str:
+    """
+    Sources with equal keys can share a batch job: build_batch_source
+    keeps only the first source's preamble (inputs are hoisted anyway).
+    """
+    preamble, _, _ = split_figure(source)
+    return INPUT_RE.sub('', preamble).strip()
+
+
+def build_batch_source(sources: List[str]) -> str:
+    """
+    Combine N single-figure sources into one job with figures 1..N.
+
+    Each body runs inside its own begingroup/save scope so equations such
+    as `x_scale = 36;` can be restated by the next candidate.  `input`
+    lines are hoisted out of the bodies and loaded once.
+    """
+    if not sources:
+        raise ValueError("Nothing to batch")
+
+    preamble, _, _ = split_figure(sources[0])
+    inputs = []
+
+    def hoist(text: str) -> str:
+        for statement in INPUT_RE.findall(text):
+            statement = ' '.join(statement.split()) + ';'
+            if statement not in inputs:
+                inputs.append(statement)
+        return INPUT_RE.sub('', text)
+
+    preamble = hoist(preamble)
+
+    figures = []
+    for index, source in enumerate(sources, start=1):
+        _, body, _ = split_figure(source)
+        body = hoist(body)
+
+        names = local_names(body)
+        save = f"  save {', '.join(names)};\n" if names else ""
+
+        figures.append(
+            f"beginfig({index});\n"
+            f"begingroup\n{save}{body}\n"
+            f"endgroup;\n"
+            f"endfig;\n"
+        )
+
+    return "\n".join(inputs + [preamble] + figures + ["end;\n"])
+
+
+def _kill_group(process: subprocess.Popen):
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+def run_mpost(args: List[str], cwd: Path, timeout: float) -> subprocess.CompletedProcess:
+    """
+    subprocess.run(args, capture_output=True, timeout=timeout) for mpost.
+
+    mpost runs in a new session with stdin closed, so an error prompt
+    cannot wait for input.  On timeout or interrupt its process group is
+    killed and reaped; TimeoutExpired is raised as with subprocess.run.
+    """
+    process = subprocess.Popen(args, cwd=cwd, stdin=subprocess.DEVNULL,
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                               start_new_session=True)
+    try:
+        stdout, stderr = process.communicate(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        _kill_group(process)
+        stdout, stderr = process.communicate()
+        raise subprocess.TimeoutExpired(args, timeout, output=stdout, stderr=stderr)
+    except BaseException:
+        _kill_group(process)
+        process.wait()
+        raise
+
+    return subprocess.CompletedProcess(args, process.returncode, stdout, stderr)
+
+
+def figure_svg(workdir: Path, jobname: str, index: int) -> Optional[Path]:
+    """SVG written for figure `index` under outputtemplate "%j-%c.svg"."""
+    svg_path = workdir / f"{jobname}-{index}.svg"
+    return svg_path if svg_path.exists() else None
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+# multires.py
+"""
+Coarse-to-fine resolution schedules for specimen fitting.
+
+A schedule is a list of (scale, iterations) stages, written on the
+command line as e.g. "0.25:10,0.5:10,1".  In each stage the specimen is
+downsampled by `scale` and candidates are rasterized straight into that
+level's pixels (render_frame.RenderFrame.scaled); the next stage starts
+from the best parameters found so far.  Stages without an iteration count use the
+optimizer's default.
+"""
+
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+DEFAULT_SCHEDULE = "0.25,0.5,1"
+
+# Levels built up front from the specimen; others are added on demand
+PYRAMID_SCALES = (1.0, 0.5, 0.25, 0.125)
+
+# Below this a glyph is mostly stroke edges
+MIN_SIZE = 32
+
+Schedule = List[Tuple[float, Optional[int]]]
+
+
+def parse_schedule(text: str) -> Schedule:
+    """Parse "scale[:iterations],..." into stages."""
+    stages = []
+    for item in text.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        scale, _, iterations = item.partition(':')
+        scale = float(scale)
+        if not 0 < scale <= 1:
+            raise ValueError(f"Schedule scale must be in (0, 1]: {item}")
+        stages.append((scale, int(iterations) if iterations else None))
+
+    if not stages:
+        raise ValueError(f"Empty resolution schedule: {text!r}")
+    return stages
+
+
+def scaled_size(size: int, scale: float) -> int:
+    return max(MIN_SIZE, int(round(size * scale)))
+
+
+def target_pyramid(binary: np.ndarray, scales: Iterable[float]) -> Dict[float, np.ndarray]:
+    """Area-downsampled, re-thresholded copies of a binary target."""
+    height, width = binary.shape
+    pyramid = {}
+    for scale in scales:
+        if scale == 1.0:
+            pyramid[scale] = binary
+            continue
+        size = (scaled_size(width, scale), scaled_size(height, scale))
+        small = cv2.resize(binary, size, interpolation=cv2.INTER_AREA)
+        _, pyramid[scale] = cv2.threshold(small, 127, 255, cv2.THRESH_BINARY)
+    return pyramid
@@ -6,11 +6,27 @@ import numpy as np
 from pathlib import Path
 import subprocess
 import tempfile
+import time
 import json
-import re
 from scipy.optimize import minimize, differential_evolution
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 from dataclasses import dataclass
+from metapost_render import CompiledTemplate, batch_key, build_batch_source, figure_svg, run_mpost
+from render_cache import RenderCache
+from failure_memo import AdaptiveTimeout, FailureMemo
+from flight_recorder import FlightRecorder, NORMAL, VERBOSE
+from telemetry import Telemetry
+from chamfer import ChamferTarget
+from target_cache import TargetCache
+from checkpoint import CHECKPOINT_NAME, Checkpoint, SimplexTracker
+from surrogate import EvaluationHistory, history_context, surrogate_minimize
+from multires import DEFAULT_SCHEDULE, PYRAMID_SCALES, parse_schedule
+from hobby_engine import NativeRenderer, UnsupportedTemplate, conformance_check
+from parallel_eval import ParallelObjective, available_cores, evaluate_one
+from render_frame import FRAME_NAME, RenderFrame
+from registration import MODES as REGISTRATION_MODES, Registration, bake, ink_moments, solve, warp
+import svg_raster
+import xml.etree.ElementTree as ET
 
 @dataclass
 class Parameter:
@@ -32,25 +48,113 @@ class MetapostOptimizer:
                  metapost_template: Path,
                  metadata_file: Path,
                  specimen_path: Path,
-                 output_dir: Path):
+                 output_dir: Path,
+                 cache_dir: Optional[Path] = None,
+                 cache_size_mb: float = 256,
+                 renderer: str = 'mpost',
+                 flight_size: int = 32,
+                 verbosity: int = NORMAL,
+                 objective: str = 'iou',
+                 history_path: Optional[Path] = None,
+                 surrogate_batch: int = 8,
+                 telemetry_path: Optional[Path] = None,
+                 target_cache_dir: Optional[Path] = None,
+                 register: str = 'none'):
         self.template_path = metapost_template
         self.metadata_path = metadata_file
         self.specimen_path = specimen_path
         self.output_dir = output_dir
         self.output_dir.mkdir(exist_ok=True, parents=True)
         
-        # Load template
+        # Debug artifacts and mpost scratch; pool workers get their own
+        self.debug_dir = output_dir
+        self.scratch_dir = None
+        
+        # Recent evaluations, written out only on failure or interrupt
+        self.recorder = FlightRecorder(capacity=flight_size, verbosity=verbosity)
+        
+        # Per-evaluation stage timings (JSONL), off unless a path is given
+        self.telemetry = Telemetry(telemetry_path)
+        
+        # Rendered rasters, shared by every render_metapost caller
+        self.cache = RenderCache(cache_dir or output_dir / "render_cache",
+                                 max_bytes=int(cache_size_mb * 1024 * 1024))
+        
+        # Load template and locate its parameter slots
         self.template = metapost_template.read_text()
+        self.compiled = CompiledTemplate(self.template)
+        
+        # Native Hobby-spline evaluator, if the template is in its subset
+        self.native = None
+        if renderer == 'native':
+            try:
+                self.native = NativeRenderer(self.template)
+                print("Using native renderer (no mpost subprocess)")
+            except UnsupportedTemplate as e:
+                print(f"Template not supported by native renderer ({e}), using mpost")
         
         # Load metadata
         with open(metadata_file) as f:
             self.metadata = json.load(f)
         
-        # Load specimen
-        self.target_image = self.load_specimen(specimen_path)
+        # Specimen mask, its downsampled copies for coarse stages and
+        # distance maps; memory-mapped from the target cache after the
+        # first run against this specimen
+        self.targets = TargetCache(target_cache_dir or output_dir / "target_cache").bundle(
+            specimen_path, self.load_specimen)
+        self.target_image = self.targets.mask(1.0)
+        self.target_pyramid = self.targets.pyramid(PYRAMID_SCALES)
+        
+        # Candidates are drawn straight into the target's pixels: the
+        # template was traced on the specimen with (0, 0) at its center,
+        # one unit per pixel (see render_frame).  self.frame follows the
+        # current resolution stage.
+        height, width = self.target_image.shape
+        self.base_frame = RenderFrame.specimen(
+            self.metadata.get('image_width', width),
+            self.metadata.get('image_height', height)).scaled(width, height)
+        self.frame = self.base_frame
+        self.raster_settings = {'rasterizer': 'svg_raster', 'frame': self.frame.settings()}
+        
+        # 'iou' or 'chamfer'; chamfer targets are built once per pyramid level
+        self.objective = objective
+        self.chamfer_targets = {}
+        if objective == 'chamfer':
+            self.chamfer_target(self.target_image)
+        
+        # 'none', 'uniform' or 'anisotropic': renders are moved and scaled
+        # onto the target in closed form before scoring (see registration)
+        self.register = register
+        self.target_moments = {}
+        
+        # Every evaluation, for warm-starting the surrogate in later runs
+        self.history = EvaluationHistory(history_path or output_dir / "evaluations.jsonl")
+        self.surrogate_batch = surrogate_batch
+        self.history_base = history_context(self.template, specimen_path.read_bytes(),
+                                            objective, self.raster_settings['rasterizer'],
+                                            register)
         
         # Extract parameters from metadata
         self.parameters = self.extract_parameters()
+        self.compiled.check(p.name for p in self.parameters)
+        
+        # Registration solves the global scale, so the scale parameters
+        # it covers would only add flat directions to the search
+        if register != 'none':
+            scales = [g['name'] for g in self.metadata['hierarchy']['global']
+                      if g.get('type') == 'scale']
+            pinned = scales if register == 'anisotropic' else scales[:1]
+            for param in self.parameters:
+                if param.name in pinned:
+                    param.optimizable = False
+            if pinned:
+                print(f"{register.capitalize()} registration replaces {', '.join(pinned)}")
+        
+        # Known-bad parameter regions are penalized without rendering;
+        # mpost time limits follow observed render times
+        self.failures = FailureMemo({p.name: p.max_val - p.min_val
+                                     for p in self.parameters if p.optimizable})
+        self.timeout = AdaptiveTimeout(default=10.0)
         
         print(f"Loaded {len(self.parameters)} parameters")
         free_params = [p for p in self.parameters if p.optimizable]
@@ -90,11 +194,13 @@ class MetapostOptimizer:
             x_value = self.get_current_value(x_name)
             range_frac = x_info.get('range_fraction', 0.15)
             
+            # Sorted, since negative coordinates flip the range
+            x_min, x_max = sorted((x_value * (1 - range_frac), x_value * (1 + range_frac)))
             parameters.append(Parameter(
                 name=x_name,
                 value=x_value,
-                min_val=x_value * (1 - range_frac),
-                max_val=x_value * (1 + range_frac),
+                min_val=x_min,
+                max_val=x_max,
                 optimizable=x_info['optimizable']
             ))
             
@@ -103,11 +209,12 @@ class MetapostOptimizer:
             y_name = y_info['name']
             y_value = self.get_current_value(y_name)
             
+            y_min, y_max = sorted((y_value * (1 - range_frac), y_value * (1 + range_frac)))
             parameters.append(Parameter(
                 name=y_name,
                 value=y_value,
-                min_val=y_value * (1 - range_frac),
-                max_val=y_value * (1 + range_frac),
+                min_val=y_min,
+                max_val=y_max,
                 optimizable=y_info['optimizable']
             ))
         
@@ -115,76 +222,206 @@ class MetapostOptimizer:
     
     def get_current_value(self, param_name: str) -> float:
         """Extract current value from template."""
-        pattern = rf'{param_name}\s*:=\s*([\d.-]+)\s*;'
-        match = re.search(pattern, self.template)
-        if match:
-            return float(match.group(1))
-        return 0.0
+        return self.compiled.value(param_name)
     
     def substitute_parameters(self, param_values: Dict[str, float]) -> str:
         """Substitute parameter values into template."""
-        result = self.template
+        return self.compiled.render(param_values)
+    
+    def known_failure(self, param_values: Dict[str, float]) -> bool:
+        """True if param_values is next to a recorded mpost failure."""
+        kind = self.failures.lookup(param_values)
+        if kind is None:
+            return False
+        self.recorder.log(VERBOSE, f"  Skipping render near earlier {kind}")
+        self.telemetry.failure('memo')
+        return True
+    
+    def remember_failure(self, param_values: Optional[Dict[str, float]], kind: str):
+        self.telemetry.failure(kind)
+        if param_values is not None:
+            self.failures.add(param_values, kind)
+    
+    def render_metapost(self, param_values: Dict[str, float]) -> np.ndarray:
+        """Render METAPOST with given parameters (cached)."""
+        if self.native is not None:
+            with self.telemetry.stage('native'):
+                return self.native.render_in_frame(param_values, self.frame)
         
-        for name, value in param_values.items():
-            pattern = rf'({name}\s*:=\s*)[\d.-]+(\s*;)'
-            replacement = rf'\g<1>{value:.6f}\g<2>'
-            result = re.sub(pattern, replacement, result)
+        if self.known_failure(param_values):
+            return None
         
-        return result
+        # Generate code with substituted values
+        with self.telemetry.stage('substitute'):
+            mp_code = self.substitute_parameters(param_values)
+        
+        with self.telemetry.stage('cache'):
+            key = self.cache.key(mp_code, self.raster_settings)
+            binary = self.cache.get(key)
+        if binary is not None:
+            return binary
+        
+        binary = self.run_metapost(mp_code, param_values)
+        self.cache.put(key, binary)
+        return binary
     
-    def render_metapost(self, param_values: Dict[str, float]) -> np.ndarray:
-        """Render METAPOST with given parameters."""
-        with tempfile.TemporaryDirectory() as tmpdir:
+    def run_metapost(self, mp_code: str,
+                     param_values: Optional[Dict[str, float]] = None) -> Optional[np.ndarray]:
+        """Run mpost on a complete source and rasterize the result."""
+        with tempfile.TemporaryDirectory(dir=self.scratch_dir) as tmpdir:
             tmpdir = Path(tmpdir)
             
-            # Generate code with substituted values
-            mp_code = self.substitute_parameters(param_values)
-            
             # Write to file
             mp_file = tmpdir / "temp.mp"
             mp_file.write_text(mp_code)
             
-            # DEBUG: Save failing code
-            debug_file = self.output_dir / "debug_last_attempt.mp"
-            debug_file.write_text(mp_code)
-            
             # Run mpost
+            started = time.perf_counter()
             try:
-                result = subprocess.run(
-                    ['mpost', str(mp_file)],
-                    cwd=tmpdir,
-                    capture_output=True,
-                    timeout=10
-                )
+                with self.telemetry.stage('mpost'):
+                    result = run_mpost(['mpost', str(mp_file)], tmpdir,
+                                       self.timeout.limit())
                 
                 if result.returncode != 0:
-                    # Save failed code
-                    fail_file = self.output_dir / "debug_failed.mp"
+                    self.recorder.record(mp_code, 'failed', time.perf_counter() - started,
+                                         param_values, result.stdout + result.stderr)
+                    self.remember_failure(param_values, 'failed')
+                    self.debug_dir.mkdir(exist_ok=True, parents=True)
+                    fail_file = self.debug_dir / "debug_failed.mp"
                     fail_file.write_text(mp_code)
-                    print(f"  METAPOST failed. Saved to: {fail_file}")
-                    print(f"  stderr: {result.stderr.decode()[:200]}")
+                    self.recorder.log(NORMAL, f"  METAPOST failed. Saved to: {fail_file}")
+                    self.recorder.log(NORMAL, f"  stderr: {result.stderr.decode()[:200]}")
+                    self.recorder.dump(self.debug_dir, 'failed')
                     return None
                 
                 # Find SVG
                 svg_files = list(tmpdir.glob('*.svg'))
                 if not svg_files:
-                    print("  No SVG generated")
+                    self.recorder.record(mp_code, 'no_svg', time.perf_counter() - started,
+                                         param_values, result.stdout)
+                    self.remember_failure(param_values, 'no_svg')
+                    self.recorder.log(NORMAL, "  No SVG generated")
+                    self.recorder.dump(self.debug_dir, 'no_svg')
                     return None
                 
                 # Rasterize
+                self.timeout.observe(time.perf_counter() - started)
                 binary = self.rasterize_svg(svg_files[0])
+                self.recorder.record(mp_code, 'ok', time.perf_counter() - started,
+                                     param_values, result.stdout)
                 return binary
                 
-            except subprocess.TimeoutExpired:
-                # Save timeout code
-                timeout_file = self.output_dir / "debug_timeout.mp"
+            except subprocess.TimeoutExpired as e:
+                self.recorder.record(mp_code, 'timeout', time.perf_counter() - started,
+                                     param_values, e.stdout)
+                self.remember_failure(param_values, 'timeout')
+                self.debug_dir.mkdir(exist_ok=True, parents=True)
+                timeout_file = self.debug_dir / "debug_timeout.mp"
                 timeout_file.write_text(mp_code)
-                print(f"  METAPOST timeout. Saved to: {timeout_file}")
+                self.recorder.log(NORMAL, f"  METAPOST timeout. Saved to: {timeout_file}")
+                self.recorder.dump(self.debug_dir, 'timeout')
                 return None
             except Exception as e:
-                print(f"  Render error: {e}")
+                self.recorder.record(mp_code, 'error', time.perf_counter() - started,
+                                     param_values, str(e))
+                self.telemetry.failure('error')
+                self.recorder.log(NORMAL, f"  Render error: {e}")
+                self.recorder.dump(self.debug_dir, 'error')
                 return None
     
+    def render_metapost_batch(self, param_list: List[Dict[str, float]]) -> List[Optional[np.ndarray]]:
+        """
+        Render several parameter sets in one METAPOST job.
+        
+        Each candidate becomes its own numbered figure, so a whole
+        population pays the process launch once.  Cached candidates and
+        candidates next to a known failure are skipped.  If the batch job
+        fails, the remaining candidates are re-rendered one at a time to
+        isolate (and remember) the bad ones.
+        """
+        return self.render_jobs([(self, params) for params in param_list])
+    
+    def render_jobs(self, jobs: List[Tuple['MetapostOptimizer', Dict[str, float]]]) -> List[Optional[np.ndarray]]:
+        """
+        Batch-render (optimizer, parameters) pairs, e.g. one candidate for
+        every glyph of a joint fit.
+        
+        Each pair is substituted, cached and rasterized by its own
+        optimizer; this one runs the mpost jobs.  Sources with different
+        preambles cannot share a job and are batched separately.
+        """
+        rendered = [None] * len(jobs)
+        sources, keys = {}, {}
+        groups = {}
+        for i, (owner, params) in enumerate(jobs):
+            if owner.native is not None:
+                with self.telemetry.stage('native'):
+                    rendered[i] = owner.native.render_in_frame(params, owner.frame)
+                continue
+            
+            with self.telemetry.stage('substitute'):
+                sources[i] = owner.substitute_parameters(params)
+            with self.telemetry.stage('cache'):
+                keys[i] = owner.cache.key(sources[i], owner.raster_settings)
+                rendered[i] = owner.cache.get(keys[i])
+            if rendered[i] is None and not owner.known_failure(params):
+                groups.setdefault(batch_key(sources[i]), []).append(i)
+        
+        for missing in groups.values():
+            if self.run_batch(jobs, sources, keys, missing, rendered):
+                continue
+            
+            self.recorder.log(NORMAL, "  METAPOST batch failed, rendering candidates individually")
+            for i in missing:
+                owner, params = jobs[i]
+                rendered[i] = owner.run_metapost(sources[i], params)
+                owner.cache.put(keys[i], rendered[i])
+        return rendered
+    
+    def run_batch(self, jobs: list, sources: Dict[int, str], keys: Dict[int, str],
+                  missing: List[int], rendered: list) -> bool:
+        """One mpost job for jobs[missing]; fills rendered, False on failure."""
+        with tempfile.TemporaryDirectory(dir=self.scratch_dir) as tmpdir:
+            tmpdir = Path(tmpdir)
+            
+            mp_file = tmpdir / "batch.mp"
+            batch_source = build_batch_source([sources[i] for i in missing])
+            mp_file.write_text(batch_source)
+            batch_params = [jobs[i][1] for i in missing]
+            
+            started = time.perf_counter()
+            try:
+                with self.telemetry.stage('mpost'):
+                    result = run_mpost(['mpost', '-interaction=nonstopmode', str(mp_file)],
+                                       tmpdir, self.timeout.limit(len(missing)))
+            except subprocess.TimeoutExpired as e:
+                self.recorder.record(batch_source, 'timeout', time.perf_counter() - started,
+                                     batch_params, e.stdout)
+                self.recorder.log(NORMAL, f"  METAPOST batch timeout ({len(missing)} figures)")
+                self.telemetry.failure('batch_timeout')
+                return False
+            except OSError as e:
+                self.recorder.record(batch_source, 'error', time.perf_counter() - started,
+                                     batch_params, str(e))
+                self.telemetry.failure('batch_error')
+                return False
+            
+            if result.returncode != 0:
+                self.recorder.record(batch_source, 'failed', time.perf_counter() - started,
+                                     batch_params, result.stdout + result.stderr)
+                self.telemetry.failure('batch_failed')
+                return False
+            
+            self.timeout.observe(time.perf_counter() - started, len(missing))
+            for index, i in enumerate(missing, start=1):
+                owner = jobs[i][0]
+                svg_file = figure_svg(tmpdir, mp_file.stem, index)
+                rendered[i] = owner.rasterize_svg(svg_file) if svg_file else None
+                owner.cache.put(keys[i], rendered[i])
+            self.recorder.record(batch_source, 'ok', time.perf_counter() - started,
+                                 batch_params, result.stdout)
+            return True
+    
     def validate_template(self):
         """Test that the initial template renders correctly."""
         print("\nValidating template...")
@@ -211,57 +448,78 @@ class MetapostOptimizer:
         
         return True
 
-    def rasterize_svg(self, svg_path: Path, size: int = 500) -> np.ndarray:
-        """Convert SVG to binary image."""
-        png_path = svg_path.with_suffix('.png')
-        
+    def set_resolution(self, scale: float):
+        """Render and compare at `scale` times full resolution."""
+        if scale not in self.target_pyramid:
+            self.target_pyramid[scale] = self.targets.mask(scale)
+        
+        self.target_image = self.target_pyramid[scale]
+        height, width = self.target_image.shape
+        self.frame = self.base_frame.scaled(width, height)
+        self.raster_settings['frame'] = self.frame.settings()
+    
+    def rasterize_svg(self, svg_path: Path) -> np.ndarray:
+        """Convert SVG to a binary image in the current frame (in-process)."""
         try:
-            # Try ImageMagick
-            subprocess.run([
-                'convert',
-                '-density', '300',
-                '-background', 'white',
-                '-flatten',
-                str(svg_path),
-                str(png_path)
-            ], check=True, capture_output=True, timeout=5)
-            
-        except:
-            # Try Inkscape
-            try:
-                subprocess.run([
-                    'inkscape',
-                    str(svg_path),
-                    '--export-type=png',
-                    f'--export-filename={png_path}',
-                    '--export-width=500',
-                    '--export-height=500'
-                ], check=True, capture_output=True, timeout=5)
-            except:
-                return None
-        
-        # Load and process
-        img = cv2.imread(str(png_path), cv2.IMREAD_GRAYSCALE)
-        if img is None:
+            with self.telemetry.stage('rasterize'):
+                return svg_raster.rasterize_in_frame(svg_path, self.frame)
+        except (ET.ParseError, ValueError, KeyError) as e:
+            self.recorder.log(NORMAL, f"  Could not rasterize {svg_path.name}: {e}")
+            return None
+    
+    def history_key(self) -> str:
+        """Evaluation-history context at the current resolution."""
+        return history_context(self.history_base, self.frame.settings())
+    
+    def chamfer_target(self, target: np.ndarray) -> ChamferTarget:
+        """Distance transform of a target level, computed on first use."""
+        if target.shape not in self.chamfer_targets:
+            # Pyramid levels have their distance maps in the target cache
+            scale = next((s for s, level in self.target_pyramid.items()
+                          if level.shape == target.shape), None)
+            to_ink = self.targets.distance(scale) if scale is not None else None
+            self.chamfer_targets[target.shape] = ChamferTarget(target, to_ink)
+        return self.chamfer_targets[target.shape]
+    
+    def registration(self, rendered: Optional[np.ndarray],
+                     target: np.ndarray) -> Optional[Registration]:
+        """Transform registering a render onto target; None if off or blank."""
+        if self.register == 'none' or rendered is None:
             return None
         
-        img = cv2.resize(img, (size, size))
-        _, binary = cv2.threshold(img, 128, 255, cv2.THRESH_BINARY_INV)
-        
-        return binary
+        with self.telemetry.stage('register'):
+            frame = self.base_frame.scaled(target.shape[1], target.shape[0])
+            if target.shape not in self.target_moments:
+                self.target_moments[target.shape] = ink_moments(target, frame)
+            moments = ink_moments(rendered, frame)
+            if moments is None or self.target_moments[target.shape] is None:
+                return None
+            return solve(moments, self.target_moments[target.shape], self.register)
+    
+    def align(self, rendered: Optional[np.ndarray], target: np.ndarray) -> Optional[np.ndarray]:
+        """Render registered onto target (unchanged without registration)."""
+        registration = self.registration(rendered, target)
+        if registration is None:
+            return rendered
+        with self.telemetry.stage('register'):
+            return warp(rendered, registration,
+                        self.base_frame.scaled(target.shape[1], target.shape[0]))
     
     def compare_images(self, rendered: np.ndarray, target: np.ndarray) -> float:
         """Compare rendered to target. Lower is better."""
         if rendered is None:
             return 10.0
         
-        # Resize to match
-        if rendered.shape != target.shape:
-            rendered = cv2.resize(rendered, (target.shape[1], target.shape[0]))
+        rendered = self.align(rendered, target)
         
-        # Pixel overlap
-        intersection = np.sum((rendered > 0) & (target > 0))
-        union = np.sum((rendered > 0) | (target > 0))
+        # Renders are drawn in the target's frame, so no resampling
+        with self.telemetry.stage('compare'):
+            if self.objective == 'chamfer':
+                return self.chamfer_target(target).distance(rendered)
+            
+            # Pixel overlap
+            intersection = np.sum((rendered > 0) & (target > 0))
+            union = np.sum((rendered > 0) | (target > 0))
         
         if union == 0:
             return 1.0
@@ -269,9 +527,8 @@ class MetapostOptimizer:
         iou = intersection / union
         return 1.0 - iou
     
-    def objective_function(self, param_array: np.ndarray) -> float:
-        """Objective function for optimization."""
-        # Map array to parameter dict
+    def param_dict(self, param_array: np.ndarray) -> Dict[str, float]:
+        """Map free-parameter array to a full parameter dict."""
         param_dict = {}
         free_params = [p for p in self.parameters if p.optimizable]
         
@@ -283,18 +540,225 @@ class MetapostOptimizer:
             if not param.optimizable:
                 param_dict[param.name] = param.value
         
+        return param_dict
+    
+    def objective_function(self, param_array: np.ndarray) -> float:
+        """Objective function for optimization."""
+        self.telemetry.begin(self.cache)
+        param_dict = self.param_dict(param_array)
+        
         # Render
         rendered = self.render_metapost(param_dict)
         
         # Compare
         error = self.compare_images(rendered, self.target_image)
+        with self.telemetry.stage('history'):
+            self.history.append(self.history_key(), [(param_dict, error)])
+        self.telemetry.end([error], render_size=self.frame.label)
         
-        print(f"  Error: {error:.4f}")
+        self.recorder.log(VERBOSE, f"  Error: {error:.4f}")
         
         return error
     
-    def optimize(self, method='nelder-mead', max_iter=50):
-        """Run optimization."""
+    def objective_function_batch(self, param_matrix: np.ndarray) -> np.ndarray:
+        """
+        Vectorized objective for differential_evolution(vectorized=True).
+        
+        param_matrix has shape (n_free, S); returns S errors.
+        """
+        self.telemetry.begin(self.cache)
+        param_list = [self.param_dict(column) for column in param_matrix.T]
+        rendered = self.render_metapost_batch(param_list)
+        
+        errors = np.array([self.compare_images(r, self.target_image) for r in rendered])
+        with self.telemetry.stage('history'):
+            self.history.append(self.history_key(), list(zip(param_list, errors)))
+        self.telemetry.end(errors, render_size=self.frame.label)
+        self.recorder.log(NORMAL, f"  Batch of {len(errors)}: best error {errors.min():.4f}")
+        
+        return errors
+    
+    def run_method(self, method: str, x0: np.ndarray, bounds: List[Tuple[float, float]],
+                   max_iter: int, batch: bool, workers: Optional[int],
+                   warm_start: bool = False, rng: Optional[np.random.Generator] = None,
+                   checkpoint: Optional[Checkpoint] = None):
+        """
+        Dispatch to the scipy optimizer; returns its OptimizeResult.
+        
+        With warm_start, differential_evolution seeds its population
+        with x0 (the previous stage's best).  For 'surrogate', max_iter
+        counts acquisition rounds of one rendered batch each.
+        
+        With a checkpoint, progress is recorded after every generation,
+        iteration or round, and a stage interrupted in an earlier run
+        continues from the saved population, or for Nelder-Mead from an
+        approximate simplex of the best points seen.
+        """
+        rng = rng or np.random.default_rng()
+        seed = x0 if warm_start else None
+        base_nfev = checkpoint['nfev'] if checkpoint else 0
+        done = checkpoint.iterations_done() if checkpoint else 0
+        max_iter = max(max_iter - done, 0)
+        
+        # Objective evaluations, counted here: with vectorized=True scipy's
+        # nfev counts a whole population as one
+        evaluations = 0
+        
+        def counted(objective, vectorized=False):
+            def wrapper(x):
+                nonlocal evaluations
+                x = np.asarray(x)
+                evaluations += x.shape[1] if vectorized and x.ndim == 2 else 1
+                return objective(x)
+            return wrapper
+        
+        def counted_map(pool):
+            def map_points(func, points):
+                nonlocal evaluations
+                points = list(points)
+                evaluations += len(points)
+                return pool.map(func, points)
+            return map_points
+        
+        def progress(intermediate_result, **method_state):
+            if checkpoint is None:
+                return
+            checkpoint.improve(intermediate_result.x, intermediate_result.fun)
+            checkpoint.update(nfev=base_nfev + evaluations,
+                              rng=rng.bit_generator.state, method_state=method_state)
+        
+        if method == 'nelder-mead':
+            # Local optimization; scipy's callback only sees the best
+            # vertex, so resume gets an approximate simplex of the best
+            # points evaluated
+            tracker = SimplexTracker(len(x0))
+            simplex = checkpoint.stage_state('simplex') if checkpoint else None
+            iterations = 0
+            
+            def objective(x):
+                error = self.objective_function(x)
+                tracker.add(x, error)
+                return error
+            
+            def iteration_done(intermediate_result):
+                nonlocal iterations
+                iterations += 1
+                progress(intermediate_result, simplex=tracker.simplex(), nit=done + iterations)
+            
+            result = minimize(
+                counted(objective),
+                x0,
+                method='Nelder-Mead',
+                callback=iteration_done,
+                options={'maxiter': max_iter, 'disp': True, 'initial_simplex': simplex}
+            )
+        elif method == 'differential_evolution':
+            # Global optimization; a saved population replaces the
+            # initial sampling
+            population = checkpoint.stage_state('population') if checkpoint else None
+            
+            def generation_done(intermediate_result):
+                progress(intermediate_result,
+                         population=intermediate_result.population,
+                         energies=intermediate_result.population_energies,
+                         nit=done + intermediate_result.nit)
+            
+            options = dict(maxiter=max_iter, popsize=5,
+                           x0=seed if population is None else None,
+                           init='latinhypercube' if population is None else population,
+                           seed=rng, callback=generation_done, disp=True)
+            
+            workers = workers or available_cores()
+            if workers > 1:
+                print(f"Evaluating on {workers} worker processes")
+                with ParallelObjective(self, workers) as pool:
+                    if batch:
+                        # One METAPOST job per worker per generation
+                        result = differential_evolution(
+                            counted(pool.batch, vectorized=True),
+                            bounds,
+                            vectorized=True,
+                            updating='deferred',
+                            **options
+                        )
+                    else:
+                        result = differential_evolution(
+                            evaluate_one,
+                            bounds,
+                            workers=counted_map(pool),
+                            updating='deferred',
+                            **options
+                        )
+            elif batch:
+                # One METAPOST job per generation
+                result = differential_evolution(
+                    counted(self.objective_function_batch, vectorized=True),
+                    bounds,
+                    vectorized=True,
+                    updating='deferred',
+                    **options
+                )
+            else:
+                result = differential_evolution(
+                    counted(self.objective_function),
+                    bounds,
+                    workers=1,
+                    **options
+                )
+        elif method == 'surrogate':
+            # RBF model over all evaluations, including earlier runs; a
+            # resumed stage picks its points up from the history
+            free_names = [p.name for p in self.parameters if p.optimizable]
+            fixed = {p.name: p.value for p in self.parameters if not p.optimizable}
+            history = self.history.load(self.history_key(), free_names, fixed)
+            
+            def round_done(intermediate_result):
+                progress(intermediate_result, nit=done + intermediate_result.nit)
+            
+            workers = workers or available_cores()
+            batch_size = max(self.surrogate_batch, workers)
+            if workers > 1:
+                print(f"Evaluating on {workers} worker processes")
+                with ParallelObjective(self, workers) as pool:
+                    result = surrogate_minimize(counted(pool.batch, vectorized=True), bounds, x0, max_rounds=max_iter,
+                                                batch_size=batch_size, history=history,
+                                                seed=rng, callback=round_done)
+            else:
+                result = surrogate_minimize(counted(self.objective_function_batch, vectorized=True),
+                                            bounds, x0,
+                                            max_rounds=max_iter, batch_size=batch_size,
+                                            history=history, seed=rng, callback=round_done)
+        
+        if checkpoint is not None:
+            checkpoint.state['nfev'] = base_nfev + evaluations
+        result.nfev = evaluations
+        return result
+    
+    def checkpoint_context(self, method: str, schedule: list) -> str:
+        """What a checkpoint's state depends on."""
+        return history_context(self.history_base, method, schedule,
+                               [(p.name, p.min_val, p.max_val) for p in self.parameters])
+    
+    def optimize(self, method='nelder-mead', max_iter=50, batch=True,
+                 workers: Optional[int] = None, schedule: Optional[list] = None,
+                 resume: bool = False, checkpoint_interval: float = 60.0):
+        """
+        Run optimization.
+        
+        differential_evolution and surrogate candidates are spread over
+        `workers` processes (default: all available cores; 1 evaluates
+        in-process).
+        
+        `schedule` is a list of (scale, iterations) resolution stages
+        (see multires); each stage starts from the previous stage's best.
+        Stages without an iteration count use max_iter for Nelder-Mead
+        and 20 generations or rounds otherwise.
+        
+        Progress is checkpointed to output_dir/checkpoint.json every
+        `checkpoint_interval` seconds; with `resume`, a matching
+        checkpoint is continued instead of starting over.
+        """
+        schedule = schedule or [(1.0, None)]
         free_params = [p for p in self.parameters if p.optimizable]
         
         print(f"\nOptimizing {len(free_params)} free parameters...")
@@ -306,27 +770,51 @@ class MetapostOptimizer:
         # Bounds
         bounds = [(p.min_val, p.max_val) for p in free_params]
         
-        if method == 'nelder-mead':
-            # Local optimization
-            result = minimize(
-                self.objective_function,
-                x0,
-                method='Nelder-Mead',
-                options={'maxiter': max_iter, 'disp': True}
-            )
-            best_params = result.x
+        checkpoint_path = self.output_dir / CHECKPOINT_NAME
+        context = self.checkpoint_context(method, schedule)
+        if resume:
+            checkpoint = Checkpoint.resume(checkpoint_path, context, checkpoint_interval)
+        else:
+            checkpoint = Checkpoint(checkpoint_path, context, checkpoint_interval)
+        
+        rng = np.random.default_rng()
+        if checkpoint['rng'] is not None:
+            rng.bit_generator.state = checkpoint['rng']
+        
+        x = checkpoint.array('x') if checkpoint['x'] is not None else x0
+        fun = checkpoint['fun']
+        for stage, (scale, iterations) in enumerate(schedule):
+            if stage < checkpoint['stage']:
+                continue
             
-        elif method == 'differential_evolution':
-            # Global optimization
-            result = differential_evolution(
-                self.objective_function,
-                bounds,
-                maxiter=20,
-                popsize=5,
-                workers=1,
-                disp=True
-            )
-            best_params = result.x
+            self.set_resolution(scale)
+            if len(schedule) > 1:
+                print(f"\nStage {stage + 1}/{len(schedule)}: "
+                      f"{self.frame.label} renders and target, "
+                      f"{self.frame.pixels_per_unit:.3g} px/unit")
+            
+            if iterations is None:
+                iterations = max_iter if method == 'nelder-mead' else 20
+            
+            # Errors at different resolutions are not comparable
+            if checkpoint['method_state'] is None:
+                checkpoint.state['fun'] = None
+            
+            try:
+                result = self.run_method(method, x, bounds, iterations, batch, workers,
+                                         warm_start=stage > 0, rng=rng, checkpoint=checkpoint)
+            except KeyboardInterrupt:
+                checkpoint.save()
+                print(f"\nCheckpoint saved to {checkpoint_path}; continue with --resume")
+                self.recorder.dump(self.debug_dir, 'interrupt')
+                self.set_resolution(1.0)
+                raise
+            x, fun = result.x, result.fun
+            checkpoint.finish_stage(x, fun)
+        
+        # Comparisons after optimizing are at full resolution
+        self.set_resolution(1.0)
+        best_params = x
         
         # Map back to dict
         optimized = {}
@@ -340,32 +828,40 @@ class MetapostOptimizer:
         
         print("\n" + "=" * 60)
         print("OPTIMIZATION COMPLETE")
-        print(f"Final error: {result.fun:.4f}")
+        print(f"Final error: {fun:.4f} ({checkpoint['nfev']} evaluations)")
         print("=" * 60)
+        self.cache.report()
+        self.failures.report()
         
         return optimized
     
     def save_optimized(self, optimized_params: Dict[str, float]):
-        """Save optimized METAPOST."""
+        """Save optimized METAPOST, with the solved registration baked in."""
         optimized_code = self.substitute_parameters(optimized_params)
         
+        rendered = self.render_metapost(optimized_params)
+        registration = self.registration(rendered, self.target_image)
+        if registration is not None:
+            print(f"\nRegistration: {registration.describe()}")
+            optimized_code = bake(optimized_code, registration)
+        
         output_file = self.output_dir / "optimized.mp"
         output_file.write_text(optimized_code)
         
         print(f"\nSaved optimized METAPOST: {output_file}")
         
+        # Specimen pixel <-> METAPOST unit mapping of the fit
+        self.base_frame.save(self.output_dir / FRAME_NAME)
+        print(f"Saved render frame: {self.output_dir / FRAME_NAME}")
+        
         # Render comparison
-        rendered = self.render_metapost(optimized_params)
         if rendered is not None:
-            self.save_comparison(rendered)
+            self.save_comparison(self.align(rendered, self.target_image))
     
     def save_comparison(self, rendered: np.ndarray):
         """Save side-by-side comparison."""
         import matplotlib.pyplot as plt
         
-        if rendered.shape != self.target_image.shape:
-            rendered = cv2.resize(rendered, (self.target_image.shape[1], self.target_image.shape[0]))
-        
         fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(12, 6))
         
         ax1.imshow(self.target_image, cmap='gray')
@@ -394,24 +890,84 @@ def main():
                        help='Parameter metadata JSON')
     parser.add_argument('--output', type=Path, default=Path('optimized_output'),
                        help='Output directory')
-    parser.add_argument('--method', choices=['nelder-mead', 'differential_evolution'],
+    parser.add_argument('--method', choices=['nelder-mead', 'differential_evolution', 'surrogate'],
                        default='nelder-mead', help='Optimization method')
     parser.add_argument('--max-iter', type=int, default=50, help='Maximum iterations')
+    parser.add_argument('--no-batch', action='store_true',
+                       help='Render differential_evolution candidates one mpost job at a time')
+    parser.add_argument('--cache-dir', type=Path, default=None,
+                       help='Render cache directory (default: <output>/render_cache)')
+    parser.add_argument('--cache-size', type=float, default=256,
+                       help='Render cache size cap in MB')
+    parser.add_argument('--workers', type=int, default=None,
+                       help='Worker processes for differential_evolution (default: all cores)')
+    parser.add_argument('--objective', choices=['iou', 'chamfer'], default='iou',
+                       help='1 - IoU, or symmetric chamfer distance (has a slope even '
+                            'when strokes do not overlap, but ignores stroke weight)')
+    parser.add_argument('--history', type=Path, default=None,
+                       help='Evaluation history JSONL (default: <output>/evaluations.jsonl)')
+    parser.add_argument('--surrogate-batch', type=int, default=8,
+                       help='Candidates rendered per surrogate round')
+    parser.add_argument('--schedule', type=parse_schedule, default=parse_schedule(DEFAULT_SCHEDULE),
+                       help='Coarse-to-fine stages as scale[:iterations],... '
+                            f'(default: {DEFAULT_SCHEDULE}; "1" for full resolution only)')
+    parser.add_argument('--verbosity', type=int, choices=[0, 1, 2, 3], default=NORMAL,
+                       help='0 silent, 1 failures/summaries, 2 every evaluation, 3 full mpost I/O')
+    parser.add_argument('--flight-size', type=int, default=32,
+                       help='Evaluations kept in memory for failure dumps')
+    parser.add_argument('--renderer', choices=['mpost', 'native'], default='mpost',
+                       help='Render with mpost or the in-process Hobby-spline engine')
+    parser.add_argument('--conformance', action='store_true',
+                       help='Cross-check the native renderer against mpost before optimizing')
+    parser.add_argument('--resume', action='store_true',
+                       help='Continue from <output>/checkpoint.json if it matches this run')
+    parser.add_argument('--checkpoint-interval', type=float, default=60.0,
+                       help='Seconds between checkpoints')
+    parser.add_argument('--target-cache', type=Path, default=None,
+                       help='Preprocessed specimen cache (default: <output>/target_cache)')
+    parser.add_argument('--register', choices=list(REGISTRATION_MODES), default='none',
+                       help='Solve placement and uniform or per-axis scale from image '
+                            'moments instead of searching x_scale/y_scale')
+    parser.add_argument('--telemetry', type=Path, default=None,
+                       help='Append per-evaluation stage timings to this JSONL file '
+                            '(summarize with telemetry.py)')
     
     args = parser.parse_args()
     
+    renderer = args.renderer
+    if renderer == 'native' and args.conformance:
+        print("Checking native renderer against mpost...")
+        score = conformance_check(args.template)
+        if score is None or score < 0.98:
+            print("Native renderer does not match mpost for this template, using mpost")
+            renderer = 'mpost'
+    
     optimizer = MetapostOptimizer(
         metapost_template=args.template,
         metadata_file=args.metadata,
         specimen_path=args.specimen,
-        output_dir=args.output
+        output_dir=args.output,
+        cache_dir=args.cache_dir,
+        cache_size_mb=args.cache_size,
+        renderer=renderer,
+        flight_size=args.flight_size,
+        verbosity=args.verbosity,
+        objective=args.objective,
+        history_path=args.history,
+        surrogate_batch=args.surrogate_batch,
+        telemetry_path=args.telemetry,
+        target_cache_dir=args.target_cache,
+        register=args.register
     )
 
     if not optimizer.validate_template():
         print("\nFix the template before optimizing!")
         return
     
-    optimized = optimizer.optimize(method=args.method, max_iter=args.max_iter)
+    optimized = optimizer.optimize(method=args.method, max_iter=args.max_iter,
+                                   batch=not args.no_batch, workers=args.workers,
+                                   schedule=args.schedule, resume=args.resume,
+                                   checkpoint_interval=args.checkpoint_interval)
     optimizer.save_optimized(optimized)
 
 if __name__ == '__main__':
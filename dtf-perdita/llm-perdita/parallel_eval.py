@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# parallel_eval.py
+"""
+Process-pool evaluation of optimizer objectives.
+
+Each worker process gets its own copy of the optimizer at pool start-up
+and its own mpost scratch directory, inside a temporary directory the
+pool removes on exit, so concurrent renders never share files.  Debug
+artifacts go to output_dir/worker-<pid>/, created only when a worker has
+something to save.  Objectives
+are reached through module-level functions because bound methods and
+lambdas would ship the whole optimizer with every task.
+"""
+
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable, Iterable, List
+
+import numpy as np
+
+# The optimizer copy owned by this worker process
+_optimizer = None
+
+
+def available_cores() -> int:
+    """CPUs this process may run on."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def _init_worker(optimizer, scratch_root: str):
+    global _optimizer
+    _optimizer = optimizer
+
+    optimizer.debug_dir = optimizer.output_dir / f"worker-{os.getpid()}"
+    optimizer.scratch_dir = Path(scratch_root) / f"worker-{os.getpid()}"
+    optimizer.scratch_dir.mkdir()
+
+
+def _cache_counts():
+    return _optimizer.cache.hits, _optimizer.cache.misses
+
+
+def _interrupted():
+    _optimizer.recorder.dump(_optimizer.debug_dir, 'interrupt')
+
+
+def _evaluate_batch(args):
+    """Vectorized objective on one chunk of the population."""
+    hits, misses = _cache_counts()
+    try:
+        errors = _optimizer.objective_function_batch(*args)
+    except KeyboardInterrupt:
+        _interrupted()
+        raise
+    new_hits, new_misses = _cache_counts()
+    return errors, new_hits - hits, new_misses - misses
+
+
+def _evaluate_call(task):
+    """Apply a picklable callable (e.g. scipy's wrapped objective) to x."""
+    func, x = task
+    hits, misses = _cache_counts()
+    try:
+        value = func(x)
+    except KeyboardInterrupt:
+        _interrupted()
+        raise
+    new_hits, new_misses = _cache_counts()
+    return value, new_hits - hits, new_misses - misses
+
+
+def evaluate_one(x: np.ndarray, *args) -> float:
+    """Scalar objective in a worker; pass as func with workers=pool.map."""
+    return _optimizer.objective_function(x, *args)
+
+
+class ParallelObjective:
+    """
+    Spread objective evaluations over a process pool.
+
+    Use `batch` as a vectorized differential_evolution objective, or
+    `evaluate_one` with `workers=pool.map` for one render per candidate.
+    """
+
+    def __init__(self, optimizer, workers: int, args: tuple = ()):
+        self.optimizer = optimizer
+        self.workers = workers
+        self.args = args
+        self.scratch = tempfile.TemporaryDirectory(prefix="workers-", dir=optimizer.output_dir)
+        self.pool = ProcessPoolExecutor(max_workers=workers,
+                                        initializer=_init_worker,
+                                        initargs=(optimizer, self.scratch.name))
+
+    def _count(self, hits: int, misses: int):
+        # Cache counters live in the workers; mirror them for the report
+        self.optimizer.cache.hits += hits
+        self.optimizer.cache.misses += misses
+
+    def batch(self, param_matrix: np.ndarray) -> np.ndarray:
+        """Split (n_params, S) columns into one chunk per worker."""
+        chunks = [c for c in np.array_split(param_matrix, self.workers, axis=1) if c.shape[1]]
+        errors = []
+        for chunk_errors, hits, misses in self.pool.map(_evaluate_batch,
+                                                        [(c,) + self.args for c in chunks]):
+            errors.append(chunk_errors)
+            self._count(hits, misses)
+        return np.concatenate(errors)
+
+    def map(self, func: Callable, iterable: Iterable) -> List[float]:
+        """Map-like callable for differential_evolution(workers=...)."""
+        values = []
+        for value, hits, misses in self.pool.map(_evaluate_call, [(func, x) for x in iterable]):
+            values.append(value)
+            self._count(hits, misses)
+        return values
+
+    def close(self):
+        self.pool.shutdown()
+        self.scratch.cleanup()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# registration.py
+"""
+Closed-form registration of renders to the specimen.
+
+Global placement - where the glyph sits and how large it is - is solved
+from image moments instead of searched for.  The ink centroids give the
+translation and the ratio of the ink's standard deviations along each
+axis gives the scale:
+
+    uniform      one scale factor (geometric mean of the two ratios)
+    anisotropic  separate x and y factors
+
+The transform is taken in METAPOST units (see render_frame), as
+
+    x' = x_scale * x + x_shift,   y' = y_scale * y + y_shift
+
+which is what `currentpicture := currentpicture xscaled .. yscaled ..
+shifted (..)` does to the whole picture, pens included.  Before scoring
+a render is warped by it (nearest neighbour, so the mask stays binary);
+bake() appends the same transform to the final source, so optimized.mp
+renders the registered glyph.
+
+Moments are used rather than bounding boxes: a speck of dust in the
+specimen moves a bounding box but hardly the second moments.
+"""
+
+import re
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+import cv2
+import numpy as np
+
+MODES = ('none', 'uniform', 'anisotropic')
+
+# Registrations beyond this factor are degenerate renders (e.g. a dot),
+# not glyphs to be rescaled
+MAX_SCALE = 2.0
+
+# (area, centroid x, centroid y, sd x, sd y) in METAPOST units
+Moments = Tuple[float, float, float, float, float]
+
+
+@dataclass(frozen=True)
+class Registration:
+    """Picture transform in METAPOST units."""
+    x_scale: float = 1.0
+    y_scale: float = 1.0
+    x_shift: float = 0.0
+    y_shift: float = 0.0
+
+    def metapost(self) -> str:
+        return (f"currentpicture := currentpicture xscaled {self.x_scale:.6f} "
+                f"yscaled {self.y_scale:.6f} shifted ({self.x_shift:.4f}, {self.y_shift:.4f});")
+
+    def describe(self) -> str:
+        return (f"scale {self.x_scale:.4f} x {self.y_scale:.4f}, "
+                f"shift ({self.x_shift:+.2f}, {self.y_shift:+.2f}) units")
+
+
+def ink_moments(mask: np.ndarray, frame) -> Optional[Moments]:
+    """Area, centroid and spread of the ink in a frame's METAPOST units."""
+    m = cv2.moments(np.ascontiguousarray(mask), binaryImage=True)
+    if m['m00'] == 0:
+        return None
+
+    unit = frame.pixels_per_unit
+    # Moments count pixel indices; pixel i covers [i, i + 1)
+    cx, cy = frame.to_metapost(m['m10'] / m['m00'] + 0.5, m['m01'] / m['m00'] + 0.5)
+    sd_x = np.sqrt(m['mu20'] / m['m00']) / unit
+    sd_y = np.sqrt(m['mu02'] / m['m00']) / unit
+    return m['m00'] / unit ** 2, cx, cy, sd_x, sd_y
+
+
+def solve(rendered: Moments, target: Moments, mode: str) -> Registration:
+    """Transform moving the rendered ink's moments onto the target's."""
+    _, rx, ry, rsx, rsy = rendered
+    _, tx, ty, tsx, tsy = target
+
+    x_scale = tsx / rsx if rsx > 0 else 1.0
+    y_scale = tsy / rsy if rsy > 0 else 1.0
+    if mode == 'uniform' or rsx == 0 or rsy == 0:
+        x_scale = y_scale = np.sqrt(x_scale * y_scale)
+    x_scale = float(np.clip(x_scale, 1 / MAX_SCALE, MAX_SCALE))
+    y_scale = float(np.clip(y_scale, 1 / MAX_SCALE, MAX_SCALE))
+
+    return Registration(x_scale, y_scale, float(tx - x_scale * rx), float(ty - y_scale * ry))
+
+
+def warp(mask: np.ndarray, registration: Registration, frame) -> np.ndarray:
+    """Apply a registration to a raster drawn in `frame`."""
+    s = frame.pixels_per_unit
+    ox, oy = frame.origin_x, frame.origin_y
+    sx, sy = registration.x_scale, registration.y_scale
+    # Pixel index c has its center at METAPOST x = (c + 0.5 - ox) / s
+    matrix = np.array([
+        [sx, 0.0, (sx - 1) * (0.5 - ox) + registration.x_shift * s],
+        [0.0, sy, (sy - 1) * (0.5 - oy) - registration.y_shift * s],
+    ])
+    height, width = mask.shape
+    return cv2.warpAffine(np.ascontiguousarray(mask), matrix, (width, height),
+                          flags=cv2.INTER_NEAREST, borderValue=0)
+
+
+def bake(source: str, registration: Registration) -> str:
+    """Append the transform to the last figure of a METAPOST source."""
+    statement = (f"% Registration solved from image moments: {registration.describe()}\n"
+                 f"{registration.metapost()}\n")
+    ends = list(re.finditer(r'^\s*endfig\b', source, re.MULTILINE))
+    if not ends:
+        return source + '\n' + statement
+    at = ends[-1].start()
+    return source[:at] + statement + source[at:]
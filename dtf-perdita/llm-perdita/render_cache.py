@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# render_cache.py
+"""
+Content-addressed on-disk cache for METAPOST -> raster evaluations.
+
+Entries are keyed by a hash of the fully substituted METAPOST source plus
+the rasterization settings, and stored as compressed .npz files.  Reads
+refresh an entry's mtime, so eviction by oldest mtime is LRU.
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Dict, Optional
+
+import numpy as np
+
+
+class RenderCache:
+    """Size-capped LRU cache of binary rasters."""
+
+    def __init__(self, cache_dir: Path, max_bytes: int = 256 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.cache_dir.mkdir(exist_ok=True, parents=True)
+        self.max_bytes = max_bytes
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._size = sum(f.stat().st_size for f in self.cache_dir.glob('*.npz'))
+
+    @staticmethod
+    def key(mp_source: str, settings: Dict) -> str:
+        """Hash of the METAPOST source and rasterization settings."""
+        digest = hashlib.sha256()
+        digest.update(mp_source.encode('utf-8'))
+        digest.update(json.dumps(settings, sort_keys=True).encode('utf-8'))
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.npz"
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        """Return the cached raster, or None on a miss."""
+        path = self._path(key)
+
+        try:
+            with np.load(path) as data:
+                raster = data['raster']
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except Exception:
+            # Truncated or corrupt entry - drop it and re-render
+            path.unlink(missing_ok=True)
+            self.misses += 1
+            return None
+
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+        self.hits += 1
+        return raster
+
+    def put(self, key: str, raster: Optional[np.ndarray]):
+        """Store a raster.  Failed renders (None) are not cached."""
+        if raster is None:
+            return
+
+        path = self._path(key)
+        tmp_path = path.with_name(f"{key}.{os.getpid()}.tmp")
+
+        with open(tmp_path, 'wb') as f:
+            np.savez_compressed(f, raster=raster)
+
+        # Overwriting an entry (e.g. another worker's) replaces its size
+        try:
+            self._size -= path.stat().st_size
+        except FileNotFoundError:
+            pass
+        os.replace(tmp_path, path)
+
+        self._size += path.stat().st_size
+        self.evict()
+
+    def evict(self):
+        """Remove least recently used entries until under the size cap."""
+        if self._size <= self.max_bytes:
+            return
+
+        entries = []
+        for f in self.cache_dir.glob('*.npz'):
+            try:
+                stat = f.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, f))
+
+        entries.sort()
+        self._size = sum(size for _, size, _ in entries)
+
+        for _, size, f in entries:
+            if self._size <= self.max_bytes:
+                break
+            f.unlink(missing_ok=True)
+            self._size -= size
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, float]:
+        """Hit/miss statistics for this session."""
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'size_mb': self._size / (1024 * 1024),
+        }
+
+    def report(self):
+        """Print hit/miss statistics."""
+        s = self.stats()
+        print(f"Render cache: {s['hits']} hits, {s['misses']} misses "
+              f"({100 * s['hit_rate']:.1f}% hit rate), "
+              f"{s['evictions']} evicted, {s['size_mb']:.1f} MB in {self.cache_dir}")
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# render_frame.py
+"""
+Fixed coordinate frames for rendering straight into the specimen's pixels.
+
+A RenderFrame is the affine map from METAPOST coordinates to a
+(height, width) raster, with pixel (row, column) covering
+[row, row + 1) x [column, column + 1):
+
+    column = origin_x + x * pixels_per_unit
+    row    = origin_y - y * pixels_per_unit
+
+The scale is the same on both axes, so renders keep their aspect ratio,
+and the frame does not depend on the rendered picture: moving a point
+or changing x_scale moves ink in the raster instead of re-stretching the
+picture's bounding box over the canvas.  Candidates are drawn at the
+target's shape, so comparisons never resample.
+
+Templates traced with interactive-path-editor.py use the specimen's
+pixels with (0, 0) at the image center (RenderFrame.specimen).  Other
+templates get a frame fitted once from a reference bounding box
+(RenderFrame.fit).  The frame is saved next to the optimized source
+(FRAME_NAME) so pixel positions map back to METAPOST units exactly.
+"""
+
+import json
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Dict, Tuple
+
+import numpy as np
+
+FRAME_NAME = "render_frame.json"
+
+# (llx, lly, urx, ury) in METAPOST units
+BoundingBox = Tuple[float, float, float, float]
+
+
+@dataclass(frozen=True)
+class RenderFrame:
+    """METAPOST coordinates -> pixels of a (height, width) raster."""
+    width: int
+    height: int
+    pixels_per_unit: float
+    origin_x: float
+    origin_y: float
+
+    @classmethod
+    def specimen(cls, image_width: int, image_height: int) -> 'RenderFrame':
+        """One unit per pixel, (0, 0) at the image center."""
+        return cls(image_width, image_height, 1.0, image_width / 2, image_height / 2)
+
+    @classmethod
+    def fit(cls, bbox: BoundingBox, box: Tuple[float, float, float, float],
+            width: int, height: int) -> 'RenderFrame':
+        """
+        Frame placing `bbox` centered in the pixel box (left, top, right,
+        bottom) of a (height, width) raster, as large as fits without
+        changing its aspect ratio.
+        """
+        llx, lly, urx, ury = bbox
+        left, top, right, bottom = box
+        if urx <= llx or ury <= lly or right <= left or bottom <= top:
+            raise ValueError(f"Cannot fit bounding box {bbox} into {box}")
+
+        scale = min((right - left) / (urx - llx), (bottom - top) / (ury - lly))
+        origin_x = (left + right) / 2 - (llx + urx) / 2 * scale
+        origin_y = (top + bottom) / 2 + (lly + ury) / 2 * scale
+        return cls(width, height, scale, origin_x, origin_y)
+
+    @classmethod
+    def load(cls, path: Path) -> 'RenderFrame':
+        data = json.loads(path.read_text())
+        return cls(**{key: data[key] for key in cls.__dataclass_fields__})
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self.height, self.width
+
+    @property
+    def label(self) -> str:
+        return f"{self.width}x{self.height}"
+
+    def scaled(self, width: int, height: int) -> 'RenderFrame':
+        """
+        The same frame on a (height, width) resampling of its raster,
+        e.g. a target pyramid level; rounding of the level's size is
+        absorbed by centering, not by stretching one axis.
+        """
+        factor = min(width / self.width, height / self.height)
+        return RenderFrame(width, height, self.pixels_per_unit * factor,
+                           self.origin_x * factor + (width - self.width * factor) / 2,
+                           self.origin_y * factor + (height - self.height * factor) / 2)
+
+    def to_pixel(self) -> np.ndarray:
+        """[scale, offset] for svg_raster: pixel = point * scale + offset."""
+        s = self.pixels_per_unit
+        return np.array([[s, -s], [self.origin_x, self.origin_y]])
+
+    def svg_to_pixel(self, bbox: BoundingBox) -> np.ndarray:
+        """
+        [scale, offset] for the user space of a METAPOST SVG, which puts
+        (x, y) at (x - llx, ury - y) of the picture's bounding box.
+        """
+        llx, _, _, ury = bbox
+        s = self.pixels_per_unit
+        return np.array([[s, s], [self.origin_x + llx * s, self.origin_y - ury * s]])
+
+    def to_metapost(self, column: float, row: float) -> Tuple[float, float]:
+        """Inverse map: raster position -> METAPOST (x, y)."""
+        return ((column - self.origin_x) / self.pixels_per_unit,
+                (self.origin_y - row) / self.pixels_per_unit)
+
+    def settings(self) -> Dict:
+        """Plain dict, for cache keys and history contexts."""
+        return asdict(self)
+
+    def save(self, path: Path):
+        data = {**self.settings(),
+                'column': 'origin_x + x * pixels_per_unit',
+                'row': 'origin_y - y * pixels_per_unit'}
+        path.write_text(json.dumps(data, indent=2))
@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+# schedule_glyphs.py
+"""
+Fit many glyphs concurrently under one CPU budget.
+
+The manifest is JSON: optional defaults plus one entry per glyph.  Paths
+are relative to the manifest's directory; `name` defaults to the
+specimen's file stem.
+
+    {
+      "defaults": {"method": "differential_evolution", "max_iter": 50,
+                   "schedule": "0.25,0.5,1", "objective": "iou",
+                   "renderer": "mpost", "register": "none"},
+      "glyphs": [
+        {"specimen": "design/U10400.png",
+         "template": "generated_path_parameterized.mp",
+         "metadata": "optimizer_metadata.json"},
+        {"name": "U10401", "specimen": "design/U10401.png",
+         "template": "U10401_parameterized.mp",
+         "metadata": "U10401_metadata.json", "max_iter": 80}
+      ]
+    }
+
+With a budget of C cores, J glyphs run at once (default: min(C, glyphs))
+and each gets C // J evaluation workers, so about C mpost processes run
+at any time.  Every glyph writes into <output>/<name>/: its log
+(fit.log), checkpoint, render cache and optimized.mp.  results.csv in
+<output> is rewritten as glyphs finish, with the final IoU, objective
+value and elapsed time per glyph.
+"""
+
+import csv
+import json
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from multires import DEFAULT_SCHEDULE, parse_schedule
+from optimize_metapost import MetapostOptimizer
+from parallel_eval import available_cores
+from registration import MODES as REGISTRATION_MODES
+
+DEFAULTS = {
+    'method': 'differential_evolution',
+    'max_iter': 50,
+    'schedule': DEFAULT_SCHEDULE,
+    'objective': 'iou',
+    'renderer': 'mpost',
+    'register': 'none',
+    'batch': True,
+}
+
+CHOICES = {
+    'method': ('nelder-mead', 'differential_evolution', 'surrogate'),
+    'objective': ('iou', 'chamfer'),
+    'renderer': ('mpost', 'native'),
+    'register': REGISTRATION_MODES,
+}
+
+RESULT_COLUMNS = ['glyph', 'status', 'iou', 'objective', 'elapsed_s', 'output']
+
+
+@dataclass
+class GlyphJob:
+    """One glyph to fit: its inputs and optimizer settings."""
+    name: str
+    specimen: Path
+    template: Path
+    metadata: Path
+    settings: Dict
+
+
+def load_manifest(path: Path) -> List[GlyphJob]:
+    """Read and check a manifest; raises ValueError on bad entries."""
+    with open(path) as f:
+        manifest = json.load(f)
+
+    root = path.parent
+    defaults = {**DEFAULTS, **manifest.get('defaults', {})}
+    jobs = []
+    problems = []
+    for index, entry in enumerate(manifest.get('glyphs', [])):
+        missing = [key for key in ('specimen', 'template', 'metadata') if key not in entry]
+        if missing:
+            problems.append(f"entry {index}: missing {', '.join(missing)}")
+            continue
+
+        files = {key: root / entry[key] for key in ('specimen', 'template', 'metadata')}
+        for key, file in files.items():
+            if not file.exists():
+                problems.append(f"entry {index}: {key} not found: {file}")
+
+        settings = {key: entry.get(key, value) for key, value in defaults.items()}
+        for key, allowed in CHOICES.items():
+            if settings[key] not in allowed:
+                problems.append(f"entry {index}: {key} must be one of {', '.join(allowed)}")
+        try:
+            parse_schedule(settings['schedule'])
+        except ValueError as e:
+            problems.append(f"entry {index}: {e}")
+        jobs.append(GlyphJob(name=entry.get('name', files['specimen'].stem),
+                             settings=settings, **files))
+
+    names = [job.name for job in jobs]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        problems.append(f"duplicate glyph names: {', '.join(duplicates)}")
+    if not jobs and not problems:
+        problems.append("no glyphs")
+    if problems:
+        raise ValueError(f"Bad manifest {path}:\n  " + '\n  '.join(problems))
+    return jobs
+
+
+def plan_budget(cores: int, glyphs: int, jobs: Optional[int] = None) -> Tuple[int, int]:
+    """(concurrent glyphs, evaluation workers per glyph) for a core budget."""
+    concurrent = max(1, min(jobs or cores, glyphs))
+    return concurrent, max(1, cores // concurrent)
+
+
+def glyph_iou(rendered: Optional[np.ndarray], target: np.ndarray) -> Optional[float]:
+    """IoU of a render with the target (both in the optimizer's frame)."""
+    if rendered is None:
+        return None
+    union = np.sum((rendered > 0) | (target > 0))
+    if union == 0:
+        return 0.0
+    return float(np.sum((rendered > 0) & (target > 0)) / union)
+
+
+def fit_glyph(job: GlyphJob, output_dir: Path, workers: int,
+              cache_dir: Optional[Path] = None, resume: bool = False) -> Dict:
+    """Optimize one glyph in this process; output goes to its fit.log."""
+    started = time.perf_counter()
+    glyph_dir = output_dir / job.name
+    glyph_dir.mkdir(exist_ok=True, parents=True)
+    result = {'glyph': job.name, 'status': 'ok', 'iou': None, 'objective': None,
+              'elapsed_s': None, 'output': str(glyph_dir)}
+
+    # Redirect at the descriptor level so evaluation workers and mpost
+    # write to the glyph's log too
+    sys.stdout.flush()
+    sys.stderr.flush()
+    with open(glyph_dir / "fit.log", 'a') as log:
+        os.dup2(log.fileno(), 1)
+        os.dup2(log.fileno(), 2)
+        try:
+            settings = job.settings
+            optimizer = MetapostOptimizer(
+                metapost_template=job.template,
+                metadata_file=job.metadata,
+                specimen_path=job.specimen,
+                output_dir=glyph_dir,
+                cache_dir=cache_dir,
+                renderer=settings['renderer'],
+                objective=settings['objective'],
+                register=settings['register']
+            )
+            if not optimizer.validate_template():
+                result['status'] = 'template does not render'
+            else:
+                optimized = optimizer.optimize(method=settings['method'],
+                                               max_iter=settings['max_iter'],
+                                               batch=settings['batch'],
+                                               workers=workers,
+                                               schedule=parse_schedule(settings['schedule']),
+                                               resume=resume)
+                rendered = optimizer.align(optimizer.render_metapost(optimized),
+                                           optimizer.target_image)
+                result['iou'] = glyph_iou(rendered, optimizer.target_image)
+                result['objective'] = optimizer.compare_images(rendered, optimizer.target_image)
+                optimizer.save_optimized(optimized)
+        except Exception as e:
+            traceback.print_exc()
+            result['status'] = f"error: {e}"
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+
+    result['elapsed_s'] = round(time.perf_counter() - started, 1)
+    return result
+
+
+def write_results(path: Path, results: List[Dict]):
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=RESULT_COLUMNS)
+        writer.writeheader()
+        writer.writerows(results)
+
+
+def print_results(results: List[Dict]):
+    print(f"\n{'glyph':<16}{'IoU':>8}{'objective':>11}{'elapsed':>10}  status")
+    for r in results:
+        iou = f"{r['iou']:.4f}" if r['iou'] is not None else '-'
+        objective = f"{r['objective']:.4f}" if r['objective'] is not None else '-'
+        elapsed = f"{r['elapsed_s']:.1f}s" if r['elapsed_s'] is not None else '-'
+        print(f"{r['glyph']:<16}{iou:>8}{objective:>11}{elapsed:>10}  {r['status']}")
+
+
+def schedule(jobs: List[GlyphJob], output_dir: Path, cores: int,
+             concurrent: Optional[int] = None, cache_dir: Optional[Path] = None,
+             resume: bool = False) -> List[Dict]:
+    """Run every job; returns results in manifest order."""
+    concurrent, workers = plan_budget(cores, len(jobs), concurrent)
+    output_dir.mkdir(exist_ok=True, parents=True)
+    results_path = output_dir / "results.csv"
+
+    print(f"Fitting {len(jobs)} glyphs: {concurrent} at a time, "
+          f"{workers} worker(s) each ({cores} cores)")
+
+    order = {job.name: index for index, job in enumerate(jobs)}
+    results = []
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=concurrent) as pool:
+        futures = {pool.submit(fit_glyph, job, output_dir, workers, cache_dir, resume): job
+                   for job in jobs}
+        try:
+            for future in as_completed(futures):
+                job = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    # The job process itself died
+                    result = {'glyph': job.name, 'status': f"error: {e}", 'iou': None,
+                              'objective': None, 'elapsed_s': None,
+                              'output': str(output_dir / job.name)}
+                results.append(result)
+                results.sort(key=lambda r: order[r['glyph']])
+                write_results(results_path, results)
+
+                iou = f"IoU {result['iou']:.4f}" if result['iou'] is not None else result['status']
+                print(f"[{len(results)}/{len(jobs)}] {job.name}: {iou} "
+                      f"({time.perf_counter() - started:.0f}s elapsed)")
+        except KeyboardInterrupt:
+            for future in futures:
+                future.cancel()
+            print(f"\nInterrupted; finished glyphs are in {results_path}. "
+                  f"Rerun with --resume to continue from checkpoints.")
+            raise
+
+    print_results(results)
+    print(f"\nResults: {results_path}")
+    return results
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Fit several glyphs concurrently')
+    parser.add_argument('manifest', type=Path, help='Glyph manifest (JSON)')
+    parser.add_argument('--output', type=Path, default=Path('optimized_output/glyphs'),
+                       help='Output directory; one subdirectory per glyph')
+    parser.add_argument('--cores', type=int, default=None,
+                       help='CPU budget for all glyphs together (default: all available)')
+    parser.add_argument('--jobs', type=int, default=None,
+                       help='Glyphs fitted at once (default: one per core)')
+    parser.add_argument('--cache-dir', type=Path, default=None,
+                       help='Render cache shared by all glyphs (default: one per glyph)')
+    parser.add_argument('--resume', action='store_true',
+                       help='Continue each glyph from its checkpoint')
+    args = parser.parse_args()
+
+    try:
+        jobs = load_manifest(args.manifest)
+    except (OSError, json.JSONDecodeError, ValueError) as e:
+        print(f"ERROR: {e}")
+        sys.exit(1)
+
+    schedule(jobs, args.output, args.cores or available_cores(), args.jobs,
+             cache_dir=args.cache_dir, resume=args.resume)
+
+
+if __name__ == '__main__':
+    main()
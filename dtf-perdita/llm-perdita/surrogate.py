@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+# surrogate.py
+"""
+Surrogate-assisted minimization for expensive render objectives.
+
+A radial basis function model (thin-plate spline with a linear tail) is
+fitted to every evaluated point.  Each round proposes many cheap
+candidates around the best point so far, scores them by a blend of
+predicted error and distance to already evaluated points (the stochastic
+RBF method of Regis & Shoemaker), and renders only the chosen batch -
+one vectorized objective call, so batching and worker pools apply.
+
+Every evaluation is appended to a JSONL history.  Records carry a
+context hash (template, specimen, objective, render size), so a later
+run on the same setup fits its first model on everything seen before.
+"""
+
+import hashlib
+import json
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from scipy.interpolate import RBFInterpolator
+from scipy.optimize import OptimizeResult
+from scipy.spatial import cKDTree
+from scipy.stats import qmc
+
+from locked_append import append_locked
+
+# Objective value the optimizers return for failed renders
+FAILED = 10.0
+
+# Acquisition weights on the model prediction, cycled within a batch;
+# the remainder rewards distance from evaluated points
+WEIGHTS = (0.3, 0.5, 0.8, 0.95)
+
+
+def history_context(*parts) -> str:
+    """Hash identifying what an objective value depends on."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else str(part).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()[:16]
+
+
+class EvaluationHistory:
+    """Append-only JSONL log of (parameters, error) evaluations."""
+
+    def __init__(self, path: Path):
+        self.path = path
+
+    def append(self, context: str, evaluations: Sequence[Tuple[Dict[str, float], float]]):
+        if not evaluations:
+            return
+        lines = []
+        for params, error in evaluations:
+            record = {'context': context,
+                      'params': {name: float(value) for name, value in params.items()},
+                      'error': float(error)}
+            lines.append(json.dumps(record) + '\n')
+
+        # Locked, so concurrent workers' lines stay whole
+        append_locked(self.path, ''.join(lines))
+
+    def load(self, context: str, names: List[str],
+             fixed: Optional[Dict[str, float]] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Points (N, len(names)) and errors (N,) recorded under `context`
+        whose fixed parameters match `fixed`.
+        """
+        points, errors = [], []
+        if not self.path.exists():
+            return np.empty((0, len(names))), np.empty(0)
+
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # Partial line from an interrupted run
+                    continue
+                if record.get('context') != context:
+                    continue
+                params = record['params']
+                if any(name not in params for name in names):
+                    continue
+                if fixed and any(abs(params.get(name, np.nan) - value) > 1e-9
+                                 for name, value in fixed.items()):
+                    continue
+                points.append([params[name] for name in names])
+                errors.append(record['error'])
+
+        return np.array(points).reshape(-1, len(names)), np.array(errors)
+
+
+def _fit(U: np.ndarray, y: np.ndarray) -> RBFInterpolator:
+    """RBF model on unit-cube points; failed renders are capped."""
+    ok = y < FAILED
+    if ok.any():
+        y = np.minimum(y, y[ok].max())
+
+    # Duplicate points make the interpolation system singular
+    _, unique = np.unique(np.round(U, 9), axis=0, return_index=True)
+    return RBFInterpolator(U[unique], y[unique], kernel='thin_plate_spline',
+                           degree=1, smoothing=1e-8)
+
+
+def surrogate_minimize(fun_batch: Callable[[np.ndarray], np.ndarray],
+                       bounds: Sequence[Tuple[float, float]],
+                       x0: np.ndarray,
+                       max_rounds: int = 20,
+                       batch_size: int = 8,
+                       history: Optional[Tuple[np.ndarray, np.ndarray]] = None,
+                       seed=None,
+                       disp: bool = True,
+                       callback: Optional[Callable[[OptimizeResult], None]] = None) -> OptimizeResult:
+    """
+    Minimize fun_batch over the box `bounds`.
+
+    fun_batch takes a (n, S) matrix of S candidates (the vectorized
+    differential_evolution convention) and returns S values.  `history`
+    is prior (points, errors), e.g. from EvaluationHistory.load.
+    `seed` is anything np.random.default_rng accepts, including a
+    Generator.  `callback` gets the best point so far after each round.
+    """
+    rng = np.random.default_rng(seed)
+    bounds = np.array(bounds, dtype=float)
+    lo, hi = bounds.min(axis=1), bounds.max(axis=1)
+    span = np.where(hi > lo, hi - lo, 1.0)
+    dim = len(lo)
+
+    def to_unit(X):
+        return (X - lo) / span
+
+    def from_unit(U):
+        return lo + np.clip(U, 0.0, 1.0) * span
+
+    U = np.empty((0, dim))
+    y = np.empty(0)
+    nfev = 0
+
+    def evaluate(candidates_unit):
+        nonlocal U, y, nfev
+        X = from_unit(candidates_unit)
+        errors = np.asarray(fun_batch(X.T), dtype=float)
+        U = np.vstack([U, to_unit(X)])
+        y = np.concatenate([y, errors])
+        nfev += len(errors)
+
+    if history is not None and len(history[1]):
+        inside = np.all((history[0] >= lo) & (history[0] <= hi), axis=1)
+        U = to_unit(history[0][inside])
+        y = history[1][inside]
+        if disp:
+            print(f"Surrogate warm start: {len(y)} earlier evaluations")
+
+    # Initial design: x0 plus a Latin hypercube, enough to fit the linear tail
+    initial = [to_unit(np.clip(x0, lo, hi))[None, :]]
+    n_design = max(0, 2 * (dim + 1) - len(y) - 1)
+    if n_design:
+        initial.append(qmc.LatinHypercube(d=dim, seed=rng).random(n_design))
+    evaluate(np.vstack(initial))
+
+    sigma, sigma_min, sigma_max = 0.2, 0.005, 0.4
+    successes = failures = 0
+    patience = max(3, int(np.ceil(dim / batch_size)))
+    n_candidates = min(2000, 100 * dim)
+    perturb_prob = min(1.0, 20.0 / dim)
+
+    for round_index in range(max_rounds):
+        best = int(np.argmin(y))
+        model = _fit(U, y)
+
+        # Candidates: DYCORS-style perturbations of the best point plus
+        # a share of uniform samples
+        n_local = int(0.8 * n_candidates)
+        mask = rng.random((n_local, dim)) < perturb_prob
+        mask[np.arange(n_local), rng.integers(0, dim, n_local)] = True
+        local = U[best] + mask * rng.normal(0.0, sigma, (n_local, dim))
+        candidates = np.clip(np.vstack([local, rng.random((n_candidates - n_local, dim))]), 0.0, 1.0)
+
+        predicted = model(candidates)
+        distance = cKDTree(U).query(candidates)[0]
+
+        chosen = []
+        for k in range(min(batch_size, len(candidates))):
+            w = WEIGHTS[k % len(WEIGHTS)]
+            p_range = np.ptp(predicted) or 1.0
+            d_range = np.ptp(distance) or 1.0
+            score = (w * (predicted - predicted.min()) / p_range +
+                     (1 - w) * (distance.max() - distance) / d_range)
+            pick = int(np.argmin(score))
+            chosen.append(candidates[pick])
+            distance = np.minimum(distance, np.linalg.norm(candidates - candidates[pick], axis=1))
+
+        previous_best = y[best]
+        evaluate(np.array(chosen))
+
+        if y.min() < previous_best - 1e-3 * abs(previous_best):
+            successes, failures = successes + 1, 0
+        else:
+            successes, failures = 0, failures + 1
+
+        if successes >= 3:
+            sigma, successes = min(2 * sigma, sigma_max), 0
+        elif failures >= patience:
+            sigma, failures = sigma / 2, 0
+
+        if disp:
+            print(f"surrogate round {round_index + 1}: f(x)= {y.min():.6g} "
+                  f"({nfev} evaluations, step {sigma:.3g})")
+        if callback is not None:
+            best = int(np.argmin(y))
+            callback(OptimizeResult(x=from_unit(U[best]), fun=float(y[best]),
+                                    nfev=nfev, nit=round_index + 1))
+
+        if sigma < sigma_min:
+            break
+
+    best = int(np.argmin(y))
+    return OptimizeResult(x=from_unit(U[best]), fun=float(y[best]), nfev=nfev,
+                          nit=round_index + 1 if max_rounds else 0, success=True,
+                          message='Step size below minimum' if sigma < sigma_min
+                          else 'Maximum number of rounds reached')
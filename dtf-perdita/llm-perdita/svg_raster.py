@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+# svg_raster.py
+"""
+In-process rasterizer for the SVG subset METAPOST emits.
+
+Handles <path> elements with absolute/relative M, L, H, V, C and Z
+commands, fills with the nonzero winding rule, and strokes with round
+caps and joins (what `pencircle` produces).  Pixels are sampled at their
+centers straight into a uint8 array: 255 = ink, 0 = paper, matching the
+thresholded output of the old ImageMagick pipeline.
+
+rasterize_svg stretches the viewBox over the raster; rasterize_in_frame
+draws at the picture's METAPOST coordinates in a fixed RenderFrame,
+using the bounding box mpost records in the SVG.
+"""
+
+import re
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+SVG_NS = '{http://www.w3.org/2000/svg}'
+
+PATH_TOKEN_RE = re.compile(r'[MmLlHhVvCcZz]|[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?')
+
+# (points, closed) - points is an (N, 2) array in user units
+Subpath = Tuple[np.ndarray, bool]
+
+
+def parse_style(element: ET.Element) -> Dict[str, str]:
+    """Merge presentation attributes and the style attribute."""
+    style = {}
+    for attr in ('fill', 'stroke', 'stroke-width'):
+        if attr in element.attrib:
+            style[attr] = element.attrib[attr].strip()
+
+    for item in element.attrib.get('style', '').split(';'):
+        if ':' in item:
+            key, value = item.split(':', 1)
+            style[key.strip()] = value.strip()
+
+    return style
+
+
+def is_ink(color: Optional[str]) -> Optional[bool]:
+    """
+    Classify a paint value.  None for no paint, True for dark ink,
+    False for light paint (e.g. `unfill` emits white).
+    """
+    if color is None or color == 'none':
+        return None
+
+    match = re.match(r'rgb\(\s*([\d.]+)(%?)\s*,\s*([\d.]+)(%?)\s*,\s*([\d.]+)(%?)\s*\)', color)
+    if match:
+        channels = []
+        for value, percent in zip(match.group(1, 3, 5), match.group(2, 4, 6)):
+            channels.append(float(value) / (100.0 if percent else 255.0))
+    elif re.match(r'#[0-9a-fA-F]{6}$', color):
+        channels = [int(color[i:i + 2], 16) / 255.0 for i in (1, 3, 5)]
+    elif color == 'white':
+        channels = [1.0, 1.0, 1.0]
+    else:
+        channels = [0.0, 0.0, 0.0]
+
+    r, g, b = channels
+    return 0.299 * r + 0.587 * g + 0.114 * b < 0.5
+
+
+def flatten_cubic(p0, p1, p2, p3, scale: float) -> np.ndarray:
+    """Flatten a cubic Bezier into points (excluding p0)."""
+    control_len = (np.hypot(*(p1 - p0)) + np.hypot(*(p2 - p1)) + np.hypot(*(p3 - p2))) * scale
+    n = int(np.clip(np.ceil(2 * np.sqrt(control_len)), 2, 100))
+
+    t = np.linspace(0.0, 1.0, n + 1)[1:, None]
+    mt = 1.0 - t
+    return mt ** 3 * p0 + 3 * mt ** 2 * t * p1 + 3 * mt * t ** 2 * p2 + t ** 3 * p3
+
+
+def parse_path_data(d: str, scale: float = 1.0) -> List[Subpath]:
+    """Parse SVG path data into flattened subpaths."""
+    tokens = PATH_TOKEN_RE.findall(d)
+    subpaths = []
+    points = []
+    closed = False
+    current = np.zeros(2)
+    start = np.zeros(2)
+    command = None
+    i = 0
+
+    def finish():
+        if len(points) > 1:
+            subpaths.append((np.array(points), closed))
+
+    def number():
+        nonlocal i
+        value = float(tokens[i])
+        i += 1
+        return value
+
+    while i < len(tokens):
+        if tokens[i].isalpha():
+            command = tokens[i]
+            i += 1
+        elif command is None:
+            raise ValueError(f"Path data does not start with a command: {d[:40]}")
+
+        relative = command.islower()
+        offset = current if relative else np.zeros(2)
+        op = command.upper()
+
+        if op == 'M':
+            finish()
+            current = offset + np.array([number(), number()])
+            start = current
+            points = [current]
+            closed = False
+            # Further coordinate pairs are implicit lineto
+            command = 'l' if relative else 'L'
+        elif op == 'L':
+            current = offset + np.array([number(), number()])
+            points.append(current)
+        elif op == 'H':
+            current = np.array([(current[0] if relative else 0.0) + number(), current[1]])
+            points.append(current)
+        elif op == 'V':
+            current = np.array([current[0], (current[1] if relative else 0.0) + number()])
+            points.append(current)
+        elif op == 'C':
+            c1 = offset + np.array([number(), number()])
+            c2 = offset + np.array([number(), number()])
+            end = offset + np.array([number(), number()])
+            points.extend(flatten_cubic(current, c1, c2, end, scale))
+            current = end
+        elif op == 'Z':
+            closed = True
+            finish()
+            current = start
+            points = [current]
+            closed = False
+        else:
+            raise ValueError(f"Unsupported path command: {command}")
+
+    finish()
+    return subpaths
+
+
+def fill_nonzero(subpaths: List[Subpath], shape: Tuple[int, int],
+                 to_pixel: np.ndarray) -> np.ndarray:
+    """Scanline fill of all subpaths (implicitly closed), nonzero rule."""
+    height, width = shape
+    mask = np.zeros(shape, dtype=bool)
+
+    edges = []
+    for points, _ in subpaths:
+        px = points * to_pixel[0] + to_pixel[1]
+        closed_px = np.vstack([px, px[:1]])
+        edges.append(np.hstack([closed_px[:-1], closed_px[1:]]))
+    if not edges:
+        return mask
+
+    edges = np.vstack(edges)
+    x0, y0, x1, y1 = edges.T
+    horizontal = y0 == y1
+    x0, y0, x1, y1 = x0[~horizontal], y0[~horizontal], x1[~horizontal], y1[~horizontal]
+    direction = np.where(y1 > y0, 1, -1)
+
+    row_min = max(0, int(np.floor(min(y0.min(), y1.min()))))
+    row_max = min(height - 1, int(np.ceil(max(y0.max(), y1.max()))))
+    columns = np.arange(width) + 0.5
+
+    for row in range(row_min, row_max + 1):
+        yc = row + 0.5
+        crossing = (np.minimum(y0, y1) <= yc) & (yc < np.maximum(y0, y1))
+        if not crossing.any():
+            continue
+
+        t = (yc - y0[crossing]) / (y1[crossing] - y0[crossing])
+        xs = x0[crossing] + t * (x1[crossing] - x0[crossing])
+        order = np.argsort(xs)
+        xs = xs[order]
+        winding = np.cumsum(direction[crossing][order])
+
+        for k in np.nonzero(winding[:-1] != 0)[0]:
+            mask[row, (columns >= xs[k]) & (columns < xs[k + 1])] = True
+
+    return mask
+
+
+def stroke_round(subpaths: List[Subpath], stroke_width: float, shape: Tuple[int, int],
+                 to_pixel: np.ndarray) -> np.ndarray:
+    """
+    Stroke with round caps and joins: union of capsules around each
+    segment.  Distances are measured in user units, so a non-uniform
+    viewBox scale gives the correct elliptical pen footprint.
+    """
+    height, width = shape
+    mask = np.zeros(shape, dtype=bool)
+    half = stroke_width / 2.0
+    scale, offset = to_pixel
+    pad = np.abs(half * scale) + 1
+
+    for points, closed in subpaths:
+        if closed:
+            points = np.vstack([points, points[:1]])
+
+        for a, b in zip(points[:-1], points[1:]):
+            pa, pb = a * scale + offset, b * scale + offset
+            c0 = max(0, int(np.floor(min(pa[0], pb[0]) - pad[0])))
+            c1 = min(width, int(np.ceil(max(pa[0], pb[0]) + pad[0])) + 1)
+            r0 = max(0, int(np.floor(min(pa[1], pb[1]) - pad[1])))
+            r1 = min(height, int(np.ceil(max(pa[1], pb[1]) + pad[1])) + 1)
+            if c0 >= c1 or r0 >= r1:
+                continue
+
+            ux = (np.arange(c0, c1) + 0.5 - offset[0]) / scale[0]
+            uy = (np.arange(r0, r1) + 0.5 - offset[1]) / scale[1]
+            gx, gy = np.meshgrid(ux, uy)
+
+            ab = b - a
+            denom = ab @ ab
+            if denom > 0:
+                t = np.clip(((gx - a[0]) * ab[0] + (gy - a[1]) * ab[1]) / denom, 0.0, 1.0)
+            else:
+                t = 0.0
+            dx = gx - (a[0] + t * ab[0])
+            dy = gy - (a[1] + t * ab[1])
+
+            mask[r0:r1, c0:c1] |= dx * dx + dy * dy <= half * half
+
+    return mask
+
+
+def viewbox(root: ET.Element) -> Tuple[float, float, float, float]:
+    """(min_x, min_y, width, height) of the SVG user space."""
+    if 'viewBox' in root.attrib:
+        values = [float(v) for v in re.split(r'[\s,]+', root.attrib['viewBox'].strip())]
+        return tuple(values)
+
+    def length(name):
+        return float(re.match(r'[-+\d.eE]+', root.attrib[name]).group())
+
+    return 0.0, 0.0, length('width'), length('height')
+
+
+ORIGINAL_BBOX_RE = re.compile(r'Original BoundingBox:\s*([-+\d.eE]+)\s+([-+\d.eE]+)\s+([-+\d.eE]+)\s+([-+\d.eE]+)')
+
+
+def original_bbox(text: str) -> Tuple[float, float, float, float]:
+    """
+    METAPOST bounding box (llx, lly, urx, ury) from the comment mpost
+    writes into its SVG output; the user space is (x - llx, ury - y).
+    """
+    match = ORIGINAL_BBOX_RE.search(text)
+    if match is None:
+        raise ValueError("SVG has no Original BoundingBox comment (not written by mpost?)")
+    return tuple(float(v) for v in match.groups())
+
+
+def draw(root: ET.Element, canvas: np.ndarray, to_pixel: np.ndarray):
+    """Paint every path of the SVG into canvas with a user -> pixel map."""
+    density = np.abs(to_pixel[0]).max()
+    for element in root.iter(f'{SVG_NS}path'):
+        style = parse_style(element)
+        subpaths = parse_path_data(element.attrib.get('d', ''), scale=density)
+        if not subpaths:
+            continue
+
+        fill = is_ink(style.get('fill', 'black'))
+        if fill is not None:
+            canvas[fill_nonzero(subpaths, canvas.shape, to_pixel)] = 255 if fill else 0
+
+        stroke = is_ink(style.get('stroke'))
+        stroke_width = float(re.match(r'[-+\d.eE]+', style.get('stroke-width', '1')).group())
+        if stroke is not None and stroke_width > 0:
+            canvas[stroke_round(subpaths, stroke_width, canvas.shape, to_pixel)] = 255 if stroke else 0
+
+
+def rasterize_svg(svg_path: Path, width: int = 500, height: int = 500) -> np.ndarray:
+    """
+    Rasterize an SVG file into a (height, width) uint8 array.
+
+    The viewBox is stretched to fill the requested size, like the old
+    `convert` + `cv2.resize` pipeline.
+    """
+    root = ET.parse(str(svg_path)).getroot()
+    min_x, min_y, vb_width, vb_height = viewbox(root)
+
+    canvas = np.zeros((height, width), dtype=np.uint8)
+    if vb_width <= 0 or vb_height <= 0:
+        # Empty picture
+        return canvas
+
+    scale = np.array([width / vb_width, height / vb_height])
+    draw(root, canvas, np.array([scale, -np.array([min_x, min_y]) * scale]))
+    return canvas
+
+
+def rasterize_in_frame(svg_path: Path, frame) -> np.ndarray:
+    """
+    Rasterize an mpost SVG at its METAPOST coordinates in a
+    render_frame.RenderFrame: no stretching, and the raster has the
+    frame's shape.
+    """
+    data = Path(svg_path).read_bytes()
+    root = ET.fromstring(data)
+
+    canvas = np.zeros(frame.shape, dtype=np.uint8)
+    _, _, vb_width, vb_height = viewbox(root)
+    if vb_width <= 0 or vb_height <= 0:
+        return canvas
+
+    draw(root, canvas, frame.svg_to_pixel(original_bbox(data.decode('utf-8', 'replace'))))
+    return canvas
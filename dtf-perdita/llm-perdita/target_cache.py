@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# target_cache.py
+"""
+On-disk cache of preprocessed specimen targets.
+
+Everything derived from a specimen - the binary mask, its downsampled
+pyramid levels, chamfer distance maps and shape features - is stored in
+a bundle directory keyed by a hash of the specimen file and the
+preprocessing settings:
+
+    <cache>/<key>/mask_1.npy, mask_0.5.npy, ...
+                  distance_1.npy, ...
+                  features_1.json, ...
+
+Items are computed on first use and written through a temporary file
+and os.replace, so concurrent runs never see a partial file.  Arrays
+are opened with mmap_mode='r': later and parallel runs against the same
+specimen map the files instead of re-reading and re-thresholding the
+image, and the arrays are read-only.
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Callable, Dict, Iterable
+
+import numpy as np
+
+from chamfer import distance_to_ink
+from multires import target_pyramid
+
+# What load_specimen does; change it here too when the preprocessing
+# changes, so old bundles are not reused
+PREPROCESS = {'version': 1, 'invert_below_mean': 127, 'threshold': 128}
+
+
+def _replace(path: Path, write: Callable[[Path], None]):
+    partial = path.with_name(f".{path.stem}.{os.getpid()}{path.suffix}")
+    write(partial)
+    os.replace(partial, path)
+
+
+class TargetBundle:
+    """Preprocessed arrays for one specimen, each computed once."""
+
+    def __init__(self, directory: Path, specimen_path: Path,
+                 load_specimen: Callable[[Path], np.ndarray]):
+        self.directory = directory
+        self.specimen_path = specimen_path
+        self.load_specimen = load_specimen
+
+    def _array(self, name: str, compute: Callable[[], np.ndarray]) -> np.ndarray:
+        path = self.directory / f"{name}.npy"
+        if path.exists():
+            try:
+                return np.load(path, mmap_mode='r')
+            except (OSError, ValueError):
+                # Unreadable file (e.g. from a full disk); rebuild it
+                pass
+        array = np.ascontiguousarray(compute())
+        _replace(path, lambda partial: np.save(partial, array))
+        return np.load(path, mmap_mode='r')
+
+    def mask(self, scale: float = 1.0) -> np.ndarray:
+        """Binary target at `scale` (see multires.target_pyramid)."""
+        if scale == 1.0:
+            return self._array("mask_1", lambda: self.load_specimen(self.specimen_path))
+        return self._array(f"mask_{scale:g}",
+                           lambda: target_pyramid(np.asarray(self.mask(1.0)), [scale])[scale])
+
+    def pyramid(self, scales: Iterable[float]) -> Dict[float, np.ndarray]:
+        return {scale: self.mask(scale) for scale in scales}
+
+    def distance(self, scale: float = 1.0) -> np.ndarray:
+        """Distance of each pixel to the nearest target ink at `scale`."""
+        return self._array(f"distance_{scale:g}", lambda: distance_to_ink(self.mask(scale)))
+
+    def features(self, scale: float, compute: Callable[[], Dict[str, float]]) -> Dict[str, float]:
+        """Feature dict at `scale`; compute() is called on a miss."""
+        path = self.directory / f"features_{scale:g}.json"
+        if path.exists():
+            try:
+                return json.loads(path.read_text())
+            except (OSError, json.JSONDecodeError):
+                pass
+        features = compute()
+        _replace(path, lambda partial: partial.write_text(json.dumps(features)))
+        return features
+
+
+class TargetCache:
+    """Directory of TargetBundles."""
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+
+    def bundle(self, specimen_path: Path,
+               load_specimen: Callable[[Path], np.ndarray]) -> TargetBundle:
+        """Bundle for the specimen's current contents."""
+        digest = hashlib.sha256(specimen_path.read_bytes())
+        digest.update(json.dumps(PREPROCESS, sort_keys=True).encode('utf-8'))
+        directory = self.directory / digest.hexdigest()[:16]
+        directory.mkdir(exist_ok=True, parents=True)
+        return TargetBundle(directory, specimen_path, load_specimen)
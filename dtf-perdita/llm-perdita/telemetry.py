@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# telemetry.py
+"""
+Per-evaluation timing telemetry for the render/compare hot path.
+
+With a telemetry path set, every objective call appends one JSON line:
+
+    {"time": ..., "pid": ..., "render_size": "78x104", "evaluations": 1,
+     "wall": 0.031, "stages": {"substitute": 0.0001, "mpost": 0.025, ...},
+     "cache_hits": 0, "cache_misses": 1, "failures": {}, "errors": [0.41]}
+
+A vectorized call is one line with "evaluations" > 1; its stage times
+cover the whole batch.  Stages are disjoint: substitute, cache (key and
+lookup), mpost, native, rasterize, register, compare, history.  Whatever
+is not covered by a stage shows up as "other" in the summary.
+
+Pool workers append to the same file, each line under a file lock
+(locked_append).
+
+Summary of a run:
+
+    python telemetry.py optimized_output/telemetry.jsonl
+"""
+
+import json
+import os
+import sys
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from locked_append import append_locked
+
+PERCENTILES = (50, 90, 99)
+
+
+class Telemetry:
+    """Collects stage timings for the current evaluation; a no-op without a path."""
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = path
+        self._record = None
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['_record'] = None
+        return state
+
+    def begin(self, cache=None):
+        """Start timing an objective call; `cache` is a RenderCache."""
+        if self.path is None:
+            return
+        self._record = {
+            'started': time.perf_counter(),
+            'stages': defaultdict(float),
+            'failures': Counter(),
+            'cache': cache,
+            'cache_counts': (cache.hits, cache.misses) if cache is not None else (0, 0),
+        }
+
+    @contextmanager
+    def stage(self, name: str):
+        """Add the time spent in the block to stage `name`."""
+        if self._record is None:
+            yield
+            return
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._record['stages'][name] += time.perf_counter() - started
+
+    def failure(self, kind: str):
+        """Count a failed render (failed, timeout, no_svg, error, memo)."""
+        if self._record is not None:
+            self._record['failures'][kind] += 1
+
+    def end(self, errors: Sequence[float], **fields):
+        """Write the line for the current call; fields are added verbatim."""
+        record, self._record = self._record, None
+        if record is None:
+            return
+
+        hits, misses = record['cache_counts']
+        cache = record['cache']
+        line = {
+            'time': round(time.time(), 3),
+            'pid': os.getpid(),
+            **fields,
+            'evaluations': len(errors),
+            'wall': round(time.perf_counter() - record['started'], 6),
+            'stages': {name: round(seconds, 6) for name, seconds in record['stages'].items()},
+            'cache_hits': cache.hits - hits if cache is not None else 0,
+            'cache_misses': cache.misses - misses if cache is not None else 0,
+            'failures': dict(record['failures']),
+            'errors': [round(float(error), 6) for error in errors],
+        }
+
+        append_locked(self.path, json.dumps(line) + '\n')
+
+
+def load(paths: Sequence[Path]) -> List[Dict]:
+    records = []
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # Partial line from an interrupted run
+                    continue
+    return records
+
+
+def summarize(records: List[Dict]):
+    """Print per-evaluation stage percentiles and run totals."""
+    if not records:
+        print("No telemetry records")
+        return
+
+    evaluations = sum(r['evaluations'] for r in records)
+    wall = sum(r['wall'] for r in records)
+    stage_names = sorted({name for r in records for name in r['stages']})
+
+    # Batch lines are spread evenly over their evaluations
+    per_eval = {name: [] for name in stage_names + ['other', 'wall']}
+    totals = Counter()
+    for r in records:
+        n = max(r['evaluations'], 1)
+        covered = 0.0
+        for name in stage_names:
+            seconds = r['stages'].get(name, 0.0)
+            covered += seconds
+            totals[name] += seconds
+            per_eval[name].extend([seconds / n] * n)
+        other = max(r['wall'] - covered, 0.0)
+        totals['other'] += other
+        per_eval['other'].extend([other / n] * n)
+        per_eval['wall'].extend([r['wall'] / n] * n)
+    totals['wall'] = wall
+
+    print(f"{len(records)} objective calls, {evaluations} evaluations, {wall:.1f} s")
+    header = ''.join(f"{f'p{p} ms':>10}" for p in PERCENTILES)
+    print(f"\n{'stage':<12}{header}{'total s':>10}{'share':>8}")
+    for name in stage_names + ['other', 'wall']:
+        values = np.array(per_eval[name]) * 1000
+        cells = ''.join(f"{np.percentile(values, p):>10.2f}" for p in PERCENTILES)
+        share = totals[name] / wall * 100 if wall else 0.0
+        print(f"{name:<12}{cells}{totals[name]:>10.2f}{share:>7.1f}%")
+
+    hits = sum(r['cache_hits'] for r in records)
+    misses = sum(r['cache_misses'] for r in records)
+    if hits + misses:
+        print(f"\nRender cache: {hits} hits, {misses} misses "
+              f"({hits / (hits + misses):.1%} hit rate)")
+
+    failures = Counter()
+    for r in records:
+        failures.update(r['failures'])
+    if failures:
+        print("Failures: " + ', '.join(f"{kind} {count}" for kind, count in failures.most_common()))
+
+    errors = np.array([e for r in records for e in r['errors']])
+    if len(errors):
+        print("Objective: best {:.4f}, ".format(errors.min()) +
+              ', '.join(f"p{p} {np.percentile(errors, p):.4f}" for p in PERCENTILES))
+
+    sizes = Counter()
+    for r in records:
+        if 'render_size' in r:
+            sizes[r['render_size']] += r['evaluations']
+    if len(sizes) > 1:
+        print("Evaluations by render size: " +
+              ', '.join(f"{size} {count}" for size, count in sorted(sizes.items())))
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Summarize optimizer telemetry')
+    parser.add_argument('telemetry', type=Path, nargs='+', help='Telemetry JSONL file(s)')
+    args = parser.parse_args()
+
+    missing = [path for path in args.telemetry if not path.exists()]
+    if missing:
+        print(f"Not found: {', '.join(str(path) for path in missing)}")
+        sys.exit(1)
+
+    summarize(load(args.telemetry))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,43 @@
 #!/usr/bin/env python3
 """
-Build all font weights by modifying pen_height and running mpost.
+Build all font weights in parallel, rebuilding only what changed.
+
+The build graph comes from src/calyptapis.mp: each `input` line is a
+letter file producing the figures it `beginfig`s (calyptapis-<n>.svg),
+and everything else in the source is the header every letter depends
+on.  maj/<weight>/.build_state.json records the hash of the header
+(with the weight's pen height) and of each letter file as last built; a
+build regenerates only the (glyph, weight) SVGs whose inputs changed or
+are missing, so a build with nothing to do just hashes the sources.
+
+Each weight runs mpost in its own scratch directory on a generated
+driver: pen_height_ratio, then the header with only the stale letters
+input.  src/ is never written, and the weights run at the same time on
+a process pool.  A weight's letters can also be split into shards, each
+its own mpost process on a driver with the full header and a share of
+the inputs, whose SVGs land in the same weight directory.
+
+With --single-pass one mpost run builds every weight instead: the
+driver defines the stale letters as one macro and the header as a
+macro taking the weight, so both are scanned once, then expands them
+per weight with outputtemplate "%j-<weight>-%c.svg".  The SVGs are
+demultiplexed into maj/<weight>/calyptapis-<n>.svg afterwards.
 """
 
+import argparse
+import hashlib
+import json
 import os
 import re
 import shutil
 import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
 from pathlib import Path
+from typing import Optional
 
 # Weight definitions: name -> pen_height multiplier
 WEIGHTS = {
@@ -20,71 +50,370 @@ WEIGHTS = {
 }
 
 # Paths
-SCRIPT_DIR = Path(__file__).parent
+SCRIPT_DIR = Path(__file__).resolve().parent
 SRC_FILE = SCRIPT_DIR / "src" / "calyptapis.mp"
 OUTPUT_DIR = SCRIPT_DIR / "maj"
+STATE_NAME = ".build_state.json"
+
+# SVGs are named <jobname>-<figure>.svg by the source's outputtemplate
+JOBNAME = "calyptapis"
+
+INPUT_RE = re.compile(r"^[ \t]*input[ \t]+([^;\s]+)[ \t]*;[^\n]*\n?", re.MULTILINE)
+FIGURE_RE = re.compile(r"\bbeginfig\s*\(\s*(\d+)\s*\)")
+END_RE = re.compile(r"^[ \t]*end\b", re.MULTILINE)
+
+
+def digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()[:16]
+
+
+@dataclass
+class Letter:
+    """One `input` of the source and the figures it draws."""
+    path: str
+    hash: str
+    figures: list[int]
+    text: str
+
+
+@dataclass
+class BuildGraph:
+    header: str
+    letters: dict[str, Letter]
+
+    def header_hash(self, multiplier: float) -> str:
+        return digest(f"{multiplier}\n{self.header}".encode("utf-8"))
+
+    def _split_header(self) -> tuple[str, str]:
+        """Header before its final `end`, and from it on."""
+        ends = list(END_RE.finditer(self.header))
+        if not ends:
+            return self.header, "end"
+        return self.header[:ends[-1].start()], self.header[ends[-1].start():]
+
+    def driver(self, multiplier: float, letters: list[str]) -> str:
+        """mpost driver for one weight building only `letters`."""
+        inputs = "".join(f"input {path};\n" for path in letters)
+        body, end = self._split_header()
+        return ("% Generated by build_weights.py\n"
+                f"pen_height_ratio := {multiplier};\n"
+                f"{body}{inputs}{end}\n")
+
+    def single_pass_driver(self, weight_names: list[str], letters: list[str]) -> str:
+        """
+        mpost driver building `letters` for every weight in one run.  The
+        header (pens included) is re-run per weight so every pen picks up
+        the weight's pen_height; SVGs come out as <job>-<weight>-<n>.svg.
+        """
+        body, end = self._split_header()
+        sources = "\n".join(f"% {path}\n{self.letters[path].text.rstrip()}" for path in letters)
+        calls = "".join(f'calyptapis_weight("{name}", {WEIGHTS[name]});\ncalyptapis_letters;\n'
+                        for name in weight_names)
+        return ("% Generated by build_weights.py --single-pass\n"
+                f"def calyptapis_letters =\n{sources}\nenddef;\n\n"
+                "def calyptapis_weight(expr calyptapis_weight_name, calyptapis_weight_ratio) =\n"
+                "pen_height_ratio := calyptapis_weight_ratio;\n"
+                f"{body}\n"
+                'outputtemplate := "%j-" & calyptapis_weight_name & "-%c.svg";\n'
+                "enddef;\n\n"
+                f"{calls}{end}\n")
 
 
-def modify_pen_height(content: str, multiplier: float) -> str:
-    """Replace pen_height value in the MetaPost source."""
-    pattern = r"(pen_height\s*:=\s*)[\d.]+(\s*\*\s*font_size)"
-    replacement = rf"\g<1>{multiplier}\2"
-    return re.sub(pattern, replacement, content)
+def load_graph() -> BuildGraph:
+    """Header and letters of src/calyptapis.mp, with content hashes."""
+    source = SRC_FILE.read_text()
+    letters = {}
+    for match in INPUT_RE.finditer(source):
+        path = match.group(1)
+        data = (SCRIPT_DIR / path).read_bytes()
+        text = data.decode("utf-8", "replace")
+        figures = [int(n) for n in FIGURE_RE.findall(text)]
+        letters[path] = Letter(path, digest(data), figures, text)
+    return BuildGraph(INPUT_RE.sub("", source), letters)
 
 
-def run_mpost() -> bool:
-    """Run mpost on the source file."""
-    result = subprocess.run(
-        ["mpost", "src/calyptapis.mp"],
-        cwd=SCRIPT_DIR,
-        capture_output=True,
-        text=True,
-    )
+def load_state(weight_name: str) -> dict:
+    try:
+        return json.loads((OUTPUT_DIR / weight_name / STATE_NAME).read_text())
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+
+def save_state(weight_name: str, state: dict):
+    path = OUTPUT_DIR / weight_name / STATE_NAME
+    partial = path.with_name(path.name + ".tmp")
+    partial.write_text(json.dumps(state, indent=1, sort_keys=True))
+    os.replace(partial, path)
+
+
+def stale_letters(graph: BuildGraph, weight_name: str, state: dict,
+                  force: bool = False, figures: Optional[list[int]] = None) -> list[str]:
+    """Letters whose SVGs for this weight are out of date or missing."""
+    if figures is not None:
+        return [path for path, letter in graph.letters.items()
+                if set(letter.figures) & set(figures)]
+
+    built = state.get("letters", {})
+    if force or state.get("header") != graph.header_hash(WEIGHTS[weight_name]):
+        return list(graph.letters)
+
+    weight_dir = OUTPUT_DIR / weight_name
+    return [path for path, letter in graph.letters.items()
+            if built.get(path, {}).get("hash") != letter.hash
+            or not all((weight_dir / f"{JOBNAME}-{n}.svg").exists() for n in letter.figures)]
+
+
+def mpost_env() -> dict:
+    """Environment letting mpost find src/ from a scratch directory."""
+    env = dict(os.environ)
+    # Trailing separator keeps kpathsea's default search path
+    env["MPINPUTS"] = os.pathsep.join([str(SCRIPT_DIR), os.environ.get("MPINPUTS", "")])
+    return env
+
+
+def run_mpost(temp_path: Path, driver_source: str) -> str:
+    """Run a driver in `temp_path`; error message, empty on success."""
+    driver = temp_path / "driver.mp"
+    driver.write_text(driver_source)
+    try:
+        result = subprocess.run(
+            ["mpost", "-interaction=nonstopmode", f"-jobname={JOBNAME}", driver.name],
+            cwd=temp_path,
+            env=mpost_env(),
+            stdin=subprocess.DEVNULL,
+            capture_output=True,
+            text=True,
+        )
+    except OSError as e:
+        return f"could not run mpost: {e}"
+
     if result.returncode != 0:
-        print(f"mpost error:\n{result.stderr}")
-        return False
-    return True
+        # mpost reports errors on stdout
+        output = (result.stdout + result.stderr).strip()
+        return f"mpost error:\n{output[-2000:]}"
+    return ""
 
 
-def copy_svgs(weight_name: str) -> int:
-    """Move generated SVGs to the weight's directory."""
+def collect(temp_path: Path, prefix: str, weight_name: str,
+            figures: dict[str, list[int]]) -> tuple[list[str], str]:
+    """
+    Move <prefix>-<n>.svg from `temp_path` to maj/<weight>/calyptapis-<n>.svg.
+    `figures` maps each input letter to its figures.  Returns (letters
+    whose SVGs were all produced, error message).
+    """
+    built = [path for path, numbers in figures.items()
+             if all((temp_path / f"{prefix}-{n}.svg").exists() for n in numbers)]
+
     dest_dir = OUTPUT_DIR / weight_name
     dest_dir.mkdir(parents=True, exist_ok=True)
+    for svg_file in temp_path.glob(f"{prefix}-*.svg"):
+        figure = svg_file.name[len(prefix) + 1:]
+        if figure[:-len(".svg")].isdigit():
+            shutil.move(svg_file, dest_dir / f"{JOBNAME}-{figure}")
 
-    count = 0
-    for svg_file in SCRIPT_DIR.glob("calyptapis-*.svg"):
-        dest_file = dest_dir / svg_file.name
-        shutil.move(svg_file, dest_file)
-        count += 1
+    error = "" if len(built) == len(figures) else \
+        f"no SVG for {', '.join(sorted(set(figures) - set(built)))}"
+    return built, error
 
-    return count
 
+def build_weight(weight_name: str, driver_source: str,
+                 figures: dict[str, list[int]]) -> tuple[str, list[str], str, float]:
+    """
+    Run one weight's driver in a scratch directory and move the SVGs to
+    maj/<weight>/.  Returns (weight, letters whose SVGs were all
+    produced, error message, seconds).
+    """
+    started = time.perf_counter()
+    with tempfile.TemporaryDirectory(prefix=f"calyptapis-{weight_name}-") as temp_dir:
+        temp_path = Path(temp_dir)
+        error = run_mpost(temp_path, driver_source)
+        if error:
+            return weight_name, [], error, time.perf_counter() - started
+        built, error = collect(temp_path, JOBNAME, weight_name, figures)
+    return weight_name, built, error, time.perf_counter() - started
 
-def main():
-    # Read original source
-    original_content = SRC_FILE.read_text()
 
+def build_single_pass(weight_names: list[str], driver_source: str,
+                      figures: dict[str, list[int]]) -> list[tuple[str, list[str], str, float]]:
+    """
+    Run a single-pass driver once and demultiplex its SVGs into each
+    weight's directory.  Results as build_weight's, one per weight; the
+    seconds are the whole run's.
+    """
+    started = time.perf_counter()
+    with tempfile.TemporaryDirectory(prefix="calyptapis-all-") as temp_dir:
+        temp_path = Path(temp_dir)
+        error = run_mpost(temp_path, driver_source)
+        if error:
+            elapsed = time.perf_counter() - started
+            return [(name, [], error, elapsed) for name in weight_names]
+        collected = [(name, *collect(temp_path, f"{JOBNAME}-{name}", name, figures))
+                     for name in weight_names]
+    elapsed = time.perf_counter() - started
+    return [(name, built, error, elapsed) for name, built, error in collected]
+
+
+def update_state(graph: BuildGraph, weight_name: str, state: dict, built: list[str]) -> dict:
+    """State after building `built`; SVGs of dropped figures are deleted."""
+    header = graph.header_hash(WEIGHTS[weight_name])
+    previous = state.get("letters", {}) if state.get("header") == header else {}
+    letters = {path: entry for path, entry in previous.items() if path in graph.letters}
+    for path in built:
+        letter = graph.letters[path]
+        letters[path] = {"hash": letter.hash, "figures": letter.figures}
+
+    # Letters removed from the source, or figures renumbered
+    current = {n for letter in graph.letters.values() for n in letter.figures}
+    for entry in state.get("letters", {}).values():
+        for n in entry.get("figures", []):
+            if n not in current:
+                (OUTPUT_DIR / weight_name / f"{JOBNAME}-{n}.svg").unlink(missing_ok=True)
+
+    return {"header": header, "letters": letters}
+
+
+def shard(graph: BuildGraph, letters: list[str], count: int) -> list[list[str]]:
+    """
+    Split `letters` into up to `count` shards of similar source size
+    (longest first onto the lightest shard), each in source order.
+    """
+    shards = [[] for _ in range(max(1, min(count, len(letters))))]
+    sizes = [0] * len(shards)
+    for path in sorted(letters, key=lambda path: len(graph.letters[path].text), reverse=True):
+        lightest = sizes.index(min(sizes))
+        shards[lightest].append(path)
+        sizes[lightest] += len(graph.letters[path].text)
+
+    order = {path: i for i, path in enumerate(graph.letters)}
+    return [sorted(paths, key=order.__getitem__) for paths in shards]
+
+
+def build(weights: Optional[list[str]] = None, jobs: Optional[int] = None, force: bool = False,
+          figures: Optional[list[int]] = None, single_pass: bool = False,
+          shards: Optional[int] = None) -> bool:
+    """
+    Build stale glyphs of `weights` (default: all).  With `figures`,
+    rebuild exactly the letters drawing those figures (False if one
+    matches no letter).  With `single_pass`, one mpost run builds the letters stale in any weight
+    for all of them.  Each run's letters are split into `shards`
+    concurrent mpost processes (default: enough to use `jobs` cores).
+    False if any weight failed.
+    """
+    started = time.perf_counter()
     try:
-        for weight_name, multiplier in WEIGHTS.items():
-            print(f"Building {weight_name} (pen_height = {multiplier} * font_size)...")
-
-            # Modify source with new pen_height
-            modified_content = modify_pen_height(original_content, multiplier)
-            SRC_FILE.write_text(modified_content)
-
-            # Run mpost
-            if not run_mpost():
-                print(f"  Failed to build {weight_name}")
-                continue
-
-            # Copy SVGs to weight directory
-            count = copy_svgs(weight_name)
-            print(f"  Copied {count} SVGs to maj/{weight_name}/")
-
-    finally:
-        # Restore original source
-        SRC_FILE.write_text(original_content)
-        print("\nRestored original calyptapis.mp")
+        graph = load_graph()
+    except OSError as e:
+        print(f"ERROR: cannot read the sources: {e}")
+        return False
+
+    if figures is not None:
+        drawn = {n for letter in graph.letters.values() for n in letter.figures}
+        unmatched = sorted(set(figures) - drawn)
+        if unmatched:
+            print(f"ERROR: no letter file draws figure(s) {', '.join(map(str, unmatched))}")
+            return False
+
+    plans = {}
+    for weight_name in WEIGHTS if weights is None else weights:
+        state = load_state(weight_name)
+        stale = stale_letters(graph, weight_name, state, force, figures)
+        if stale:
+            plans[weight_name] = (state, stale)
+            print(f"{weight_name}: {len(stale)} of {len(graph.letters)} glyphs to build")
+
+    if not plans:
+        print(f"All weights up to date ({time.perf_counter() - started:.2f}s)")
+        return True
+
+    jobs = max(1, jobs or os.cpu_count() or 1)
+    runs = 1 if single_pass else len(plans)
+    shards = max(1, shards or jobs // runs)
+
+    # Shard results of each weight, recorded once its last shard is in
+    pending = {weight_name: 0 for weight_name in plans}
+    results = {weight_name: ([], [], 0.0) for weight_name in plans}
+    failed = []
+
+    def record(weight_name: str, built: list[str], error: str, elapsed: float):
+        all_built, errors, longest = results[weight_name]
+        all_built += built
+        if error:
+            errors.append(error)
+        results[weight_name] = all_built, errors, max(longest, elapsed)
+        pending[weight_name] -= 1
+        if pending[weight_name]:
+            return
+
+        built, errors, elapsed = results[weight_name]
+        state, _ = plans[weight_name]
+        if built:
+            save_state(weight_name, update_state(graph, weight_name, state, built))
+        if errors:
+            print(f"  Failed to build {weight_name} ({elapsed:.1f}s): {'; '.join(errors)}")
+            failed.append(weight_name)
+        else:
+            print(f"  {weight_name} (pen_height = {WEIGHTS[weight_name]} * font_size): "
+                  f"{len(built)} glyphs to maj/{weight_name}/ in {elapsed:.1f}s")
+
+    tasks = []
+    if single_pass:
+        # Letters stale in any weight; rebuilding one that was current is harmless
+        letters = [path for path in graph.letters
+                   if any(path in stale for _, stale in plans.values())]
+        for paths in shard(graph, letters, shards):
+            driver = graph.single_pass_driver(list(plans), paths)
+            letter_figures = {path: graph.letters[path].figures for path in paths}
+            tasks.append((build_single_pass, list(plans), driver, letter_figures))
+            for weight_name in plans:
+                pending[weight_name] += 1
+    else:
+        for weight_name, (_, stale) in plans.items():
+            for paths in shard(graph, stale, shards):
+                driver = graph.driver(WEIGHTS[weight_name], paths)
+                letter_figures = {path: graph.letters[path].figures for path in paths}
+                tasks.append((build_weight, weight_name, driver, letter_figures))
+                pending[weight_name] += 1
+
+    jobs = min(jobs, len(tasks))
+    mode = " in one pass" if single_pass else ""
+    print(f"Building {len(plans)} weights{mode} as {len(tasks)} mpost runs, {jobs} at a time")
+
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(*task) for task in tasks]
+        for future in as_completed(futures):
+            for result in (future.result() if single_pass else [future.result()]):
+                record(*result)
+
+    print(f"\nBuilt {len(plans) - len(failed)}/{len(plans)} weights "
+          f"in {time.perf_counter() - started:.1f}s")
+    return not failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build font weights with mpost")
+    parser.add_argument("weights", nargs="*",
+                        help=f"Weights to build (default: all of {', '.join(WEIGHTS)})")
+    parser.add_argument("--jobs", type=int, default=None,
+                        help="mpost processes run at once (default: one per core)")
+    parser.add_argument("--shards", type=int, default=None,
+                        help="Split each run's letters across this many mpost processes "
+                             "(default: enough to use every job)")
+    parser.add_argument("--force", action="store_true",
+                        help="Rebuild every glyph, even if its inputs are unchanged")
+    parser.add_argument("--glyphs", type=int, nargs="+", default=None,
+                        help="Rebuild exactly these figure numbers (e.g. 1024)")
+    parser.add_argument("--single-pass", action="store_true",
+                        help="Build all weights in one mpost run instead of one run per weight")
+    args = parser.parse_args()
+
+    unknown = [name for name in args.weights if name not in WEIGHTS]
+    if unknown:
+        parser.error(f"unknown weight(s): {', '.join(unknown)}")
+
+    # No names on the command line means every weight
+    if not build(args.weights or None, args.jobs, args.force, args.glyphs, args.single_pass,
+                 args.shards):
+        sys.exit(1)
 
 
 if __name__ == "__main__":
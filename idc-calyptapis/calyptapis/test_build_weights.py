@@ -0,0 +1,26 @@
+"""Checks of build_weights' command line and build planning (no mpost needed)."""
+
+import sys
+from unittest import mock
+
+import build_weights
+
+
+def test_main_without_weights_builds_all(monkeypatch):
+    monkeypatch.setattr(sys, "argv", ["build_weights.py"])
+    with mock.patch.object(build_weights, "build", return_value=True) as build:
+        build_weights.main()
+    assert build.call_args.args[0] is None
+
+
+def test_build_none_plans_every_weight(monkeypatch):
+    planned = []
+
+    def stale_letters(graph, weight_name, state, force=False, figures=None):
+        planned.append(weight_name)
+        return []
+
+    monkeypatch.setattr(build_weights, "load_state", lambda weight_name: {})
+    monkeypatch.setattr(build_weights, "stale_letters", stale_letters)
+    assert build_weights.build(None)
+    assert planned == list(build_weights.WEIGHTS)
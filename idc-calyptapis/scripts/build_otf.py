@@ -8,13 +8,121 @@ from unicode_mapping import fig_to_unicode, unicode_to_glyph_name
 import psMat
 import re
 from pathlib import Path
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import multiprocessing
+import sys
+import tempfile
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+WEIGHTS = ['UltraLight', 'Light', 'Normal', 'SemiBold', 'Bold', 'Black']
+
+# mpost writes colors as percentages, which FontForge's SVG import rejects
+PERCENT_RGB_RE = re.compile(rb'rgb\([\d.]+%\s*,\s*[\d.]+%\s*,\s*[\d.]+%\)')
+
+
+def normalize_svg_colors(svg_data: bytes) -> bytes:
+    """Replace percentage RGB with integer RGB (all black = 0,0,0)"""
+    return PERCENT_RGB_RE.sub(b'rgb(0,0,0)', svg_data)
+
+
+class OutlineCache:
+    """
+    Cleaned outlines of imported glyphs, one JSON file per glyph.
+
+    The key hashes the SVG's bytes with everything import_svg_glyph
+    normalizes against (em, target height and bottom, sidebearing), so
+    an unchanged glyph is restored without importOutlines, removeOverlap,
+    simplify and round.  Bump VERSION when the import steps change.
+    A build of every weight prunes the entries it did not use, so
+    edited glyphs don't leave stale files behind.
+    """
+    VERSION = 1
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def key(self, svg_data: bytes, settings: dict) -> str:
+        digest = hashlib.sha256(svg_data)
+        digest.update(json.dumps({'version': self.VERSION, **settings}, sort_keys=True).encode('utf-8'))
+        return digest.hexdigest()[:24]
+
+    def restore(self, key: str, glyph) -> bool:
+        """Set the glyph's outline and width from the cache; False on a miss"""
+        try:
+            entry = json.loads((self.directory / f"{key}.json").read_text())
+        except (OSError, ValueError):
+            return False
+
+        layer = fontforge.layer()
+        for stored in entry['contours']:
+            contour = fontforge.contour()
+            contour.is_quadratic = stored['quadratic']
+            for x, y, on_curve in stored['points']:
+                contour += fontforge.point(x, y, on_curve)
+            contour.closed = stored['closed']
+            layer += contour
+        glyph.foreground = layer
+        glyph.width = entry['width']
+        return True
+
+    def prune(self, keep: set) -> int:
+        """Delete entries whose key is not in `keep`; the number deleted"""
+        removed = 0
+        for path in self.directory.glob("*.json"):
+            if path.stem not in keep:
+                path.unlink(missing_ok=True)
+                removed += 1
+        return removed
+
+    def store(self, key: str, glyph):
+        entry = {
+            'width': glyph.width,
+            'contours': [{'quadratic': contour.is_quadratic,
+                          'closed': contour.closed,
+                          'points': [[point.x, point.y, point.on_curve] for point in contour]}
+                         for contour in glyph.foreground],
+        }
+        # Weights build in parallel and share the cache; never expose a partial file
+        path = self.directory / f"{key}.json"
+        partial = path.with_name(f".{key}.{os.getpid()}.json")
+        partial.write_text(json.dumps(entry))
+        os.replace(partial, path)
+
+
+@dataclass
+class WeightResult:
+    """Outcome of building one weight, returned from its worker"""
+    weight: str
+    output_path: Optional[Path] = None
+    glyphs: int = 0
+    cached: int = 0
+    cache_keys: List[str] = field(default_factory=list)
+    empty: List[str] = field(default_factory=list)
+    failed: List[str] = field(default_factory=list)
+    error: str = ""
+    log: str = ""
+    seconds: float = 0.0
 
 class FontBuilder:
     """Build OTF fonts from SVG glyphs"""
     
-    def __init__(self, font_name: str, weight: str):
+    def __init__(self, font_name: str, weight: str, cache: Optional[OutlineCache] = None):
         self.font_name = font_name
         self.weight = weight
+        self.cache = cache
+        self.cache_hits = 0
+        self.cache_keys = []  # Entries restored or stored by this build
+        # Color-normalized copies for the importer; maj/ is never written
+        self.scratch = tempfile.TemporaryDirectory(prefix=f"calyptapis-{weight}-")
         self.font = fontforge.font()
         
         # Set font metadata
@@ -30,6 +138,10 @@ class FontBuilder:
         
         # Encoding
         self.font.encoding = 'UnicodeFull'
+
+        # Glyph names that imported empty or raised
+        self.empty_glyphs = []
+        self.failed_glyphs = []
         
     def get_target_height(self, codepoint: int) -> float:
         """Determine appropriate height target based on glyph type"""
@@ -77,30 +189,67 @@ class FontBuilder:
         
         return False
 
+    def get_target_bottom(self, codepoint: int) -> float:
+        """Vertical alignment of scaled glyphs, based on glyph type"""
+        if codepoint in [0x002E, 0x002C]:  # Period, comma - sit on baseline
+            return -50
+        if codepoint in [0x0027, 0x0022]:  # Quotes - float high
+            return 400
+        return -200  # Default - centered in ascent
+
+    def get_sidebearing(self, codepoint: int) -> int:
+        """Sidebearings - smaller for punctuation"""
+        if codepoint in [0x002E, 0x002C, 0x003A, 0x003B]:
+            return 100  # More space around punctuation
+        return 50
+
     def import_svg_glyph(self, svg_path: Path, fig_number: int):
         """Import with em-square normalization"""
         try:
             codepoint = fig_to_unicode(fig_number)
             glyph_name = unicode_to_glyph_name(codepoint)
             glyph = self.font.createChar(codepoint, glyph_name)
+
+            # TARGET: Normalize to use full em-square height
+            # Most glyphs should span from -200 (descent) to 800 (ascent) = 1000 units
+            target_height = self.font.em  # 1000
+            target_bottom = self.get_target_bottom(codepoint)
+            sidebearing = self.get_sidebearing(codepoint)
+
+            svg_data = svg_path.read_bytes()
+            cache_key = None
+            if self.cache:
+                cache_key = self.cache.key(svg_data, {
+                    'em': self.font.em, 'ascent': self.font.ascent, 'descent': self.font.descent,
+                    'target_height': target_height, 'target_bottom': target_bottom,
+                    'sidebearing': sidebearing,
+                })
+                if self.cache.restore(cache_key, glyph):
+                    self.cache_keys.append(cache_key)
+                    self.cache_hits += 1
+                    print(f"  {glyph_name}: cached")
+                    return
             
-            # Import
-            glyph.importOutlines(str(svg_path))
+            # Import (importOutlines only takes a path)
+            normalized = normalize_svg_colors(svg_data)
+            if normalized != svg_data:
+                import_path = Path(self.scratch.name) / svg_path.name
+                import_path.write_bytes(normalized)
+            else:
+                import_path = svg_path
+            glyph.importOutlines(str(import_path))
             
             # Get bounding box
             bbox = glyph.boundingBox()
             if bbox[2] == bbox[0] or bbox[3] == bbox[1]:
                 # Empty glyph
                 print(f"  WARNING: {glyph_name} is empty!")
+                self.empty_glyphs.append(glyph_name)
                 return
             
             original_width = bbox[2] - bbox[0]
             original_height = bbox[3] - bbox[1]
             
-            # TARGET: Normalize to use full em-square height
-            # Most glyphs should span from -200 (descent) to 800 (ascent) = 1000 units
-            target_height = self.font.em  # 1000
-            
             # Decide if we need to scale
             if self.should_scale_glyph(original_height, target_height):
                 scale_factor = target_height / original_height
@@ -111,14 +260,6 @@ class FontBuilder:
                 
                 scaled_bbox = glyph.boundingBox()
                 
-                # Vertical alignment based on glyph type
-                if codepoint in [0x002E, 0x002C]:  # Period, comma - sit on baseline
-                    target_bottom = -50
-                elif codepoint in [0x0027, 0x0022]:  # Quotes - float high
-                    target_bottom = 400
-                else:  # Default - centered in ascent
-                    target_bottom = -200
-                
                 current_bottom = scaled_bbox[1]
                 if abs(current_bottom - target_bottom) > 10:
                     vertical_shift = target_bottom - current_bottom
@@ -140,34 +281,18 @@ class FontBuilder:
             final_bbox = glyph.boundingBox()
             glyph_width = final_bbox[2] - final_bbox[0]
             
-            # Sidebearings - smaller for punctuation
-            if codepoint in [0x002E, 0x002C, 0x003A, 0x003B]:
-                sidebearing = 100  # More space around punctuation
-            else:
-                sidebearing = 50
-            
             glyph.left_side_bearing = sidebearing
             glyph.right_side_bearing = sidebearing
             glyph.width = int(glyph_width + 2 * sidebearing)
 
+            if cache_key:
+                self.cache.store(cache_key, glyph)
+                self.cache_keys.append(cache_key)
+
         except Exception as e:
             print(f"  ERROR importing {svg_path.name}: {e}")
-            import traceback
-            traceback.print_exc()
-
-    def clean_svg_colors(self, svg_path: Path):
-        """Fix RGB color format in-place"""
-        content = svg_path.read_text()
-        
-        # Replace percentage RGB with integer RGB (all black = 0,0,0)
-        fixed = re.sub(
-            r'rgb\([\d.]+%\s*,\s*[\d.]+%\s*,\s*[\d.]+%\)',
-            'rgb(0,0,0)',
-            content
-        )
-
-        if fixed != content:
-            svg_path.write_text(fixed)
+            traceback.print_exc(file=sys.stdout)
+            self.failed_glyphs.append(svg_path.name)
 
     def import_directory(self, svg_dir: Path):
         """Import all SVG files from a directory"""
@@ -176,11 +301,6 @@ class FontBuilder:
         # Find all SVG files
         svg_files = sorted(svg_dir.glob('calyptapis-*.svg'))
 
-        # Clean them ONCE before importing
-        print(f"Cleaning {len(svg_files)} SVG files...")
-        for svg_file in svg_files:
-            self.clean_svg_colors(svg_file)        
-
         for svg_file in svg_files:
             # Extract figure number from filename
             # calyptapis-4000.svg → 4000
@@ -190,7 +310,9 @@ class FontBuilder:
             
             self.import_svg_glyph(svg_file, fig_number)
         
-        print(f"Imported {len(svg_files)} glyphs")
+        cached = f" ({self.cache_hits} from the outline cache)" if self.cache else ""
+        print(f"Imported {len(svg_files)} glyphs{cached}")
+        return len(svg_files)
     
     def set_metadata(self, version: str = "1.0", copyright_text: str = ""):
         """Set additional font metadata"""
@@ -235,22 +357,24 @@ class FontBuilder:
     def close(self):
         """Clean up"""
         self.font.close()
+        self.scratch.cleanup()
 
 def build_weight(
     weight_name: str,
     svg_dir: Path,
     output_dir: Path,
-    font_name: str = "Calyptapis"
+    font_name: str = "Calyptapis",
+    cache_dir: Optional[Path] = None
 ):
     """Build one weight of the font"""
     print("=" * 60)
     print(f"Building {font_name} {weight_name}")
     print("=" * 60)
     
-    builder = FontBuilder(font_name, weight_name)
+    builder = FontBuilder(font_name, weight_name, OutlineCache(cache_dir) if cache_dir else None)
     
     # Import all SVG glyphs
-    builder.import_directory(svg_dir)
+    glyphs = builder.import_directory(svg_dir)
     
     # Set metadata
     builder.set_metadata(
@@ -265,55 +389,108 @@ def build_weight(
     output_path = output_dir / f"{font_name}-{weight_name}.otf"
     builder.generate_otf(output_path)
     
+    cached, empty, failed = builder.cache_hits, builder.empty_glyphs, builder.failed_glyphs
+    cache_keys = builder.cache_keys
     builder.close()
     
-    return output_path
+    return output_path, glyphs, cached, empty, failed, cache_keys
 
-def fix_svg_colors(svg_dir: Path):
-    """Fix all SVG color specs in directory"""
-    for svg_file in svg_dir.rglob("*.svg"):
-        content = svg_file.read_text()
-        
-        # Replace percentage RGB with integer RGB
-        fixed = re.sub(
-            r'rgb\((\d+\.\d+)%,\s*(\d+\.\d+)%,\s*(\d+\.\d+)%\)',
-            'rgb(0,0,0)',  # Since they're all black anyway
-            content
-        )
-        
-        if fixed != content:
-            svg_file.write_text(fixed)
-            print(f"Fixed {svg_file}")
+def build_weight_worker(weight_name: str, svg_dir: Path, output_dir: Path,
+                        font_name: str = "Calyptapis",
+                        cache_dir: Optional[Path] = None) -> WeightResult:
+    """
+    Build one weight in a worker process, with its own fontforge
+    session.  Progress output is captured into the result so weights
+    built side by side don't interleave.
+    """
+    started = time.perf_counter()
+    result = WeightResult(weight_name)
+    log = io.StringIO()
+    with contextlib.redirect_stdout(log):
+        try:
+            (result.output_path, result.glyphs, result.cached, result.empty, result.failed,
+             result.cache_keys) = \
+                build_weight(weight_name, svg_dir, output_dir, font_name, cache_dir)
+        except Exception as e:
+            result.error = f"{type(e).__name__}: {e}"
+            traceback.print_exc(file=sys.stdout)
+    result.log = log.getvalue()
+    result.seconds = time.perf_counter() - started
+    return result
 
 def main():
     """Build all weights"""
+    parser = argparse.ArgumentParser(description="Build OTF fonts from maj/<weight>/ SVGs")
+    parser.add_argument("weights", nargs="*", help=f"Weights to build (default: all of {', '.join(WEIGHTS)})")
+    parser.add_argument("--jobs", type=int, default=None,
+                        help="Weights built at once (default: one per core)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Import and clean up every glyph, ignoring the outline cache")
+    args = parser.parse_args()
+    unknown = [name for name in args.weights if name not in WEIGHTS]
+    if unknown:
+        parser.error(f"unknown weight(s): {', '.join(unknown)}")
+
     project_root = Path('calyptapis')
     maj_dir = project_root / 'maj'
     output_dir = project_root / 'fonts'
     output_dir.mkdir(exist_ok=True)
+    cache_dir = None if args.no_cache else project_root / '.outline_cache'
     
-    weights = ['UltraLight', 'Light', 'Normal', 'SemiBold', 'Bold', 'Black']
-    
-    generated_fonts = []
-    
-    for weight in weights:
-        svg_dir = maj_dir / weight
-        if svg_dir.exists():
+    weights = [weight for weight in args.weights or WEIGHTS if (maj_dir / weight).exists()]
+    if not weights:
+        print(f"No SVG directories for {', '.join(args.weights or WEIGHTS)} in {maj_dir}")
+        sys.exit(1)
+
+    jobs = max(1, min(args.jobs or os.cpu_count() or 1, len(weights)))
+    print(f"Building {len(weights)} weights, {jobs} at a time")
+
+    # Fresh interpreters: each worker gets its own fontforge state
+    context = multiprocessing.get_context("spawn")
+    results = []
+    with ProcessPoolExecutor(max_workers=jobs, mp_context=context) as pool:
+        futures = {pool.submit(build_weight_worker, weight, maj_dir / weight, output_dir,
+                               "Calyptapis", cache_dir): weight
+                   for weight in weights}
+        for future in as_completed(futures):
             try:
-                output_path = build_weight(weight, svg_dir, output_dir)
-                generated_fonts.append(output_path)
+                result = future.result()
             except Exception as e:
-                print(f"\n✗ FAILED to build {weight}: {e}")
-                import traceback
-                traceback.print_exc()
+                # The worker died (e.g. a fontforge crash or the OOM
+                # killer) before it could report
+                result = WeightResult(futures[future], error=f"worker failed: {type(e).__name__}: {e}")
+            results.append(result)
+            print(result.log, end="")
+            if result.error:
+                print(f"\n✗ FAILED to build {result.weight}: {result.error}")
     
+    results.sort(key=lambda result: weights.index(result.weight))
+    generated_fonts = [result.output_path for result in results if not result.error]
+
     print("\n" + "=" * 60)
     print("BUILD COMPLETE")
     print("=" * 60)
     print(f"Generated {len(generated_fonts)} font files:")
-    for font_path in generated_fonts:
-        print(f"  {font_path}")
-    fix_svg_colors(Path('calyptapis/maj'))
+    for result in results:
+        if result.error:
+            print(f"  ✗ {result.weight}: {result.error}")
+            continue
+        problems = ""
+        if result.empty or result.failed:
+            problems = f" ({len(result.empty)} empty, {len(result.failed)} failed: " \
+                       f"{', '.join(result.empty + result.failed)})"
+        print(f"  {result.output_path}: {result.glyphs} glyphs ({result.cached} cached) "
+              f"in {result.seconds:.1f}s{problems}")
+
+    # Only a complete build knows every entry still in use
+    if cache_dir and weights == WEIGHTS and len(generated_fonts) == len(weights):
+        keep = {key for result in results for key in result.cache_keys}
+        removed = OutlineCache(cache_dir).prune(keep)
+        if removed:
+            print(f"Pruned {removed} unused outline cache entries")
+
+    if len(generated_fonts) < len(weights):
+        sys.exit(1)
 
 if __name__ == '__main__':
     main()
\ No newline at end of file